@@ -30,9 +30,22 @@ done
 
 #archive and compress previous day's gnss data.
 #find . -maxdepth 1 -type f -mtime -1 -mmin +60 -name "*.ubx*" -exec tar -jcvf ${archive_name} --remove-files {} +;
-find . -maxdepth 1 -type f -mtime -960 -mmin +60 \( -name "*.rtcm*" -o -name "*.nov*" -o -name "*.oem*" -o -name "*.ubx*" -o -name "*.ss2*" -o -name "*.hemis*" -o -name "*.stq*" -o -name "*.javad*" -o -name "*.nvs*" -o -name "*.binex*" -o -name "*.sbf*" \) -exec zip -m9 ${archive_name} {} +;
+#archive_compression and archive_compression_by_type could be missing from an old settings.conf
+archive_compression=${archive_compression:-zip:9}
+compression_codec=${archive_compression%%:*}
+compression_level=${archive_compression#*:}
+[[ ${compression_level} == "${archive_compression}" ]] && compression_level=9
+if [[ ${compression_codec} == 'zip' ]] && [[ -z ${archive_compression_by_type} ]]
+then
+  find . -maxdepth 1 -type f -mtime -960 -mmin +60 \( -name "*.rtcm*" -o -name "*.nov*" -o -name "*.oem*" -o -name "*.ubx*" -o -name "*.ss2*" -o -name "*.hemis*" -o -name "*.stq*" -o -name "*.javad*" -o -name "*.nvs*" -o -name "*.binex*" -o -name "*.sbf*" \) -exec zip -m${compression_level} ${archive_name} {} +;
+else
+  #files already compressed with another codec are skipped
+  find . -maxdepth 1 -type f -mtime -960 -mmin +60 \( -name "*.rtcm*" -o -name "*.nov*" -o -name "*.oem*" -o -name "*.ubx*" -o -name "*.ss2*" -o -name "*.hemis*" -o -name "*.stq*" -o -name "*.javad*" -o -name "*.nvs*" -o -name "*.binex*" -o -name "*.sbf*" \) \
+    ! -name "*.gz" ! -name "*.bz2" ! -name "*.xz" ! -name "*.zst" ! -name "*.part" \
+    -exec "${BASEDIR}"/venv/bin/python "${BASEDIR}"/web_app/log_converter/log_compression.py archive --codec "${archive_compression}" --by-type "${archive_compression_by_type}" --zip-name "${archive_name}" --remove {} +;
+fi
 
 #delete gnss data older than x days.
 #find . -maxdepth 1 -type f -name "*.tar.bz2" -mtime +${archive_rotate} -delete
-find . -maxdepth 1 -type f -name "*.zip" -mtime +${archive_rotate} -delete
+find . -maxdepth 1 -type f \( -name "*.zip" -o -name "*.gz" -o -name "*.bz2" -o -name "*.xz" -o -name "*.zst" \) -mtime +${archive_rotate} -delete
 
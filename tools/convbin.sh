@@ -100,11 +100,16 @@ file_extension="${RAW_ARCHIVE##*.}"
 if [[ $file_extension == 'zip' ]]
   then
     extract_raw_file
+elif [[ $file_extension =~ ^(gz|bz2|xz|zst)$ ]]
+  then
+    #raw file compressed by archive_and_clean.sh with another codec
+    echo "- Decompressing	" "${RAW_ARCHIVE}"
+    raw_file=$("${SCRIPT_DIR}"/../venv/bin/python "${SCRIPT_DIR}"/../web_app/log_converter/log_compression.py decompress "${RAW_ARCHIVE}") || exit 1
   else 
     raw_file="${RAW_ARCHIVE}"
 fi
 ${rnx_conversion_func}
 return_code=$?
 echo -n 'rinex_file='"${RINEX_FILE}"
-[[ $file_extension == 'zip' ]] && rm "${raw_file}"
+[[ $file_extension =~ ^(zip|gz|bz2|xz|zst)$ ]] && rm "${raw_file}"
 exit $return_code
\ No newline at end of file
@@ -5,6 +5,7 @@ import tkinter.font
 import tkinter.ttk as ttk
 import webbrowser
 import threading
+import queue
 import scan_network
 import tkinter as tk
 from tkinter import ttk
@@ -28,7 +29,10 @@ class MyApp:
         default_font = tkinter.font.nametofont("TkDefaultFont")
         default_font.configure(size=12)
         self._create_gui()
-        self.available_base = None
+        self.available_base = []
+        #rows displayed for each station {(ip, port) : (label, button)}
+        self.base_rows = {}
+        self.scan_queue = queue.Queue()
         if os.name == 'nt':
             log.debug('"False" scan to pop up the windows firewall window')
             scan_network.zeroconf_scan('RTKBase Web Server', '_http._tcp.local.', timeout=0)
@@ -75,15 +79,13 @@ class MyApp:
     def scan_network(self):
         
         #Cleaning GUI
-        try:
-            self.intro_label.grid_remove()
-            self.error_label.grid_remove()
-            for label in self.base_labels_list:
-                label.destroy()
-            for button in self.base_buttons_list:
-                button.destroy()
-        except AttributeError:
-            pass
+        self.intro_label.grid_remove()
+        self.error_label.grid_remove()
+        for label, button in self.base_rows.values():
+            label.destroy()
+            button.destroy()
+        self.base_rows = {}
+        self.available_base = []
         self.nobase_label.grid_remove()
         self.scanButton.config(state=tk.DISABLED)
         self.scanninglabel.grid()
@@ -91,51 +93,75 @@ class MyApp:
         self.progress_bar.start()
 
         #Launch scan
-        thread = threading.Thread(target=self._scan_thread)
+        thread = threading.Thread(target=self._scan_thread, daemon=True)
         thread.start()
+        self.master.after(100, self._poll_scan_queue)
         
     def _scan_thread(self):
+        """ Scan the network, the stations are sent to the gui with the scan queue as soon as they are found """
         log.debug(f"Start Scanning (ports {self.ports})")
         try:
-            self.available_base = scan_network.main(self.ports, self.allscan)
-        #self.available_base = [{'ip': '192.168.1.23', 'port' : 80, 'fqdn' : 'rtkbase.home'},
-        #                   {'ip': '192.168.1.124', 'port' : 80, 'fqdn' : 'localhost'},
-        #                   {'ip': '192.168.1.199', 'port' : 443, 'fqdn' : 'basegnss'} ]
-        #self.available_base = [{'ip': '192.168.1.123', 'port' : 80, 'fqdn' : 'localhost'},]
+            scan_network.main(self.ports, self.allscan, callback=self.scan_queue.put,
+                              known_bases=scan_network.load_known_bases())
         except Exception as e:
             log.debug(f"Error during network scan: {e}")
-            self.progress_bar.stop()
-            self.progress_bar.grid_remove()
-            self.scanninglabel.grid_remove()
-            self.error_label.grid()
-            self.scanButton.config(state=tk.NORMAL)
+            self.scan_queue.put(e)
             return
-            
         log.debug("Scan terminated")
-        self._after_scan_thread()
+        self.scan_queue.put(None)
+
+    def _poll_scan_queue(self):
+        """ Display the stations found by the scan thread (Tk widgets must be used from the main thread) """
+        while True:
+            try:
+                item = self.scan_queue.get_nowait()
+            except queue.Empty:
+                self.master.after(100, self._poll_scan_queue)
+                return
+            if item is None or isinstance(item, Exception):
+                self._after_scan(error=item is not None)
+                return
+            self._add_base(item)
+
+    def _add_base(self, base):
+        """ Add a station row, or update it if the station is already displayed """
+        key = (base.get('ip'), base.get('port'))
+        previous = next((known for known in self.available_base if (known.get('ip'), known.get('port')) == key), None)
+        if previous is not None:
+            #keep the mDns server name found previously
+            base['server'] = base.get('server') or previous.get('server')
+            self.available_base.remove(previous)
+        self.available_base.append(base)
+        log.debug(f"base found: {base}")
+        def browser_fqdn(event, ip = (base.get('server') or base.get('ip')), port = base.get('port')):
+            self.launch_browser(ip, port)
+        def browser_ip(event, ip = (base.get('ip')), port = base.get('port')):
+            self.launch_browser(ip, port)
 
-    def _after_scan_thread(self):
+        if key in self.base_rows:
+            label, button = self.base_rows[key]
+            label.config(text=f"{base.get('server') or base.get('fqdn')} ({base.get('ip')})")
+        else:
+            row = len(self.base_rows) + 1
+            label = ttk.Label(self.top_frame, text=f"{base.get('server') or base.get('fqdn')} ({base.get('ip')})")
+            label.grid(column=0, row=row)
+            button = ttk.Button(self.top_frame, text='Open')
+            button.grid(column=3, row=row)
+            self.base_rows[key] = (label, button)
+        button.bind("<Button-1>", browser_fqdn)
+        button.bind("<Shift-Button-1>", browser_ip)
+
+    def _after_scan(self, error=False):
         log.debug(f"available_base: {self.available_base}")
         self.scanninglabel.grid_remove()
         self.progress_bar.stop()
         self.progress_bar.grid_remove()
-        self.base_labels_list = ["base" + str(i) + "Label" for i, j in enumerate(self.available_base)]
-        self.base_buttons_list = ["base" + str(i) + "Button" for i, j in enumerate(self.available_base)]
-        if len(self.available_base)>0:
-            for i, base in enumerate(self.available_base):
-                def browser_fqdn(event, ip = (base.get('server') or base.get('ip')), port = base.get('port')):
-                    self.launch_browser(ip, port)
-                def browser_ip(event, ip = (base.get('ip')), port = base.get('port')):
-                    self.launch_browser(ip, port)
-
-                self.base_labels_list[i] = ttk.Label(self.top_frame, text=f"{base.get('server') or base.get('fqdn')} ({base.get('ip')})")
-                self.base_labels_list[i].grid(column=0, row=i)
-                self.base_buttons_list[i] = ttk.Button(self.top_frame, text='Open')
-                self.base_buttons_list[i].bind("<Button-1>", browser_fqdn)
-                self.base_buttons_list[i].bind("<Shift-Button-1>", browser_ip)
-                self.base_buttons_list[i].grid(column=3, row=i)
-        else:
+        if error:
+            self.error_label.grid()
+        elif len(self.available_base) == 0:
             self.nobase_label.grid()
+        else:
+            scan_network.save_known_bases(self.available_base)
         self.scanButton.config(state=tk.NORMAL)
 
     def launch_browser(self, ip, port):
@@ -1,8 +1,11 @@
 #! /usr/bin/env python3
+import os
 import time
+import json
+import asyncio
+import ipaddress
 import logging
 import argparse
-import requests
 import scapy.all as scapy
 scapy.load_layer("http")
 from zeroconf import Zeroconf
@@ -11,14 +14,19 @@ logging.basicConfig(format='%(levelname)s: %(message)s')
 log = logging.getLogger(__name__)
 log.setLevel('ERROR')
 
+KNOWN_BASES_FILE = os.path.join(os.path.expanduser("~"), ".find_rtkbase.json")
+
 class MyZeroConfListener:
-    def __init__(self):
+    def __init__(self, callback=None):
         self.services = []
+        self.callback = callback
 
     def add_service(self, zeroconf, type, name):
         info = zeroconf.get_service_info(type, name)
         log.debug(f"Service found: {name}")
         self.services.append(info)
+        if self.callback is not None and info is not None:
+            self.callback(info)
     
     def update_service(self, *args, **kwargs):
         pass
@@ -32,17 +40,21 @@ def zeroconf_scan(name, prot_type, timeout=5):
     time.sleep(timeout)
     for service in listener.services:
         if name.lower() in service.name.lower():
-            service_list.append({'NAME' : service.name,
-                                'PORTS' : [service.port],
-                                'SERVER' : service.server.rstrip('.'),
-                                'IP' : '.'.join(str(byte) for byte in service.addresses[0])})
+            service_list.append(service_to_host(service))
     log.debug(f"filtered list for {name}")
     log.debug(service_list)
     return service_list
 
 
 
-def arp_scan(ip, interface=conf.iface):
+def service_to_host(service):
+    """ Convert a zeroconf ServiceInfo to a host dict """
+    return {'NAME' : service.name,
+            'PORTS' : [service.port],
+            'SERVER' : service.server.rstrip('.'),
+            'IP' : '.'.join(str(byte) for byte in service.addresses[0])}
+
+def arp_scan(ip, interface=scapy.conf.iface):
     arp_request = scapy.ARP(pdst=ip)
     broadcast = scapy.Ether(dst="ff:ff:ff:ff:ff:ff")
     arp_request_broadcast = broadcast / arp_request
@@ -72,65 +84,195 @@ def ping_scan(ip):
     else:
          print("Timeout waiting for %s" % packet[IP].dst)
 
-def tcp_scan(ip, ports):
+class AdaptiveTimeout:
     """
-    Performs a TCP scan by sending SYN packets to <ports>.
-    Args:
-        ip (str): An IP address or hostname to target.
-        ports (list or tuple of int): A list or tuple of ports to scan.
-    Returns:
-        A list of ports that are open.
+        Timeout computed from the response time of the previous hosts:
+        the dead hosts are abandoned quickly on a local network, but a slow network still works.
     """
+    def __init__(self, initial=1.5, minimum=0.3, maximum=5.0, factor=4):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.rtt = None
+
+    def get(self):
+        if self.rtt is None:
+            return self.initial
+        return min(max(self.rtt * self.factor, self.minimum), self.maximum)
+
+    def update(self, elapsed):
+        self.rtt = elapsed if self.rtt is None else 0.8 * self.rtt + 0.2 * elapsed
 
+async def async_get_infos(address, port, timeout, limiter):
+    """
+        Request /api/v1/infos with a raw http/1.0 request (no thread needed)
+        :param address: the host name or ip address
+        :param port: the web server port
+        :param timeout: an AdaptiveTimeout
+        :param limiter: an asyncio.Semaphore limiting the simultaneous connections
+        :return the json answer or None
+    """
+    async with limiter:
+        start = time.monotonic()
+        delay = timeout.get()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(address, port), delay)
+        except (OSError, asyncio.TimeoutError) as e:
+            log.debug(f"{address}:{port} - {e!r}")
+            return None
+        try:
+            writer.write(f"GET /api/v1/infos HTTP/1.0\r\nHost: {address}:{port}\r\nAccept: application/json\r\nConnection: close\r\n\r\n".encode())
+            await writer.drain()
+            data = b""
+            while len(data) < 65536:
+                chunk = await asyncio.wait_for(reader.read(4096), delay)
+                if not chunk:
+                    break
+                data += chunk
+            timeout.update(time.monotonic() - start)
+        except (OSError, asyncio.TimeoutError) as e:
+            log.debug(f"{address}:{port} - {e!r}")
+            return None
+        finally:
+            writer.close()
+    header, _, body = data.partition(b"\r\n\r\n")
+    if not header.startswith(b"HTTP/") or header.split(b" ", 2)[1:2] != [b"200"]:
+        return None
     try:
+        return json.loads(body)
+    except ValueError:
+        return None
 
-        syn = scapy.IP(dst=ip) / scapy.TCP(dport=ports, flags="S")
-    except scapy.socket.gaierror:
-        raise ValueError('Hostname {} could not be resolved.'.format(ip))
+def get_scan_interfaces():
+    """ The network interfaces with a usable ipv4 address {name : ip} """
+    return {value.name : scapy.get_if_addr(value.name) for value in scapy.get_working_ifaces() if not
+                (scapy.get_if_addr(value.name).startswith('0.0') or
+                scapy.get_if_addr(value.name).startswith('169.254') or
+                scapy.get_if_addr(value.name).startswith('127.0.0.1')
+                )}
 
+def load_known_bases(path=KNOWN_BASES_FILE):
+    """ Read the stations found during the previous scans """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log.debug(f"Can't read known bases: {e}")
+        return []
 
-    ans, unans = scapy.sr(syn, timeout=2, retry=1, verbose=False)
-    result = []
-    
-    for sent, received in ans:
-        if received[scapy.TCP].flags == "SA":
-            result.append(received[scapy.TCP].sport)
+def save_known_bases(bases, path=KNOWN_BASES_FILE):
+    """ Store the stations found, they will be checked first during the next scan """
+    try:
+        with open(path, "w") as f:
+            json.dump(bases, f, indent=1)
+    except OSError as e:
+        log.debug(f"Can't write known bases: {e}")
+
+async def discover(ports, allscan=False, iprange=None, mdns_timeout=5, max_connections=64, known_bases=()):
+    """
+        Find the RTKBase stations on the network. mDns, arp scans and the api requests run
+        concurrently, and the stations are sent as soon as they answer.
+        Without mDns answer (or with allscan), the hosts found with an arp scan are checked,
+        or all the subnet addresses if the arp scan isn't allowed.
+        :param ports: the web server ports to check
+        :param allscan: always scan the ip ranges
+        :param iprange: an additional ip range to scan (ie 192.168.1.0/24)
+        :param mdns_timeout: how long the mDns services are listened
+        :param max_connections: the maximum of simultaneous connections
+        :param known_bases: the stations found previously, checked before anything else
+        :return an async generator of rtkbase dicts (ip, port, app_version, fqdn, server)
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    limiter = asyncio.Semaphore(max_connections)
+    timeout = AdaptiveTimeout()
+    checked = set()
+    tasks = set()
+    found = []
 
-    return result
+    async def check_host(host):
+        for port in host.get('PORTS'):
+            ans = None
+            if (host.get('IP'), port) in checked and not host.get('SERVER'):
+                continue
+            checked.add((host.get('IP'), port))
+            #try with mDns server name at first, then with the ip address if it fails
+            for address in (host.get('SERVER'), host.get('IP')):
+                if address is None:
+                    continue
+                ans = await async_get_infos(address, port, timeout, limiter)
+                if ans:
+                    break
+            if ans and ans.get('app') == 'RTKBase':
+                base = {'ip' : host.get('IP'),
+                        'port' : port,
+                        'app_version' : ans.get('app_version'),
+                        'fqdn' : ans.get('fqdn'),
+                        'server' : host.get('SERVER')}
+                found.append(base)
+                await queue.put(base)
 
-def get_rtkbase_infos(host_list):
-    available_rtkbase = []
-    for result in host_list:
-        if result.get('PORTS') and len(result.get('PORTS')) > 0:
+    def add_check(host):
+        task = loop.create_task(check_host(host))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    def add_service(service):
+        if 'rtkbase web server' in service.name.lower():
+            loop.call_soon_threadsafe(add_check, service_to_host(service))
+
+    async def mdns_scan():
+        zeroconf = Zeroconf()
+        try:
+            ServiceBrowser(zeroconf, '_http._tcp.local.', MyZeroConfListener(add_service))
+            await asyncio.sleep(mdns_timeout)
+        finally:
+            await loop.run_in_executor(None, zeroconf.close)
+
+    async def ip_scan(network, interface):
+        try:
+            hosts = await loop.run_in_executor(None, arp_scan, str(network), interface)
+        except Exception as e:
+            log.debug(f"arp scan error on {network}: {e}")
+            hosts = []
+        if not hosts:
+            # arp scan needs admin rights, else try all the addresses
+            hosts = [{'IP' : str(ip)} for ip in network.hosts()]
+        for host in hosts:
+            add_check({'IP' : host['IP'], 'PORTS' : ports})
+
+    async def scan():
+        for base in known_bases:
+            add_check({'IP' : base.get('ip'), 'PORTS' : [base.get('port')]})
+        mdns_task = loop.create_task(mdns_scan())
+        networks = []
+        if iprange:
+            networks.append((ipaddress.ip_network(iprange, strict=False), scapy.conf.iface))
+        for iface, ip in get_scan_interfaces().items():
+            networks.append((ipaddress.ip_network(ip + '/24', strict=False), iface))
+        if not allscan:
+            # the ip scan is only needed when mDns doesn't find anything
+            await mdns_task
+            while tasks:
+                await asyncio.wait(set(tasks))
+            if found:
+                return
+        await asyncio.gather(mdns_task, *[ip_scan(network, iface) for network, iface in networks])
+
+    scan_task = loop.create_task(scan())
+    try:
+        while not (scan_task.done() and not tasks and queue.empty()):
             try:
-                for port in result.get('PORTS'):
-                    #try with mDns server name at first, then with the ip address if it fails
-                    for address in (result.get('SERVER'), result.get('IP')):
-                        try:
-                            ans = None
-                            if address is None:
-                                continue
-                            log.debug(f"{address}:{port} Api request")
-                            res = requests.get(f"http://{address}:{port}/api/v1/infos", timeout=10)
-                            log.debug(f"{address}:{port} Api response: {res}")
-                            ans = res.json() if res is not None and res.status_code == 200 else None
-                            if ans:
-                                break
-                        except (TimeoutError, TypeError, requests.exceptions.ConnectionError) as e:
-                            log.debug(f"{address}:{port} - {e}")
-
-                    if ans and ans.get('app') == 'RTKBase':
-                        available_rtkbase.append({'ip' : result.get('IP'),
-                                                 'port' : port,
-                                                 'app_version' : ans.get('app_version'),
-                                                 'fqdn' : ans.get('fqdn'),
-                                                 'server' : result.get('SERVER')})
-            except (AttributeError, ValueError) as e:
-                log.debug(e)
-                pass
-            #except Exception as e:
-            #    print(result.get('IP'), result.get('PORTS'), e)
-    return available_rtkbase
+                base = await asyncio.wait_for(queue.get(), 0.2)
+            except asyncio.TimeoutError:
+                continue
+            yield base
+        scan_task.result()
+    finally:
+        scan_task.cancel()
+        for task in list(tasks):
+            task.cancel()
 
 def display_results(results):
     print("IP Address\t\tMAC Address\t\tOPEN PORT(S)")
@@ -175,31 +317,23 @@ def arg_parse():
     return arguments
 
 
-def main(ports, allscan=False, iprange=None):
+async def collect(ports, allscan=False, iprange=None, callback=None, known_bases=()):
+    """ Run discover() and return the list of stations, callback is called with each new station """
+    available_rtkbase = []
+    async for base in discover(ports, allscan, iprange, known_bases=known_bases):
+        log.debug(f"RTKBase found: {base}")
+        available_rtkbase.append(base)
+        if callback is not None:
+            callback(base)
+    return available_rtkbase
 
-    #interfaces = scapy.get_working_ifaces()
-    scan_results = []
-    scan_results.extend(zeroconf_scan('RTKBase Web Server', '_http._tcp.local.'))
-    arp_results=[]
-    if allscan or len(scan_results) == 0:
-        log.debug("No result with zeroconf (or --allscan). Trying with ip range")
-        if iprange:
-            #log.debug(f"{conf.iface} : {iprange}")
-            arp_results.extend(arp_scan(iprange, conf.iface))
-        interfaces = {value.name : scapy.get_if_addr(value.name) for value in scapy.get_working_ifaces() if not 
-                            (scapy.get_if_addr(value.name).startswith('0.0') or 
-                            scapy.get_if_addr(value.name).startswith('169.254') or
-                            scapy.get_if_addr(value.name).startswith('127.0.0.1')
-                            )}        
-        for iface, ip in interfaces.items():
-            #log.debug(f"{iface} : {ip}/24")
-            arp_results.extend(arp_scan(ip + '/24', iface))
-        for result in arp_results:
-            result['PORTS']=tcp_scan(result['IP'], ports)
-    scan_results.extend(arp_results)
-    log.debug("Potential available addresses:")
-    log.debug(scan_results)
-    available_rtkbase = get_rtkbase_infos(scan_results)
+def main(ports, allscan=False, iprange=None, callback=None, known_bases=()):
+    """
+        Scan the network and return the RTKBase stations list
+        :param callback: a function called with each station as soon as it is found
+        :param known_bases: the stations found previously, checked first
+    """
+    available_rtkbase = asyncio.run(collect(ports, allscan, iprange, callback, known_bases))
     #remove duplicate
     available_rtkbase = remove_duplicate_hosts(available_rtkbase)
     log.debug("RTKBase station found: ")
@@ -211,4 +345,4 @@ if __name__ == "__main__":
     if args.debug:
         log.setLevel('DEBUG')
         log.debug(f"Arguments: {args}")
-    print(main(args.ports, args.allscan, args.iprange))
\ No newline at end of file
+    print(main(args.ports, args.allscan, args.iprange, callback=print if args.debug else None))
\ No newline at end of file
@@ -167,8 +167,7 @@ class aiogps(gps):  # pylint: disable=R0902
              if self.connection_args['port'] else ''))
         self.reader, self.writer = await asyncio.wait_for(
             asyncio.open_connection(**self.connection_args),
-            self.connection_timeout,
-            loop=self.loop)
+            self.connection_timeout)
         # Set socket options
         sock = self.writer.get_extra_info('socket')
         if sock is not None:
@@ -215,9 +214,7 @@ class aiogps(gps):  # pylint: disable=R0902
             try:
                 rx_timeout = self.alive_opts.get('rx_timeout', None)
                 reader = self.reader.readuntil(separator=b'\n')
-                self.bresponse = await asyncio.wait_for(reader,
-                                                        rx_timeout,
-                                                        loop=self.loop)
+                self.bresponse = await asyncio.wait_for(reader, rx_timeout)
                 self.response = polystr(self.bresponse)
                 if self.response.startswith(
                         "{") and self.response.endswith("}\r\n"):
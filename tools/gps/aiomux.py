@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This code run compatibly under Python 3.x for x >= 6.
+# Codacy D203 and D211 conflict, I choose D203
+# Codacy D212 and D213 conflict, I choose D212
+
+"""aiomux.py -- Asyncio fan-in of several GPSD connections.
+
+One process watches several gpsd instances (ie: a heading receiver and a
+backup receiver), with:
+    - one aiogps client by source, each with its own reconnection logic;
+    - a bounded queue by source, a slow consumer either blocks the reading
+        of the source (backpressure) or drops the oldest messages;
+    - a merged async iterator, the messages are returned in the order they
+        were received (shared monotonic clock);
+    - health and latency statistics by source.
+
+Example:
+    import gps.aiomux
+
+    sources = {
+        'um982': {'connection_args': {'host': '127.0.0.1', 'port': 2947}},
+        'f9p': {'connection_args': {'host': '127.0.0.1', 'port': 2948}},
+    }
+    async with gps.aiomux.aiomux(sources, classes=('TPV', 'SKY')) as mux:
+        async for msg in mux:
+            print(msg.source, msg.data['class'], msg.latency)
+            print(mux.stats())
+"""
+
+__all__ = ['aiomux', 'muxmessage', ]
+
+import asyncio
+import collections
+import logging
+import time
+from typing import Dict, Iterable, Optional, Union
+
+from .aiogps import aiogps
+from .client import dictwrapper
+from .misc import isotime
+
+muxmessage = collections.namedtuple(
+    'muxmessage', ['source', 'received', 'data', 'latency'])
+muxmessage.__doc__ = """A message from one of the sources.
+    source: the source name;
+    received: the reception time (event loop monotonic clock);
+    data: the gpsd message (dictwrapper);
+    latency: for the messages with a time field, reception wall clock minus
+        message time (seconds), else None.
+"""
+
+
+class muxsource(object):
+    """A gpsd source: its client, queue and statistics."""
+
+    def __init__(self, name: str, client: aiogps, queue_size: int) -> None:
+        """Init muxsource."""
+        self.name = name
+        self.client = client
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+        self.messages = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_received: Optional[float] = None
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_max: Optional[float] = None
+
+    def add_latency(self, latency: float) -> None:
+        """Record the latency of a message."""
+        self.latency_count += 1
+        self.latency_sum += latency
+        if self.latency_max is None or latency > self.latency_max:
+            self.latency_max = latency
+
+    def stats(self, now: float) -> dict:
+        """Return the health and latency statistics."""
+        return {
+            'connected': self.client.writer is not None,
+            'messages': self.messages,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'queued': self.queue.qsize(),
+            'age': (now - self.last_received
+                    if self.last_received is not None else None),
+            'latency_avg': (self.latency_sum / self.latency_count
+                            if self.latency_count else None),
+            'latency_max': self.latency_max,
+        }
+
+
+class aiomux(object):
+    """Merge the messages of several aiogps clients.
+
+    The class uses the 'gps.aiomux' logger, with a NullHandler like aiogps.
+"""
+
+    def __init__(self,
+                 sources: Dict[str, Union[aiogps, dict]],
+                 classes: Optional[Iterable[str]] = ('TPV', 'SKY'),
+                 queue_size: int = 64,
+                 overflow: str = 'block') -> None:
+        """Arguments:
+            sources: the gpsd sources by name. A value is an aiogps client,
+                or a dict of aiogps arguments (connection_args, reconnect...).
+            classes: keep only these message classes (None to keep all the
+                messages, including the non json lines).
+            queue_size: the maximum number of messages waiting by source.
+            overflow: what to do when a source queue is full:
+                - 'block': stop reading the source until the queue has room
+                    (the backpressure reaches gpsd through TCP);
+                - 'drop_oldest': drop the oldest message of the queue.
+"""
+        assert overflow in ('block', 'drop_oldest')
+        self.classes = set(classes) if classes is not None else None
+        self.overflow = overflow
+        self.logger = logging.getLogger(__name__)
+        self.logger.addHandler(logging.NullHandler())
+        self.sources = {}
+        for name, client in sources.items():
+            if isinstance(client, dict):
+                client = aiogps(**client)
+            self.sources[name] = muxsource(name, client, queue_size)
+        # set when a message is queued, the merged iterator waits for it
+        self.ready = asyncio.Event()
+
+    def _accept(self, data: Union[dictwrapper, str]) -> bool:
+        """Check the message class."""
+        if self.classes is None:
+            return True
+        return isinstance(data, dictwrapper) and \
+            data.get('class') in self.classes
+
+    async def _read_source(self, source: muxsource) -> None:
+        """Read a source and fill its queue."""
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                data = await source.client.read()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:    # pylint: disable=W0703
+                # aiogps raises only without reconnection
+                source.errors += 1
+                self.logger.error(f'{source.name}: {exc}')
+                source.client.close()
+                await asyncio.sleep(2)
+                continue
+            if not self._accept(data):
+                continue
+            received = loop.time()
+            latency = None
+            if isinstance(data, dictwrapper) and \
+                    isinstance(data.get('time'), str):
+                try:
+                    latency = time.time() - isotime(data['time'])
+                    source.add_latency(latency)
+                except ValueError:
+                    pass
+            message = muxmessage(source.name, received, data, latency)
+            if source.queue.full() and self.overflow == 'drop_oldest':
+                source.queue.get_nowait()
+                source.dropped += 1
+            await source.queue.put(message)
+            source.messages += 1
+            source.last_received = received
+            self.ready.set()
+
+    def start(self) -> None:
+        """Start reading all the sources."""
+        for source in self.sources.values():
+            if source.task is None:
+                source.task = asyncio.ensure_future(self._read_source(source))
+
+    def close(self) -> None:
+        """Stop reading and close all the connections."""
+        for source in self.sources.values():
+            if source.task is not None:
+                source.task.cancel()
+                source.task = None
+            source.client.close()
+
+    def get_nowait(self) -> Optional[muxmessage]:
+        """Return the oldest queued message of all the sources, or None."""
+        oldest = None
+        for source in self.sources.values():
+            # asyncio.Queue has no peek, its deque is read directly
+            if source.queue.qsize() and (
+                    oldest is None or
+                    source.queue._queue[0].received <    # pylint: disable=W0212
+                    oldest.queue._queue[0].received):    # pylint: disable=W0212
+                oldest = source
+        if oldest is None:
+            return None
+        return oldest.queue.get_nowait()
+
+    async def get(self) -> muxmessage:
+        """Wait for the next message of any source."""
+        while True:
+            message = self.get_nowait()
+            if message is not None:
+                return message
+            self.ready.clear()
+            await self.ready.wait()
+
+    def stats(self) -> Dict[str, dict]:
+        """Return the statistics by source."""
+        now = asyncio.get_event_loop().time()
+        return {name: source.stats(now)
+                for name, source in self.sources.items()}
+
+    async def __aenter__(self) -> 'aiomux':
+        """Context manager entry: start reading the sources."""
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        """Context manager exit: close the connections."""
+        self.close()
+
+    def __aiter__(self) -> 'aiomux':
+        """Async iterator interface."""
+        self.start()
+        return self
+
+    async def __anext__(self) -> muxmessage:
+        """Return the next merged message."""
+        return await self.get()
+
+# vim: set expandtab shiftwidth=4
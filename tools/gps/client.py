@@ -22,6 +22,10 @@ from .misc import polystr, polybytes
 from .watch_options import *
 
 GPSD_PORT = "2947"
+# initial size of the read buffer, RTCM3 JSON can be over 4.4k long
+READ_BUFFER_SIZE = 65536
+# size of each socket/file read
+READ_CHUNK_SIZE = 8192
 
 
 class gpscommon(object):
@@ -41,7 +45,13 @@ class gpscommon(object):
         self.device = device
         self.input_file_name = input_file_name
         self.input_fd = None
-        self.linebuffer = b''
+        # Read buffer: the data is received into the free space after
+        # buf_end, the pending data is buf[buf_start:buf_end].  The bytes
+        # before buf_end are never modified, so the line views stay valid.
+        self.buf = bytearray(READ_BUFFER_SIZE)
+        self.buf_start = 0
+        self.buf_end = 0
+        self.line = memoryview(b'')
         self.received = time.time()
         self.reconnect = should_reconnect
         self.sock = None        # in case we blow up in connect
@@ -49,7 +59,6 @@ class gpscommon(object):
         self.verbose = verbose
         # Provide the response in both 'str' and 'bytes' form
         self.bresponse = b''
-        self.response = polystr(self.bresponse)
 
         if gps.VERB_PROG <= verbose:
             print('gpscommon(device=%s host=%s port=%s\n'
@@ -115,9 +124,64 @@ class gpscommon(object):
         """Close the gpsd socket."""
         self.close()
 
+    # The response is provided as a memoryview of the read buffer (line),
+    # and in 'bytes' (bresponse) and 'str' (response) form.  The copy and
+    # the decoding are only done when they are used.
+
+    @property
+    def bresponse(self):
+        """Return the last line as bytes."""
+        if self._bresponse is None:
+            self._bresponse = self.line.tobytes()
+        return self._bresponse
+
+    @bresponse.setter
+    def bresponse(self, value):
+        """Set the response, as bytes."""
+        self._bresponse = value
+        self._response = None
+
+    @property
+    def response(self):
+        """Return the last line as str."""
+        if self._response is None:
+            self._response = polystr(self.bresponse)
+        return self._response
+
+    @response.setter
+    def response(self, value):
+        """Set the response, as str."""
+        self._response = value
+
+    @property
+    def linebuffer(self):
+        """Return the data received but not read yet."""
+        return bytes(self.buf[self.buf_start:self.buf_end])
+
+    def _fill(self):
+        """Read more data into the buffer, return the byte count."""
+        if self.buf_end == len(self.buf):
+            # No free space: move the pending data to a new buffer (the
+            # old one is kept by the line views still in use).
+            pending = self.buf_end - self.buf_start
+            newbuf = bytearray(max(READ_BUFFER_SIZE, 2 * pending))
+            newbuf[:pending] = self.buf[self.buf_start:self.buf_end]
+            self.buf = newbuf
+            self.buf_start = 0
+            self.buf_end = pending
+        free = memoryview(self.buf)[self.buf_end:self.buf_end +
+                                    READ_CHUNK_SIZE]
+        if self.input_fd:
+            count = self.input_fd.readinto(free)
+        else:
+            count = self.sock.recv_into(free)
+        count = count or 0
+        self.buf_end += count
+        return count
+
     def waiting(self, timeout=0):
         """Return True if data is ready for the client."""
-        if self.linebuffer or self.input_fd:
+        if self.buf_end > self.buf_start or self.input_fd:
             # check for input_fd EOF?
             return True
         if self.sock is None:
@@ -136,23 +200,20 @@ class gpscommon(object):
                 return -1
             self.stream()
 
-        eol = self.linebuffer.find(b'\n')
+        eol = self.buf.find(b'\n', self.buf_start, self.buf_end)
         if eol == -1:
-            # RTCM3 JSON can be over 4.4k long, so go big
-            if self.input_fd:
-                frag = self.input_fd.read(8192)
-            else:
-                frag = self.sock.recv(8192)
-
-            self.linebuffer += frag
-            if not self.linebuffer:
+            # only search the new data for the end of line
+            search_start = self.buf_end - self.buf_start
+            self._fill()
+            if self.buf_end == self.buf_start:
                 if self.verbose > 1:
                     sys.stderr.write(
                         "poll: no available data: returning -1.\n")
                 # Read failed
                 return -1
 
-            eol = self.linebuffer.find(b'\n')
+            search_start += self.buf_start
+            eol = self.buf.find(b'\n', search_start, self.buf_end)
             if eol == -1:
                 if self.verbose > 1:
                     sys.stderr.write("poll: partial message: returning 0.\n")
@@ -166,19 +227,21 @@ class gpscommon(object):
 
         # We got a line
         eol += 1
-        # Provide the response in both 'str' and 'bytes' form
-        self.bresponse = self.linebuffer[:eol]
-        self.response = polystr(self.bresponse)
-        self.linebuffer = self.linebuffer[eol:]
+        # Provide the response as a view, 'bytes' and 'str' are lazy
+        self.line = memoryview(self.buf)[self.buf_start:eol]
+        self.bresponse = None
+        self.buf_start = eol
+        if self.buf_start == self.buf_end and \
+           self.buf_end > len(self.buf) - READ_CHUNK_SIZE:
+            # everything is read, restart at the beginning of a new buffer
+            self.buf = bytearray(READ_BUFFER_SIZE)
+            self.buf_start = self.buf_end = 0
 
-        # Can happen if daemon terminates while we're reading.
-        if not self.response:
-            return -1
         if 1 < self.verbose:
             sys.stderr.write("poll: data is %s\n" % repr(self.response))
         self.received = time.time()
         # We got a \n-terminated line
-        return len(self.response)
+        return len(self.line)
 
     # Note that the 'data' method is sometimes shadowed by a name
     # collision, rendering it unusable.  The documentation recommends
@@ -73,6 +73,17 @@ otherwise it will terminate immediately.
 To allow for adding and removing clients while the test is running,
 run in threaded mode by calling the start() method.  This simply calls
 the run method in a subthread, with locking of critical regions.
+
+For time-compressed tests (ie: a 24h log in a few minutes), a Replay
+object feeds a whole test load to one fake GPS, at N times the speed of
+the log or unthrottled.  The packets are grouped by epoch (NMEA time
+fields), each epoch is written with one writev() call (or in large chunks
+when unthrottled), the NMEA times and dates can be rewritten to a virtual
+clock, and the measured throughput is reported:
+
+    fakegps = FakePTY(TestLoad("day.nmea"), speed=115200)
+    replay = Replay(fakegps, speed=0, virtual_start=time.time(), cycles=24)
+    stats = replay.run()
 """
 # This code runs compatibly under Python 2 and 3.x for x >= 2.
 # Preserve this property!
@@ -175,12 +186,8 @@ class TestLoad(object):
         # gps.packet.register_report(reporter)
         type_latch = None
         commentlen = 0
-        while True:
-            # Note that packet data is bytes rather than str
-            (plen, ptype, packet, _counter) = getter.get(logfp.fileno())
-            if plen <= 0:
-                break
-
+        # Note that packet data is bytes rather than str
+        for (ptype, packet, _counter) in getter.iter_packets(logfp.fileno()):
             if ptype == sniffer.COMMENT_PACKET:
                 commentlen += len(packet)
                 # Some comments are magic
@@ -267,6 +274,11 @@ class FakeGPS(object):
         """Throw an error if this superclass is ever instantiated."""
         raise ValueError(line)
 
+    def write_bulk(self, packets):
+        """Write several packets at once, return the number of writes."""
+        self.write(b"".join(packets))
+        return 1
+
     def feed(self):
         """Feed a line from the contents of the GPS log to the daemon."""
         line = self.testload.sentences[self.index
@@ -368,6 +380,28 @@ class FakePTY(FakeGPS):
                       % (self.testload.name, len(line), repr(line)))
         os.write(self.fd, line)
 
+    def write_bulk(self, packets):
+        """Write several packets with writev(), return the number of writes."""
+        if not hasattr(os, "writev"):
+            # Python 2
+            return super(FakePTY, self).write_bulk(packets)
+        writes = 0
+        packets = list(packets)
+        while packets:
+            buffers = packets[:REPLAY_MAX_BUFFERS]
+            written = os.writev(self.fd, buffers)
+            writes += 1
+            # drop what was written, keep the rest of a partial packet
+            for i, buf in enumerate(buffers):
+                if written < len(buf):
+                    packets[i] = buf[written:]
+                    del packets[:i]
+                    break
+                written -= len(buf)
+            else:
+                del packets[:len(buffers)]
+        return writes
+
     def drain(self):
         """Wait for the associated device to drain (e.g. before closing)."""
         termios.tcdrain(self.fd)
@@ -439,6 +473,16 @@ class FakeTCP(FakeGPS):
             if s != self.dispatcher:
                 s.send(line)
 
+    def write_bulk(self, packets):
+        """Send several packets at once, return the number of writes."""
+        data = b"".join(packets)
+        writes = 0
+        for s in self.readables:
+            if s != self.dispatcher:
+                s.sendall(data)
+                writes += 1
+        return writes
+
     def drain(self):
         """Wait for the associated device(s) to drain (e.g. before closing)."""
         for s in self.readables:
@@ -468,12 +512,247 @@ class FakeUDP(FakeGPS):
                       % (self.testload.name, len(line), repr(line)))
         self.sock.sendto(line, (self.ipaddr, int(self.port)))
 
+    def write_bulk(self, packets):
+        """Send several packets by datagrams, return the number of writes."""
+        address = (self.ipaddr, int(self.port))
+        writes = 0
+        datagram = []
+        size = 0
+        for packet in packets:
+            if datagram and size + len(packet) > REPLAY_DATAGRAM_SIZE:
+                self.sock.sendto(b"".join(datagram), address)
+                writes += 1
+                datagram = []
+                size = 0
+            datagram.append(packet)
+            size += len(packet)
+        if datagram:
+            self.sock.sendto(b"".join(datagram), address)
+            writes += 1
+        return writes
+
     def drain(self):
         """Wait for the associated device to drain (e.g. before closing)."""
         # shutdown() fails on UDP
         return  # shutdown() fails on UDP
 
 
+# NMEA sentences with a time field: sentence -> (time, date) field indexes
+NMEA_TIME_FIELDS = {
+    b"RMC": (1, 9),
+    b"GGA": (1, None),
+    b"GNS": (1, None),
+    b"GLL": (5, None),
+    b"GST": (1, None),
+    b"GBS": (1, None),
+    b"GRS": (1, None),
+    b"ZDA": (1, 2),
+}
+# Replay: bytes written by call when unthrottled
+REPLAY_CHUNK_SIZE = 65536
+# Replay: largest UDP datagram
+REPLAY_DATAGRAM_SIZE = 1472
+# Replay: the buffers of a writev() call (IOV_MAX is 1024 on Linux)
+REPLAY_MAX_BUFFERS = 1024
+
+
+def nmea_time(packet):
+    """Return (seconds of the day, (day, month, year) or None) or None.
+
+    Only for the NMEA sentences with a time field.
+    """
+    if not packet.startswith((b"$", b"!")) or packet[3:6] not in \
+            NMEA_TIME_FIELDS:
+        return None
+    fields = packet.split(b"*")[0].split(b",")
+    time_index, date_index = NMEA_TIME_FIELDS[packet[3:6]]
+    try:
+        hhmmss = fields[time_index]
+        seconds = (int(hhmmss[0:2]) * 3600 + int(hhmmss[2:4]) * 60 +
+                   float(hhmmss[4:]))
+    except (IndexError, ValueError):
+        return None
+    date = None
+    try:
+        if packet[3:6] == b"RMC":
+            ddmmyy = fields[date_index]
+            date = (int(ddmmyy[0:2]), int(ddmmyy[2:4]), 2000 + int(ddmmyy[4:6]))
+        elif packet[3:6] == b"ZDA":
+            date = (int(fields[2]), int(fields[3]), int(fields[4]))
+    except (IndexError, ValueError):
+        date = None
+    return seconds, date
+
+
+def nmea_rewrite_time(packet, timestamp):
+    """Return the NMEA sentence with its time (and date) set to timestamp."""
+    body, _star, tail = packet.partition(b"*")
+    fields = body.split(b",")
+    time_index, date_index = NMEA_TIME_FIELDS[packet[3:6]]
+    decimals = fields[time_index].partition(b".")[2]
+    tm = time.gmtime(timestamp)
+    new_time = time.strftime("%H%M%S", tm)
+    if decimals:
+        fraction = "%.*f" % (len(decimals), timestamp % 1)
+        if fraction.startswith("1"):
+            # rounded up to the next second
+            tm = time.gmtime(int(timestamp) + 1)
+            new_time = time.strftime("%H%M%S", tm)
+            fraction = fraction.replace("1", "0", 1)
+        new_time += fraction[1:]
+    fields[time_index] = gps.polybytes(new_time)
+    if packet[3:6] == b"RMC" and len(fields) > date_index:
+        fields[date_index] = gps.polybytes(time.strftime("%d%m%y", tm))
+    elif packet[3:6] == b"ZDA" and len(fields) > 4:
+        fields[2:5] = [gps.polybytes(x)
+                       for x in time.strftime("%d %m %Y", tm).split()]
+    body = b",".join(fields)
+    checksum = 0
+    for byte in bytearray(body[1:]):
+        checksum ^= byte
+    # keep the line end of the original sentence
+    eol = tail[2:] if len(tail) >= 2 else b"\r\n"
+    return body + gps.polybytes("*%02X" % checksum) + eol
+
+
+class Replay(object):
+
+    """Replay a test load at N times its speed, or unthrottled.
+
+    The packets are grouped by epoch, an epoch starts with a NMEA sentence
+    with a new time.  The epochs are sent at the log time divided by speed,
+    measured from the start of the replay (no cumulative drift).  A load
+    without NMEA times uses the per-line delay of the load instead.
+    """
+
+    def __init__(self, fakegps, speed=1.0, virtual_start=None, cycles=1,
+                 chunk_size=REPLAY_CHUNK_SIZE, progress=None):
+        """Initialize Class Replay.
+
+        fakegps: the FakeGPS to write to (PTY, TCP or UDP)
+        speed: replay speed factor, 0 for unthrottled
+        virtual_start: None to keep the NMEA times, else the (posix)
+            time given to the first epoch, the next epochs follow the log
+        cycles: number of times the load is replayed, the virtual clock
+            keeps running from one cycle to the next
+        chunk_size: bytes written by call when unthrottled
+        """
+        self.fakegps = fakegps
+        self.speed = speed
+        self.virtual_start = virtual_start
+        self.cycles = cycles
+        self.chunk_size = chunk_size
+        self.progress = progress or fakegps.progress
+        # list of [log offset (s), packets, indexes of the timed packets]
+        self.epochs = []
+        self.duration = 0.0
+        self.split_epochs(fakegps.testload)
+
+    def split_epochs(self, testload):
+        """Group the packets of the load by epoch."""
+        first = None        # first (seconds of the day) of the log
+        last = None
+        days = 0            # midnight rollovers
+        delay_shift = 0.0   # %Delay: lines
+        untimed = 0         # position of a load without times
+        epoch = None
+        for packet in testload.sentences:
+            stamp = nmea_time(packet)
+            if b"%Delay:" in packet:
+                try:
+                    delay_shift += int(packet.split()[1])
+                except (IndexError, ValueError):
+                    pass
+                epoch = None
+            if stamp is not None:
+                if first is None:
+                    first = stamp[0]
+                elif stamp[0] < last - 43200:
+                    days += 1
+                if stamp[0] != last or epoch is None:
+                    offset = stamp[0] - first + days * 86400 + delay_shift
+                    epoch = [offset, [], []]
+                    self.epochs.append(epoch)
+                last = stamp[0]
+                epoch[2].append(len(epoch[1]))
+            elif epoch is None or (first is None and testload.delay):
+                # no time yet: the packets follow the load delay
+                if first is None:
+                    offset = untimed * testload.delay + delay_shift
+                else:
+                    offset = last - first + days * 86400 + delay_shift
+                epoch = [offset, [], []]
+                self.epochs.append(epoch)
+            epoch[1].append(packet)
+            if first is None:
+                untimed += 1
+        if self.epochs:
+            # one more epoch interval before the next cycle
+            offsets = [x[0] for x in self.epochs]
+            interval = (offsets[-1] - offsets[0]) / max(1, len(offsets) - 1)
+            self.duration = offsets[-1] - offsets[0] + \
+                (interval or testload.delay)
+
+    def epoch_packets(self, epoch, cycle):
+        """Return the packets of an epoch, with the virtual times."""
+        offset, packets, timed = epoch
+        if self.virtual_start is None or not timed:
+            return packets
+        timestamp = self.virtual_start + cycle * self.duration + offset
+        packets = list(packets)
+        for i in timed:
+            packets[i] = nmea_rewrite_time(packets[i], timestamp)
+        return packets
+
+    def run(self):
+        """Replay the load, return the throughput statistics."""
+        stats = {"packets": 0, "bytes": 0, "epochs": 0, "writes": 0,
+                 "late": 0}
+        pending = []
+        pending_bytes = 0
+        start = gps.misc.monotonic()
+        for cycle in range(self.cycles):
+            for epoch in self.epochs:
+                if self.speed:
+                    due = start + (cycle * self.duration + epoch[0] -
+                                   self.epochs[0][0]) / self.speed
+                    wait = due - gps.misc.monotonic()
+                    if 0 < wait:
+                        time.sleep(wait)
+                    elif -1 > wait:
+                        stats["late"] += 1
+                packets = self.epoch_packets(epoch, cycle)
+                pending.extend(packets)
+                pending_bytes += sum(len(x) for x in packets)
+                stats["epochs"] += 1
+                stats["packets"] += len(packets)
+                if self.speed or pending_bytes >= self.chunk_size:
+                    # handle the connections and discard the input
+                    self.fakegps.read()
+                    stats["writes"] += self.fakegps.write_bulk(pending)
+                    stats["bytes"] += pending_bytes
+                    pending = []
+                    pending_bytes = 0
+        if pending:
+            stats["writes"] += self.fakegps.write_bulk(pending)
+            stats["bytes"] += pending_bytes
+        elapsed = gps.misc.monotonic() - start
+        stats["elapsed"] = elapsed
+        stats["log_seconds"] = self.duration * self.cycles
+        stats["speedup"] = stats["log_seconds"] / elapsed if elapsed else 0
+        stats["bytes_per_second"] = stats["bytes"] / elapsed if elapsed \
+            else 0
+        stats["packets_per_second"] = stats["packets"] / elapsed \
+            if elapsed else 0
+        self.progress("gpsfake: %s replayed %d packets (%d bytes, %d writes)"
+                      " in %.2fs: %.1f kB/s, %.0f packets/s, x%.1f\n"
+                      % (self.fakegps.testload.name, stats["packets"],
+                         stats["bytes"], stats["writes"], elapsed,
+                         stats["bytes_per_second"] / 1000,
+                         stats["packets_per_second"], stats["speedup"]))
+        return stats
+
+
 class SubprogramError(TestError):
 
     """Class SubprogramError."""
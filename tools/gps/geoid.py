@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+#
+# geoid.py - vectorized geoid separation and magnetic variation lookup
+#
+# This code runs compatibly under Python 2 and 3.x for x >= 2, with numpy.
+# Preserve this property!
+# Codacy D203 and D211 conflict, I choose D203
+# Codacy D212 and D213 conflict, I choose D212
+"""Geoid separation and magnetic variation grids, with numpy.
+
+clienthelpers.wgs84_separation() and mag_var() interpolate one point at a
+time in the 5 degree tables.  This module loads a table once as a numpy
+array and interpolates whole arrays of latitudes/longitudes:
+    - the built-in 5 degree tables of clienthelpers (GEOID_DELTA and
+        magvar_table), same results as clienthelpers;
+    - EGM grids, memory mapped (only the pages around the points used are
+        read): GeographicLib .pgm files (egm96-5.pgm, egm2008-1.pgm...) and
+        NGA WW15MGH.DAC (EGM96 15');
+    - bilinear or bicubic (Catmull-Rom) interpolation;
+    - the invalid points (out of range, not finite) give NaN.
+
+Example:
+    import gps.geoid
+
+    geoid = gps.geoid.default_geoid()   # best EGM grid found, or 5 degree
+    separation = geoid.interpolate(lats, lons, method='bicubic')
+    orthometric = gps.geoid.ellipsoid_to_orthometric(heights, lats, lons)
+"""
+
+from __future__ import absolute_import, print_function, division
+
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .clienthelpers import GEOID_DELTA, TABLE_SPAN, magvar_table
+
+__all__ = ['geogrid', 'load_grid', 'default_geoid', 'wgs84_separation',
+           'mag_var', 'ellipsoid_to_orthometric', 'orthometric_to_ellipsoid']
+
+# where the GeographicLib geoid files are installed (geographiclib-tools)
+GEOID_PATHS = [
+    os.path.expanduser('~/.local/share/GeographicLib/geoids'),
+    '/usr/local/share/GeographicLib/geoids',
+    '/usr/share/GeographicLib/geoids',
+]
+# preferred grids, most accurate first
+GEOID_FILES = ['egm2008-1.pgm', 'egm2008-2_5.pgm', 'egm2008-5.pgm',
+               'egm96-5.pgm', 'egm96-15.pgm', 'egm84-15.pgm', 'WW15MGH.DAC']
+
+
+def _need_numpy():
+    """Raise an ImportError when numpy is not installed."""
+    if numpy is None:
+        raise ImportError("gps.geoid needs numpy")
+
+
+class geogrid(object):
+
+    """A regular lat/lon grid of values, interpolated with numpy."""
+
+    def __init__(self, values, lat0, lon0, lat_step, lon_step,
+                 offset=0.0, scale=1.0, name=''):
+        """Init geogrid.
+
+        values: 2D array (rows: latitudes, columns: longitudes), can be a
+            numpy.memmap
+        lat0, lon0: position of values[0][0] (degrees)
+        lat_step, lon_step: grid spacing, lat_step is negative when the
+            first row is the north
+        offset, scale: value = offset + scale * values[row][column]
+        """
+        _need_numpy()
+        self.values = values
+        self.rows, self.cols = values.shape
+        self.lat0 = float(lat0)
+        self.lon0 = float(lon0)
+        self.lat_step = float(lat_step)
+        self.lon_step = float(lon_step)
+        self.offset = offset
+        self.scale = scale
+        self.name = name
+        # a global grid without the duplicated 360 degree column wraps
+        self.periodic = abs(self.cols * self.lon_step - 360.0) < 1e-9
+        # the rows beyond a pole are the rows on the other side of the pole
+        last_lat = self.lat0 + (self.rows - 1) * self.lat_step
+        self.poles = self.periodic and self.cols % 2 == 0 and \
+            abs(abs(self.lat0) - 90) < 1e-9 and abs(abs(last_lat) - 90) < 1e-9
+
+    def _coordinates(self, lat, lon):
+        """Return the fractional row/column and the valid points mask."""
+        lat = numpy.asarray(lat, dtype=float)
+        lon = numpy.asarray(lon, dtype=float)
+        lat, lon = numpy.broadcast_arrays(lat, lon)
+        with numpy.errstate(invalid='ignore'):
+            valid = (numpy.isfinite(lat) & numpy.isfinite(lon) &
+                     (numpy.abs(lat) <= 90) & (numpy.abs(lon) <= 360))
+        lat = numpy.where(valid, lat, 0.0)
+        lon = numpy.where(valid, lon, 0.0)
+        if self.periodic:
+            lon = self.lon0 + numpy.mod(lon - self.lon0, 360.0)
+        else:
+            # -180..180, 180 stays 180 for the tables with both columns
+            lon = numpy.where(lon > 180, lon - 360, lon)
+            lon = numpy.where(lon < -180, lon + 360, lon)
+        row = (lat - self.lat0) / self.lat_step
+        column = (lon - self.lon0) / self.lon_step
+        return row, column, valid
+
+    def _cell(self, position, size, periodic):
+        """Return the first index of the cell and the fraction in it."""
+        index = numpy.floor(position).astype(numpy.intp)
+        if periodic:
+            return numpy.mod(index, size), position - index
+        # the last row/column uses the cell before, like clienthelpers
+        index = numpy.clip(index, 0, size - 2)
+        return index, position - index
+
+    def _get(self, row, column):
+        """Return the scaled values at the row/column index arrays."""
+        values = numpy.asarray(self.values[row, column], dtype=float)
+        return self.offset + self.scale * values
+
+    def bilinear(self, lat, lon):
+        """Return the bilinear interpolation at lat/lon (arrays)."""
+        row, column, valid = self._coordinates(lat, lon)
+        r0, fr = self._cell(row, self.rows, False)
+        c0, fc = self._cell(column, self.cols, self.periodic)
+        r1 = r0 + 1
+        c1 = (c0 + 1) % self.cols if self.periodic else c0 + 1
+        result = ((1 - fr) * ((1 - fc) * self._get(r0, c0) +
+                              fc * self._get(r0, c1)) +
+                  fr * ((1 - fc) * self._get(r1, c0) +
+                        fc * self._get(r1, c1)))
+        return numpy.where(valid, result, numpy.nan)
+
+    def bicubic(self, lat, lon):
+        """Return the bicubic (Catmull-Rom) interpolation at lat/lon."""
+        row, column, valid = self._coordinates(lat, lon)
+        r0, fr = self._cell(row, self.rows, False)
+        c0, fc = self._cell(column, self.cols, self.periodic)
+        row_weights = _catmull_rom(fr)
+        column_weights = _catmull_rom(fc)
+        result = numpy.zeros(numpy.shape(fr))
+        for i in range(4):
+            r = r0 + i - 1
+            shift = 0
+            if self.poles:
+                # reflected across the pole, on the opposite meridian
+                beyond = (r < 0) | (r > self.rows - 1)
+                r = numpy.where(r < 0, -r, r)
+                r = numpy.where(r > self.rows - 1,
+                                2 * (self.rows - 1) - r, r)
+                shift = numpy.where(beyond, self.cols // 2, 0)
+            else:
+                # the rows outside the grid are clamped to the first/last
+                r = numpy.clip(r, 0, self.rows - 1)
+            line = numpy.zeros(numpy.shape(fr))
+            for j in range(4):
+                if self.periodic:
+                    c = (c0 + j - 1 + shift) % self.cols
+                else:
+                    c = numpy.clip(c0 + j - 1, 0, self.cols - 1)
+                line += column_weights[j] * self._get(r, c)
+            result += row_weights[i] * line
+        return numpy.where(valid, result, numpy.nan)
+
+    def interpolate(self, lat, lon, method='bilinear'):
+        """Return the value at lat/lon (degrees, scalars or arrays).
+
+        The longitudes can be -180..180 or 0..360.
+        method: 'bilinear' or 'bicubic'
+        The result has the broadcast shape of lat and lon, a float for
+        scalars.  The invalid points give NaN.
+        """
+        if method == 'bicubic':
+            result = self.bicubic(lat, lon)
+        elif method == 'bilinear':
+            result = self.bilinear(lat, lon)
+        else:
+            raise ValueError("unknown interpolation method: %s" % method)
+        return float(result) if result.ndim == 0 else result
+
+
+def _catmull_rom(fraction):
+    """Return the 4 Catmull-Rom weights for a fraction (array)."""
+    f2 = fraction * fraction
+    f3 = f2 * fraction
+    return (-0.5 * f3 + f2 - 0.5 * fraction,
+            1.5 * f3 - 2.5 * f2 + 1,
+            -1.5 * f3 + 2 * f2 + 0.5 * fraction,
+            0.5 * f3 - 0.5 * f2)
+
+
+def _table_grid(table, name):
+    """Build a geogrid from a 5 degree table of clienthelpers."""
+    _need_numpy()
+    return geogrid(numpy.array(table, dtype=numpy.int32), -90, -180,
+                   TABLE_SPAN, TABLE_SPAN, scale=0.01, name=name)
+
+
+def load_pgm(path):
+    """Memory map a GeographicLib geoid file (.pgm).
+
+    16 bits big-endian values, first row at 90N, first column at 0E, the
+    header gives the offset and scale (meters).
+    """
+    _need_numpy()
+    offset = 0.0
+    scale = 1.0
+    with open(path, 'rb') as pgm:
+        if pgm.readline().strip() != b'P5':
+            raise ValueError("%s: not a binary pgm file" % path)
+        line = pgm.readline()
+        while line.startswith(b'#'):
+            words = line[1:].split()
+            if len(words) == 2 and words[0] == b'Offset':
+                offset = float(words[1])
+            elif len(words) == 2 and words[0] == b'Scale':
+                scale = float(words[1])
+            line = pgm.readline()
+        cols, rows = (int(x) for x in line.split())
+        maxval = int(pgm.readline())
+        if maxval != 65535:
+            raise ValueError("%s: not a 16 bits pgm file" % path)
+        header = pgm.tell()
+    values = numpy.memmap(path, dtype='>u2', mode='r', offset=header,
+                          shape=(rows, cols))
+    return geogrid(values, 90, 0, -180.0 / (rows - 1), 360.0 / cols,
+                   offset=offset, scale=scale, name=os.path.basename(path))
+
+
+def load_dac(path):
+    """Memory map the NGA EGM96 15' file (WW15MGH.DAC).
+
+    721 x 1440 16 bits big-endian values in centimeters, first row at 90N,
+    first column at 0E.
+    """
+    _need_numpy()
+    rows, cols = 721, 1440
+    values = numpy.memmap(path, dtype='>i2', mode='r', shape=(rows, cols))
+    return geogrid(values, 90, 0, -0.25, 0.25, scale=0.01,
+                   name=os.path.basename(path))
+
+
+def load_grid(path):
+    """Load a geoid grid file (.pgm or .dac)."""
+    if path.lower().endswith('.dac'):
+        return load_dac(path)
+    return load_pgm(path)
+
+
+_grids = {}
+
+
+def _cached(key, loader):
+    """Load a grid once."""
+    if key not in _grids:
+        _grids[key] = loader()
+    return _grids[key]
+
+
+def builtin_geoid():
+    """Return the 5 degree geoid table of clienthelpers."""
+    return _cached('geoid', lambda: _table_grid(GEOID_DELTA, 'geoid 5deg'))
+
+
+def builtin_magvar():
+    """Return the 5 degree magnetic variation table of clienthelpers."""
+    return _cached('magvar', lambda: _table_grid(magvar_table,
+                                                 'magvar 5deg'))
+
+
+def find_geoid_file():
+    """Return the path of the best installed EGM grid, or None."""
+    for name in GEOID_FILES:
+        for directory in GEOID_PATHS:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                return path
+    return None
+
+
+def default_geoid():
+    """Return the best geoid grid available.
+
+    The GEOID_FILE environment variable can give the grid to use.
+    """
+    path = os.environ.get('GEOID_FILE') or find_geoid_file()
+    if path:
+        return _cached(path, lambda: load_grid(path))
+    return builtin_geoid()
+
+
+def wgs84_separation(lat, lon, method='bilinear', grid=None):
+    """Return the geoid separation (meters) at lat/lon (arrays).
+
+    grid: a geogrid, the 5 degree table by default (same values as
+        clienthelpers.wgs84_separation)
+    """
+    return (grid or builtin_geoid()).interpolate(lat, lon, method)
+
+
+def mag_var(lat, lon):
+    """Return the magnetic variation (degrees) at lat/lon (arrays).
+
+    Bilinear only, the table wraps at +/-180 degrees near the poles.
+    """
+    return builtin_magvar().interpolate(lat, lon)
+
+
+def ellipsoid_to_orthometric(height, lat, lon, method='bilinear',
+                             grid=None):
+    """Convert ellipsoidal heights to orthometric (above the geoid)."""
+    _need_numpy()
+    return numpy.asarray(height, dtype=float) - \
+        wgs84_separation(lat, lon, method, grid)
+
+
+def orthometric_to_ellipsoid(height, lat, lon, method='bilinear',
+                             grid=None):
+    """Convert orthometric heights to ellipsoidal."""
+    _need_numpy()
+    return numpy.asarray(height, dtype=float) + \
+        wgs84_separation(lat, lon, method, grid)
+
+# vim: set expandtab shiftwidth=4
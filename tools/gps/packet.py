@@ -11,10 +11,12 @@
 """Python binding of the libgpsd module for recognizing GPS packets.
 
 The new() function returns a new packet-lexer instance.  Lexer instances
-have two methods:
-    get() takes a file descriptor argument and returns a tuple consisting of
-the integer packet type and string packet value.  On end of file it returns
-(-1, '').
+have three methods:
+    get() takes a file descriptor argument and returns a list consisting of
+the read length, the integer packet type, the packet bytes and the character
+counter.  On end of file the length is 0 (negative on error).
+    iter_packets() takes a file descriptor (or a file object) and yields
+(packet type, packet bytes, character counter) tuples until end of file.
     reset() resets the packet-lexer to its initial state.
     The module also has a register_report() function that accepts a callback
 for debug message reporting.  The callback will get two arguments, the error
@@ -190,6 +192,19 @@ class lexer_t(ctypes.Structure):
     ]
 
 
+# The C function prototypes are set once.  _packet['name'] returns a new
+# function object each time, so ffi_Lexer_init can have two prototypes.
+_lexer_init = _packet['ffi_Lexer_init']
+_lexer_init.restype = ctypes.POINTER(lexer_t)
+_lexer_reset = _packet['ffi_Lexer_init']
+_lexer_reset.restype = None
+_lexer_reset.argtypes = [ctypes.POINTER(lexer_t)]
+_packet_get = _packet['packet_get']
+_packet_get.restype = ctypes.c_int
+_packet_get.argtypes = [ctypes.c_int, ctypes.POINTER(lexer_t)]
+_outbuffer_offset = lexer_t.outbuffer.offset
+
+
 def new():
     """new() -> new packet-self object"""
     return Lexer()
@@ -213,29 +228,40 @@ Fetch a single packet from file descriptor
 
     def __init__(self):
         global _loaded
-        _packet.ffi_Lexer_init.restype = ctypes.POINTER(lexer_t)
-        self.pointer = _packet.ffi_Lexer_init()
-        _loaded = self.pointer.contents
+        self.pointer = _lexer_init()
+        self.lexer = self.pointer.contents
+        # address of the output buffer, for a single copy of each packet
+        self.outbuffer_address = \
+            ctypes.addressof(self.lexer) + _outbuffer_offset
+        _loaded = self.lexer
 
     def get(self, file_handle):
         """Get a packet from a file descriptor."""
         global _loaded
-        _packet.packet_get.restype = ctypes.c_int
-        _packet.packet_get.argtypes = [ctypes.c_int, ctypes.POINTER(lexer_t)]
-        length = _packet.packet_get(file_handle, self.pointer)
-        _loaded = self.pointer.contents
-        packet = ''
-        for octet in range(_loaded.outbuflen):
-            packet += chr(_loaded.outbuffer[octet])
+        length = _packet_get(file_handle, self.pointer)
+        _loaded = self.lexer
         return [length,
-                _loaded.packet_type,
-                gps.misc.polybytes(packet),
-                _loaded.char_counter]
+                self.lexer.packet_type,
+                ctypes.string_at(self.outbuffer_address,
+                                 self.lexer.outbuflen),
+                self.lexer.char_counter]
+
+    def iter_packets(self, file_handle):
+        """Yield (type, packet, counter) from a file descriptor until EOF."""
+        global _loaded
+        if hasattr(file_handle, 'fileno'):
+            file_handle = file_handle.fileno()
+        _loaded = lexer = self.lexer
+        pointer = self.pointer
+        address = self.outbuffer_address
+        string_at = ctypes.string_at
+        while _packet_get(file_handle, pointer) > 0:
+            yield (lexer.packet_type,
+                   string_at(address, lexer.outbuflen),
+                   lexer.char_counter)
 
     def reset(self):
         """Reset the packet self to ground state."""
-        _packet.ffi_Lexer_init.restype = None
-        _packet.ffi_Lexer_init.argtypes = [ctypes.POINTER(lexer_t)]
-        _packet.ffi_Lexer_init(self.pointer)
+        _lexer_reset(self.pointer)
 
 # vim: set expandtab shiftwidth=4
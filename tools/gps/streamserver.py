@@ -0,0 +1,716 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# This code run compatibly under Python 3.x for x >= 6.
+# Codacy D203 and D211 conflict, I choose D203
+# Codacy D212 and D213 conflict, I choose D212
+
+"""streamserver.py -- Local gpsd-style JSON server for many subscribers.
+
+The stream is read and decoded once, then served with the gpsd protocol
+to all the local consumers (chrony through gpsd, the web UI, scripts):
+    - source 'gpsd': a gpsd JSON stream, the lines are forwarded as
+        received (only the class is decoded, with gpsjson);
+    - source 'nmea': a NMEA stream (ie: rtkrcv raw2nmea output, str2str),
+        the RMC/GGA/GSA/GSV sentences are decoded to TPV and SKY messages,
+        the sentences are also served to the clients asking for NMEA;
+    - the clients use ?WATCH, ?POLL, ?VERSION and ?DEVICES like with gpsd.
+        The WATCH object accepts a "classes" list to receive only some
+        classes (ie: ["TPV"]), it is an extension ignored by gpsd;
+    - the writes are non-blocking, a client whose backlog grows over
+        max_backlog is disconnected (like gpsd does with slow clients).
+    The encoding cost doesn't depend on the number of clients: each message
+    is encoded once and its bytes are queued to all the subscribers.
+
+Example:
+    cd tools
+    python3 -m gps.streamserver --source nmea://127.0.0.1:5014 \\
+        --listen 127.0.0.1:2948
+    gpspipe -w localhost:2948
+"""
+
+__all__ = ['nmeadecoder', 'streamclient', 'streamserver', ]
+
+import argparse
+import json
+import re
+import selectors
+import socket
+import sys
+import time
+
+import gps          # for VERB_*
+from .client import gpscommon, gpsjson, json_error, dictwrapper
+from .misc import polystr
+
+STREAM_PORT = 2948
+# protocol version announced to the clients (gpsd 3.22)
+PROTO_MAJOR = 3
+PROTO_MINOR = 14
+# bytes waiting for a client before it is disconnected
+MAX_BACKLOG = 262144
+# delay between two connection attempts to the source (seconds)
+RECONNECT_DELAY = 2
+# the commands sent by the clients: ?NAME or ?NAME={json}
+COMMAND_RE = re.compile(rb'\?(\w+)(?:=(\{.*\}))?')
+
+# NMEA talker ID -> gpsd gnssid
+TALKER_GNSSID = {'GP': 0, 'SB': 1, 'GA': 2, 'GB': 3, 'BD': 3, 'GQ': 5,
+                 'QZ': 5, 'GL': 6, 'GI': 7}
+# NMEA 4.10 GSA system ID -> gpsd gnssid
+GSA_SYSTEM_GNSSID = {1: 0, 2: 6, 3: 2, 4: 3, 5: 5, 6: 7}
+# GGA quality indicator -> gpsd TPV status
+GGA_STATUS = {1: 1, 2: 2, 3: 1, 4: 3, 5: 4, 6: 5, 8: 8}
+KNOTS_TO_MPS = 0.51444444
+
+
+def nmea_checksum_ok(sentence):
+    """Check the checksum of a NMEA sentence (bytes, without CR LF)."""
+    star = sentence.rfind(b'*')
+    if star < 1 or len(sentence) < star + 3:
+        return False
+    checksum = 0
+    for byte in sentence[1:star]:
+        checksum ^= byte
+    try:
+        return checksum == int(sentence[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+
+
+def _float(field):
+    """Return a NMEA field as float, or None when empty."""
+    try:
+        return float(field)
+    except ValueError:
+        return None
+
+
+def _int(field):
+    """Return a NMEA field as int, or None when empty."""
+    try:
+        return int(field)
+    except ValueError:
+        return None
+
+
+def _degrees(field, hemisphere):
+    """Convert a NMEA ddmm.mmmm (or dddmm.mmmm) field to degrees."""
+    value = _float(field)
+    if value is None:
+        return None
+    degrees = int(value // 100)
+    degrees += (value - degrees * 100) / 60
+    return -degrees if hemisphere in ('S', 'W') else degrees
+
+
+class nmeadecoder(object):
+    """Decode NMEA sentences to gpsd TPV and SKY messages.
+
+    The sentences of an epoch update the same TPV, it is returned when both
+    RMC and GGA have been received (or when the next epoch starts).  The SKY
+    is returned when the next epoch starts, the GSA/GSV sentences follow
+    RMC and GGA.
+"""
+
+    def __init__(self, device='nmea'):
+        """Init nmeadecoder."""
+        self.device = device
+        self.date = None            # last RMC date, 'YYYY-MM-DD'
+        self.epoch = None           # time field of the current epoch
+        self.tpv = {}
+        self.tpv_sent = False
+        self.seen = set()
+        # (talker, signal id) -> {prn: satellite}, from GSV
+        self.groups = {}
+        # (gnssid or None if unknown, prn) used, from GSA
+        self.used = set()
+        self.sky_changed = False
+        self.dop = {}
+
+    def _new_epoch(self, epoch):
+        """Start a new epoch, return the messages of the previous one."""
+        messages = []
+        if self.epoch is not None:
+            if not self.tpv_sent:
+                messages.append(self._tpv())
+            if self.sky_changed:
+                messages.append(self._sky())
+        self.epoch = epoch
+        self.tpv = {}
+        self.tpv_sent = False
+        self.seen = set()
+        self.used = set()
+        self.sky_changed = False
+        return messages
+
+    def _time(self):
+        """Return the ISO time of the current epoch, or None."""
+        if self.date is None or len(self.epoch) < 6:
+            return None
+        return '%sT%s:%s:%sZ' % (self.date, self.epoch[0:2],
+                                 self.epoch[2:4], self.epoch[4:])
+
+    def _tpv(self):
+        """Build the TPV of the current epoch."""
+        self.tpv_sent = True
+        tpv = {'class': 'TPV', 'device': self.device}
+        tpv['mode'] = self.tpv.pop('mode', 1)
+        epoch_time = self._time()
+        if epoch_time is not None:
+            tpv['time'] = epoch_time
+        tpv.update(self.tpv)
+        return tpv
+
+    def _sky(self):
+        """Build the SKY of the current epoch."""
+        self.sky_changed = False
+        satellites = {}
+        for (talker, _signal), group in self.groups.items():
+            for prn, satellite in group.items():
+                key = (talker, prn)
+                # one entry by satellite, the strongest signal
+                if key not in satellites or \
+                        (satellite.get('ss') or 0) > \
+                        (satellites[key].get('ss') or 0):
+                    satellites[key] = satellite
+        sky = {'class': 'SKY', 'device': self.device}
+        epoch_time = self._time()
+        if epoch_time is not None:
+            sky['time'] = epoch_time
+        sky.update(self.dop)
+        sky['satellites'] = [dict(satellite, used=self._is_used(satellite))
+                             for satellite in satellites.values()]
+        return sky
+
+    def _is_used(self, satellite):
+        """Check if a satellite is in the GSA used list of its constellation."""
+        return (satellite.get('gnssid'), satellite['PRN']) in self.used or \
+            (None, satellite['PRN']) in self.used
+
+    def _rmc_gga(self, kind, fields):
+        """Decode a RMC or GGA sentence."""
+        messages = []
+        epoch = fields[1] if len(fields) > 1 else ''
+        if epoch != self.epoch:
+            messages = self._new_epoch(epoch)
+        if kind == 'RMC' and len(fields) >= 10:
+            if len(fields[9]) == 6:
+                self.date = '20%s-%s-%s' % (fields[9][4:6], fields[9][2:4],
+                                            fields[9][0:2])
+            if fields[2] == 'V':
+                self.tpv.setdefault('mode', 1)
+            speed = _float(fields[7])
+            if speed is not None:
+                self.tpv['speed'] = round(speed * KNOTS_TO_MPS, 3)
+            track = _float(fields[8])
+            if track is not None:
+                self.tpv['track'] = track
+            position = (fields[3], fields[4], fields[5], fields[6])
+        elif kind == 'GGA' and len(fields) >= 12:
+            quality = _int(fields[6]) or 0
+            altitude = _float(fields[9])
+            separation = _float(fields[11])
+            if quality:
+                self.tpv['status'] = GGA_STATUS.get(quality, 1)
+                if 'mode' not in self.tpv or self.tpv['mode'] > 1:
+                    self.tpv['mode'] = 3 if altitude is not None else 2
+            else:
+                self.tpv['mode'] = 1
+            if altitude is not None:
+                self.tpv['altMSL'] = altitude
+                if separation is not None:
+                    self.tpv['altHAE'] = round(altitude + separation, 4)
+                    self.tpv['geoidSep'] = separation
+            position = (fields[2], fields[3], fields[4], fields[5])
+        else:
+            return messages
+        lat = _degrees(position[0], position[1])
+        lon = _degrees(position[2], position[3])
+        if lat is not None and lon is not None:
+            self.tpv['lat'] = round(lat, 9)
+            self.tpv['lon'] = round(lon, 9)
+        self.seen.add(kind)
+        if not self.tpv_sent and {'RMC', 'GGA'} <= self.seen:
+            messages.append(self._tpv())
+        return messages
+
+    def _gsa(self, talker, fields):
+        """Decode a GSA sentence (satellites used and DOP)."""
+        if len(fields) < 18:
+            return
+        mode = _int(fields[2])
+        if mode and not self.tpv_sent:
+            self.tpv['mode'] = mode
+        # the constellation comes from the talker, or from the NMEA 4.10
+        # system ID with the GN talker. Unknown: matched by PRN only
+        gnssid = TALKER_GNSSID.get(talker)
+        if gnssid is None and len(fields) > 18:
+            gnssid = GSA_SYSTEM_GNSSID.get(_int(fields[18]))
+        self.used.update((gnssid, prn) for prn in
+                         (_int(field) for field in fields[3:15]) if prn)
+        for name, field in (('pdop', 15), ('hdop', 16), ('vdop', 17)):
+            value = _float(fields[field])
+            if value is not None:
+                self.dop[name] = value
+        self.sky_changed = True
+
+    def _gsv(self, talker, fields):
+        """Decode a GSV sentence (satellites in view)."""
+        if len(fields) < 4:
+            return
+        # NMEA 4.10 adds a signal ID after the satellites
+        signal = fields[-1] if len(fields) % 4 == 1 else ''
+        key = (talker, signal)
+        if _int(fields[2]) == 1 or key not in self.groups:
+            self.groups[key] = {}
+        group = self.groups[key]
+        for i in range(4, len(fields) - 3, 4):
+            prn = _int(fields[i])
+            if prn is None:
+                continue
+            satellite = {'PRN': prn,
+                         'el': _float(fields[i + 1]),
+                         'az': _float(fields[i + 2]),
+                         'ss': _float(fields[i + 3])}
+            if talker in TALKER_GNSSID:
+                satellite['gnssid'] = TALKER_GNSSID[talker]
+            group[prn] = satellite
+        self.sky_changed = True
+
+    def decode(self, sentence):
+        """Decode a sentence (bytes, without CR LF), return the messages."""
+        if not nmea_checksum_ok(sentence):
+            return []
+        fields = polystr(sentence[:sentence.rfind(b'*')]).split(',')
+        talker, kind = fields[0][1:3], fields[0][3:]
+        if kind in ('RMC', 'GGA'):
+            return self._rmc_gga(kind, fields)
+        if kind == 'GSA':
+            self._gsa(talker, fields)
+        elif kind == 'GSV':
+            self._gsv(talker, fields)
+        return []
+
+
+class streamclient(object):
+    """A connected client: its socket, buffers and WATCH options."""
+
+    def __init__(self, sock, address):
+        """Init streamclient."""
+        self.sock = sock
+        self.address = address
+        self.inbuf = b''
+        self.outbuf = bytearray()
+        self.watch = False
+        self.json = False
+        self.nmea = False
+        self.classes = None     # None: all the classes
+        self.sent = 0
+        self.writing = False    # registered for EVENT_WRITE
+
+    def wants(self, msg_class):
+        """Check if the client receives this message class."""
+        if msg_class is None:
+            return self.watch and self.nmea
+        return self.watch and self.json and \
+            (self.classes is None or msg_class in self.classes)
+
+
+class streamserver(object):
+    """Read a gpsd or NMEA stream once, serve it to many gpsd clients."""
+
+    def __init__(self,
+                 source_host='127.0.0.1',
+                 source_port=gps.GPSD_PORT,
+                 source_type='gpsd',
+                 listen_host='127.0.0.1',
+                 listen_port=STREAM_PORT,
+                 max_backlog=MAX_BACKLOG,
+                 verbose=0):
+        """Arguments:
+            source_host, source_port: the stream to read;
+            source_type: 'gpsd' (JSON stream) or 'nmea';
+            listen_host, listen_port: the address of the server;
+            max_backlog: the bytes waiting for a client before it is
+                disconnected;
+            verbose: verbosity level.
+"""
+        assert source_type in ('gpsd', 'nmea')
+        self.source_host = source_host
+        self.source_port = int(source_port)
+        self.source_type = source_type
+        self.device = '%s://%s:%s' % (source_type, source_host,
+                                      self.source_port)
+        self.max_backlog = max_backlog
+        self.verbose = verbose
+        # gpscommon for the buffered line reading, gpsjson for the decoding
+        self.source = gpscommon(host=None, port=None, verbose=verbose)
+        self.json = gpsjson()
+        self.decoder = nmeadecoder(self.device)
+        self.next_connect = 0
+        self.selector = selectors.DefaultSelector()
+        self.listener = socket.create_server((listen_host, listen_port))
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ,
+                               self._accept)
+        self.clients = {}
+        self.version = {'class': 'VERSION', 'release': gps.__version__,
+                        'rev': 'rtkbase streamserver',
+                        'proto_major': PROTO_MAJOR,
+                        'proto_minor': PROTO_MINOR}
+        self.devices = None     # last DEVICES of a gpsd source
+        self.last = {}          # class -> last message (encoded)
+        self.stats = {'messages': 0, 'bytes': 0, 'dropped_clients': 0,
+                      'bad_lines': 0}
+
+    def log(self, level, message):
+        """Print a message depending on the verbosity."""
+        if self.verbose >= level:
+            sys.stderr.write('streamserver: %s\n' % message)
+
+    # source
+
+    def _connect_source(self):
+        """Try to connect to the source."""
+        self.next_connect = time.monotonic() + RECONNECT_DELAY
+        try:
+            self.source.connect(self.source_host, self.source_port)
+        except socket.error as e:
+            self.log(1, 'source %s: %s' % (self.device, e))
+            return
+        self.log(1, 'connected to %s' % self.device)
+        if self.source_type == 'gpsd':
+            self.source.send('?WATCH={"enable":true,"json":true}')
+        self.selector.register(self.source.sock, selectors.EVENT_READ,
+                               self._read_source)
+
+    def _close_source(self):
+        """Close the source, it is reconnected later."""
+        if self.source.sock is not None:
+            self.selector.unregister(self.source.sock)
+        self.source.close()
+        self.source.buf_start = self.source.buf_end = 0
+        self.log(1, 'disconnected from %s' % self.device)
+
+    def _read_source(self, _sock):
+        """Read and dispatch all the complete lines received."""
+        if self.source.sock is None:
+            return
+        try:
+            count = self.source._fill()     # pylint: disable=W0212
+        except socket.error:
+            count = 0
+        if not count:
+            self._close_source()
+            return
+        # read() only returns the complete lines already in the buffer
+        while self.source.buf.find(b'\n', self.source.buf_start,
+                                   self.source.buf_end) != -1:
+            self.source.read()
+            self._source_line(self.source.line)
+
+    def _source_line(self, line):
+        """Decode a line of the source and send it to the subscribers."""
+        line = bytes(line).rstrip(b'\r\n')
+        if not line:
+            return
+        if self.source_type == 'nmea':
+            if line[:1] not in (b'$', b'!'):
+                self.stats['bad_lines'] += 1
+                return
+            self.publish(None, line + b'\r\n')
+            for message in self.decoder.decode(line):
+                self.publish_message(dictwrapper(message))
+            return
+        try:
+            self.json.unpack(line)
+        except json_error:
+            self.stats['bad_lines'] += 1
+            return
+        data = self.json.data
+        msg_class = data.get('class')
+        if msg_class == 'VERSION':
+            # our own VERSION is sent to the clients, not the source one
+            self.version['release'] = data.get('release',
+                                               self.version['release'])
+            return
+        if msg_class == 'WATCH':
+            return
+        line += b'\r\n'
+        if msg_class == 'DEVICES':
+            self.devices = line
+        self.last[msg_class] = line
+        # forwarded as received, the source JSON is not encoded again
+        self.publish(msg_class, line)
+
+    # clients
+
+    def _accept(self, _sock):
+        """Accept a new client and send the VERSION banner."""
+        try:
+            sock, address = self.listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        sock.setblocking(False)
+        client = streamclient(sock, address)
+        self.clients[sock] = client
+        self.selector.register(sock, selectors.EVENT_READ,
+                               self._read_client)
+        self.log(1, 'client %s:%s connected' % address[:2])
+        self._send(client, self._encode(self.version))
+
+    def _drop_client(self, client, reason=''):
+        """Disconnect a client."""
+        if client.sock not in self.clients:
+            return
+        del self.clients[client.sock]
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        self.log(1, 'client %s:%s disconnected %s' %
+                 (client.address[0], client.address[1], reason))
+
+    def _read_client(self, sock):
+        """Read the commands of a client."""
+        client = self.clients.get(sock)
+        if client is None:
+            # dropped by a previous event of the same select()
+            return
+        try:
+            data = sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error:
+            data = b''
+        if not data:
+            self._drop_client(client)
+            return
+        client.inbuf += data
+        if len(client.inbuf) > 8192:
+            self._drop_client(client, '(command too long)')
+            return
+        # the commands end with ';' or a new line
+        *commands, client.inbuf = re.split(rb'[;\r\n]', client.inbuf)
+        for command in commands:
+            if command.strip():
+                self._command(client, command.strip())
+
+    def _command(self, client, command):
+        """Execute a client command."""
+        match = COMMAND_RE.match(command)
+        if match is None:
+            self._error(client, 'Unrecognized request')
+            return
+        name = polystr(match.group(1))
+        try:
+            args = json.loads(match.group(2)) if match.group(2) else {}
+        except ValueError:
+            self._error(client, 'Invalid %s argument' % name)
+            return
+        if not isinstance(args, dict):
+            self._error(client, 'Invalid %s argument' % name)
+        elif name == 'VERSION':
+            self._send(client, self._encode(self.version))
+        elif name == 'DEVICES':
+            self._send(client, self._devices())
+        elif name == 'WATCH':
+            self._watch(client, args)
+        elif name == 'POLL':
+            self._send(client, self._encode(self._poll()))
+        else:
+            self._error(client, "Unrecognized request '%s'" % name)
+
+    def _watch(self, client, args):
+        """Change the WATCH options of a client."""
+        client.watch = bool(args.get('enable', True))
+        if 'json' in args:
+            client.json = bool(args['json'])
+        if 'nmea' in args:
+            client.nmea = bool(args['nmea'])
+        if client.watch and not client.nmea:
+            client.json = args.get('json', True) is not False
+        classes = args.get('classes')
+        if isinstance(classes, str):
+            classes = [classes]
+        if classes is not None:
+            client.classes = set(classes) or None
+        if client.watch:
+            self._send(client, self._devices())
+        watch = {'class': 'WATCH', 'enable': client.watch,
+                 'json': client.json, 'nmea': client.nmea,
+                 'raw': 0, 'scaled': False, 'timing': False,
+                 'split24': False, 'pps': False}
+        if client.classes is not None:
+            watch['classes'] = sorted(client.classes)
+        self._send(client, self._encode(watch))
+
+    def _devices(self):
+        """Return the encoded DEVICES message."""
+        if self.devices is not None:
+            return self.devices
+        device = {'class': 'DEVICE', 'path': self.device,
+                  'driver': 'NMEA0183', 'activated':
+                  time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())}
+        return self._encode({'class': 'DEVICES',
+                             'devices': [device] if self.source.sock
+                             else []})
+
+    def _poll(self):
+        """Return the POLL message with the last TPV and SKY."""
+        return {'class': 'POLL',
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                                      time.gmtime()),
+                'active': 1 if 'TPV' in self.last else 0,
+                'tpv': [json.loads(self.last['TPV'])] if 'TPV' in self.last
+                else [],
+                'sky': [json.loads(self.last['SKY'])] if 'SKY' in self.last
+                else []}
+
+    def _error(self, client, message):
+        """Send an ERROR message to a client."""
+        self._send(client, self._encode({'class': 'ERROR',
+                                         'message': message}))
+
+    @staticmethod
+    def _encode(message):
+        """Encode a message as a JSON line."""
+        return json.dumps(message, separators=(',', ':')).encode() + b'\r\n'
+
+    # non-blocking writes
+
+    def _send(self, client, data):
+        """Queue data for a client and send what the socket accepts."""
+        if client.outbuf:
+            client.outbuf += data
+        else:
+            try:
+                sent = client.sock.send(data)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except socket.error:
+                self._drop_client(client, '(write error)')
+                return
+            client.sent += sent
+            if sent < len(data):
+                client.outbuf += data[sent:]
+        if len(client.outbuf) > self.max_backlog:
+            self.stats['dropped_clients'] += 1
+            self._drop_client(client, '(too slow)')
+        elif client.outbuf and not client.writing:
+            client.writing = True
+            self.selector.modify(client.sock, selectors.EVENT_READ |
+                                 selectors.EVENT_WRITE, self._client_event)
+
+    def _client_event(self, sock, mask=selectors.EVENT_READ):
+        """Read or write event of a client with a backlog."""
+        client = self.clients.get(sock)
+        if client is not None and mask & selectors.EVENT_WRITE:
+            self._flush_client(client)
+        if sock in self.clients and mask & selectors.EVENT_READ:
+            self._read_client(sock)
+
+    def _flush_client(self, client):
+        """Send the backlog of a client."""
+        try:
+            sent = client.sock.send(client.outbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error:
+            self._drop_client(client, '(write error)')
+            return
+        client.sent += sent
+        del client.outbuf[:sent]
+        if not client.outbuf:
+            client.writing = False
+            self.selector.modify(client.sock, selectors.EVENT_READ,
+                                 self._read_client)
+
+    def publish(self, msg_class, data):
+        """Send an encoded message to the clients watching its class.
+
+        msg_class is None for the NMEA sentences.
+"""
+        self.stats['messages'] += 1
+        for client in list(self.clients.values()):
+            if client.wants(msg_class):
+                self.stats['bytes'] += len(data)
+                self._send(client, data)
+
+    def publish_message(self, message):
+        """Encode a decoded message once and send it."""
+        data = self._encode(message.__dict__)
+        self.last[message['class']] = data
+        self.publish(message['class'], data)
+
+    # main loop
+
+    def run_once(self, timeout=1.0):
+        """Wait for the events and handle them."""
+        if self.source.sock is None and \
+                time.monotonic() >= self.next_connect:
+            self._connect_source()
+        for key, mask in self.selector.select(timeout):
+            if key.data == self._client_event:
+                key.data(key.fileobj, mask)
+            else:
+                key.data(key.fileobj)
+
+    def serve_forever(self):
+        """Serve the clients until interrupted."""
+        try:
+            while True:
+                self.run_once()
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the source and all the connections."""
+        for client in list(self.clients.values()):
+            self._drop_client(client)
+        if self.source.sock is not None:
+            self._close_source()
+        self.selector.unregister(self.listener)
+        self.listener.close()
+        self.selector.close()
+
+
+def _address(value, default_port):
+    """Split a [type://]host:port argument."""
+    source_type, _, address = value.rpartition('://')
+    host, _, port = address.rpartition(':')
+    if not host:
+        host, port = address, default_port
+    return source_type or None, host, int(port)
+
+
+def main():
+    """Run the server from the command line."""
+    parser = argparse.ArgumentParser(
+        description='Serve a gpsd or NMEA stream to many gpsd clients.')
+    parser.add_argument('--source', default='gpsd://127.0.0.1:2947',
+                        help='gpsd://host:port or nmea://host:port '
+                        '(default: %(default)s)')
+    parser.add_argument('--listen', default='127.0.0.1:%s' % STREAM_PORT,
+                        help='host:port of the server (default: %(default)s)')
+    parser.add_argument('--max-backlog', type=int, default=MAX_BACKLOG,
+                        help='bytes waiting for a client before it is '
+                        'disconnected (default: %(default)s)')
+    parser.add_argument('-v', '--verbose', action='count', default=0)
+    args = parser.parse_args()
+    source_type, source_host, source_port = _address(args.source,
+                                                     gps.GPSD_PORT)
+    _listen_type, listen_host, listen_port = _address(args.listen,
+                                                      STREAM_PORT)
+    server = streamserver(source_host, source_port, source_type or 'gpsd',
+                          listen_host, listen_port, args.max_backlog,
+                          args.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
+
+# vim: set expandtab shiftwidth=4
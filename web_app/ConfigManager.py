@@ -24,6 +24,7 @@
 from reach_tools import reach_tools
 
 import os
+from collections import namedtuple
 from glob import glob
 from shutil import copy, Error
 
@@ -32,8 +33,19 @@ from shutil import copy, Error
 # Note that on startup it reads on of the default configs
 # and keeps the order of settings, stored there
 
+# a parsed config file:
+# lines: the file lines, comments included
+# items: the items (see Config.__init__) in the file order
+# item_lines: the line number of each item
+# parameters: {parameter : item number}
+ParsedConfig = namedtuple("ParsedConfig", ["mtime", "size", "lines", "items", "item_lines", "parameters"])
+
 class Config:
 
+    # parsed files cache {path : ParsedConfig}, a file is parsed again only when
+    # its modification time or size changes
+    parsed_files = {}
+
     def __init__(self, file_name = None, items = None):
         # we keep all the options for current config file and their order here
 
@@ -60,11 +72,15 @@ class Config:
         else:
             self.items = items
 
+        # the file read, to keep its comments and layout when writing
+        self.source = None
+
         # if we pass the file to the constructor, then read the values
         if file_name is not None:
             self.readFromFile(file_name)
 
-    def formStringFromItem(self, item):
+    @staticmethod
+    def formStringFromItem(item):
         # form a line to put into a RTKLIB config file:
 
         # item must be a dict, described in the __init__ method comments!
@@ -88,53 +104,112 @@ class Config:
         else:
             return ""
 
-    def extractItemFromString(self, string):
-        # extract information from a config file line
-        # return true, if the line
+    @staticmethod
+    def extractItemFromString(string):
+        # extract information from a config file line:
+        # parameter =value # comment ## description
+        # like RTKLIB, the value ends at the first "#"
 
         # create an empty item
         item = {}
 
-        # cut the line into pieces by spaces
-        separated_lines = string.split()
-        length = len(separated_lines)
-
-        # first, check if this line is empty
-        if length > 0:
-
-            # second, check if it's fully commented
-            if separated_lines[0][0] != "#":
-
-                # extract the parameter and value
-                item["parameter"] = separated_lines[0]
-                item["value"] = separated_lines[1][1:]
+        string = string.strip()
 
-                # check if we have more info, possibly useful comment
-                if length > 3 and separated_lines[2] == "#":
-                    item["comment"] = separated_lines[3]
+        # check if this line is empty or fully commented
+        if not string or string[0] == "#":
+            return item
 
-                    # check if we have more info, possibly description
-                    if length > 5 and separated_lines[4] == "##":
-                        # in order to have a description with spaces, we take all what's left
-                        # after the "##" symbols and create a single line out of it:
-                        description = separated_lines[5:]
-                        description = " ".join(description)
-                        item["description"] = description
+        parameter, equal, rest = string.partition("=")
+        if not equal:
+            return item
 
-                # check if we have only a description, rather than a comment and description
-                if length >3 and separated_lines[2] == "##":
-                    description = separated_lines[3:]
-                    description = " ".join(description)
-                    item["description"] = description
+        value, comment_mark, comment = rest.partition("#")
+        item["parameter"] = parameter.strip()
+        item["value"] = value.strip()
 
-                # add information about available serial connections to input and output paths
-                if "path" in item["parameter"]:
-                    item["comment"] = self.formSelectCommentFromList(reach_tools.getAvailableSerialPorts())
+        if comment_mark:
+            # "##" starts a description, with or without a comment before it
+            comment, _, description = comment.partition("##")
+            comment = comment.strip()
+            description = description.strip()
+            if comment:
+                item["comment"] = comment
+            if description:
+                item["description"] = description
 
         # we return the item we managed to extract form from string. if it's empty,
         # then we could not parse the string, hence it's empty, commented, or invalid
         return item
 
+    @classmethod
+    def parseFile(cls, path):
+        # read and parse a config file in a single pass, or get it from the cache
+        stat = os.stat(path)
+        parsed = cls.parsed_files.get(path)
+        if parsed is not None and parsed.mtime == stat.st_mtime_ns and parsed.size == stat.st_size:
+            return parsed
+
+        with open(path, "r") as f:
+            lines = f.readlines()
+
+        items = []
+        item_lines = []
+        parameters = {}
+        for line_number, line in enumerate(lines):
+            item = cls.extractItemFromString(line)
+            if item:
+                parameters.setdefault(item["parameter"], len(items))
+                items.append(item)
+                item_lines.append(line_number)
+
+        parsed = ParsedConfig(stat.st_mtime_ns, stat.st_size, tuple(lines), tuple(items), tuple(item_lines), parameters)
+        cls.parsed_files[path] = parsed
+        return parsed
+
+    @classmethod
+    def storeFile(cls, path, lines, items, item_lines, parameters):
+        # write the lines to a file and keep them as its parsed content, without reading it again
+        with open(path, "w") as f:
+            f.writelines(lines)
+        stat = os.stat(path)
+        cls.parsed_files[path] = ParsedConfig(stat.st_mtime_ns, stat.st_size, tuple(lines), tuple(items), tuple(item_lines), parameters)
+
+    @classmethod
+    def updateFile(cls, path, changes):
+        # partial update: only the lines of the changed parameters are rewritten
+        # changes = {parameter: new value (str) or a complete item (dict)}
+        # return the number of lines updated, None if a parameter is missing
+        parsed = cls.parseFile(path)
+        if any(parameter not in parsed.parameters for parameter in changes):
+            return None
+
+        lines = list(parsed.lines)
+        items = list(parsed.items)
+        for parameter, change in changes.items():
+            item_number = parsed.parameters[parameter]
+            line_number = parsed.item_lines[item_number]
+            if isinstance(change, dict):
+                items[item_number] = dict(change)
+                lines[line_number] = cls.formStringFromItem(change) + "\n"
+            else:
+                items[item_number] = dict(items[item_number], value=change)
+                lines[line_number] = cls.replaceValueInString(lines[line_number], change)
+
+        cls.storeFile(path, lines, items, parsed.item_lines, parsed.parameters)
+        return len(changes)
+
+    @staticmethod
+    def replaceValueInString(string, value):
+        # change the value of a config line, keeping the alignment and the comments
+        line_end = string[len(string.rstrip("\r\n")):]
+        string = string.rstrip("\r\n")
+        equal = string.index("=")
+        comment_start = string.find("#", equal)
+        if comment_start < 0:
+            return string[:equal + 1] + value + line_end
+        value_field = string[equal + 1:comment_start]
+        return string[:equal + 1] + (value + " ").ljust(len(value_field)) + string[comment_start:] + line_end
+
     def formSelectCommentFromList(self, items_list):
         comment = ""
 
@@ -151,17 +226,14 @@ class Config:
     def parseBluetoothEntries(self, config_dict):
         # check if anything is set as a tcpsvr with path :8143
         # and change it to bluetooth
-        entries_with_bt_port = {k: v for (k, v) in config_dict.items() if v["value"] == "localhost:8143"}
-
-        for entry in entries_with_bt_port.keys():
-            # can be log or out or in
-            io_field = entries_with_bt_port[entry]["parameter"].split("-")[0]
+        # can be log or out or in
+        io_fields = [v["parameter"].split("-")[0] for v in config_dict.values() if v["value"] == "localhost:8143"]
 
+        if io_fields:
             # find the corresponding io type
-            io_type_entries = {k: v for (k, v) in config_dict.items() if io_field + "-type" in v["parameter"]}
-
-            for key in io_type_entries.keys():
-                config_dict[key]["value"] = "bluetooth"
+            for item in config_dict.values():
+                if any(io_field + "-type" in item["parameter"] for io_field in io_fields):
+                    item["value"] = "bluetooth"
 
         return config_dict
 
@@ -177,25 +249,17 @@ class Config:
         # save file name as current
         self.current_file_name = from_file
 
-        # clear previous data
-        self.items = {}
-        items_dict = {}
+        parsed = self.parseFile(from_file)
+        self.source = parsed
 
-        # current item container
-        item = {}
+        # the cached items are copied, the caller can change them
+        items_dict = {str(i): dict(item) for i, item in enumerate(parsed.items)}
 
-        with open(from_file, "r") as f:
-            i = 0
-            for line in f:
-                # we mine for info in every line of the file
-                # if the info is valid, we add this item to the items dict
-                item = self.extractItemFromString(line)
-
-                if item:
-                    # save the info as {"0": item0, ...}
-                    items_dict[str(i)] = item
-
-                    i += 1
+        # add information about available serial connections to input and output paths
+        serial_ports_comment = self.formSelectCommentFromList(reach_tools.getAvailableSerialPorts())
+        for item in items_dict.values():
+            if "path" in item["parameter"]:
+                item["comment"] = serial_ports_comment
 
         self.items = self.processConfig(items_dict)
 
@@ -222,12 +286,29 @@ class Config:
             else:
                 items_list[int_item_number] = self.items[item_number]
 
+        # keep the comments and the layout of the file read, or of the existing file
+        source = self.source
+        if source is None and os.path.isfile(to_file):
+            source = self.parseFile(to_file)
+
+        if source is not None and len(source.items) == len(items_list) and \
+                all(item and item["parameter"] == source_item["parameter"] for item, source_item in zip(items_list, source.items)):
+            lines = list(source.lines)
+            items = list(source.items)
+            for item_number, (item, line_number) in enumerate(zip(items_list, source.item_lines)):
+                # only the changed values are written, the comments and the alignment are kept
+                if item["value"] != items[item_number]["value"]:
+                    items[item_number] = dict(items[item_number], value=item["value"])
+                    lines[line_number] = self.replaceValueInString(lines[line_number], item["value"])
+            self.storeFile(to_file, lines, items, source.item_lines, source.parameters)
+            return
+
+        lines = ["# rtkrcv options for rtk (v.2.4.2)\n", "\n"]
+        lines.extend(self.formStringFromItem(item) + "\n" for item in items_list)
         with open(to_file, "w") as f:
-            line = "# rtkrcv options for rtk (v.2.4.2)"
-            f.write(line + "\n\n")
-
-            for item in items_list:
-                f.write(self.formStringFromItem(item) + "\n")
+            f.writelines(lines)
+        # the layout changed, the file will be parsed again on its next read
+        self.parsed_files.pop(to_file, None)
 
 class ConfigManager:
 
@@ -239,6 +320,8 @@ class ConfigManager:
         self.default_base_config = "rtkbase_base_default.conf"
 
         self.available_configs = []
+        # modification time of the config directory when available_configs was built
+        self.available_configs_mtime = None
         self.updateAvailableConfigs()
 
         # create a buffer for keeping config data
@@ -246,44 +329,49 @@ class ConfigManager:
 
         self.buffered_config = Config(os.path.join(self.config_path, self.default_rover_config))
 
+    def configFilePath(self, config_name):
+        # check if this is a full path or just a name
+        # if it's a name, then we use the default location
+        if "/" in config_name:
+            return config_name
+        return os.path.join(self.config_path, config_name)
+
     def updateAvailableConfigs(self):
 
-        self.available_configs = []
+        # the directory is listed again only after a config is added or removed
+        try:
+            mtime = os.stat(self.config_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self.available_configs_mtime:
+            return
 
         # get a list of available .conf files in the config directory
-        configs = glob(self.config_path + "*.conf")
-        self.available_configs = [os.path.basename(config) for config in configs]
-
+        configs = glob(os.path.join(self.config_path, "*.conf"))
+        available_configs = sorted(os.path.basename(config) for config in configs)
 
         # we do not show the base config
         try:
-            self.available_configs.remove(self.default_base_config)
-        except:
+            available_configs.remove(self.default_base_config)
+        except ValueError:
             pass
 
+        self.available_configs = available_configs
+        self.available_configs_mtime = mtime
+
     def readConfig(self, from_file):
 
         if from_file is None:
             from_file = self.default_rover_config
 
-        # check if this is a full path or just a name
-        # if it's a name, then we use the default location
-        if "/" in from_file:
-            config_file_path = from_file
-        else:
-            config_file_path = self.config_path + from_file
-
-        self.buffered_config.readFromFile(config_file_path)
+        self.buffered_config.readFromFile(self.configFilePath(from_file))
 
     def writeConfig(self, to_file = None, config_values = None):
 
         if to_file is None:
             to_file = self.default_rover_config
 
-        # check if this is a full path or just a name
-        # if it's a name, then we use the default location
-        if "/" not in to_file:
-            to_file = self.config_path + to_file
+        to_file = self.configFilePath(to_file)
 
         # do the actual writing
 
@@ -297,10 +385,7 @@ class ConfigManager:
 
     def resetConfigToDefault(self, config_name):
         # try to copy default config to the working configs directory
-        if "/" not in config_name:
-            default_config_value = self.config_path + config_name
-        else:
-            default_config_value = config_name
+        default_config_value = self.configFilePath(config_name)
 
         try:
             copy(default_config_value, self.config_path)
@@ -311,58 +396,40 @@ class ConfigManager:
 
     def deleteConfig(self, config_name):
         # try to delete config if it exists
-        if "/" not in config_name:
-            config_name = self.config_path + config_name
+        config_name = self.configFilePath(config_name)
 
         try:
             os.remove(config_name)
         except OSError as e:
             print ("Error: " + e.filename + " - " + e.strerror)
+        Config.parsed_files.pop(config_name, None)
 
     def readItemFromConfig(self, property, from_file):
         # read a complete item from config, found by "parameter part"
 
-        conf = Config(self.config_path + from_file)
-
-        # cycle through this config to find the needed option
-        for item_number in conf.items:
-            if conf.items[item_number]["parameter"] == property:
-                # in case we found it
-                return conf.items[item_number]
-
-        # in case we didn't
-        return None
-
-    def writeItemToConfig(self, item, to_file):
-        # write a complete item to the file
-
-        # first we read the whole file
-        conf = Config(self.config_path + to_file)
-
-        # then we substitute the one property
-        # cycle through this config to find the needed option
-        for item_number in conf.items:
-            if conf.items[item_number]["parameter"] == item["parameter"]:
-                # in case we found it
-                conf.items[item_number] = item
-
-                # rewrite the file again:
-                self.writeConfig(to_file, conf.items)
-                return 1
-                break
+        parsed = Config.parseFile(self.configFilePath(from_file))
+        item_number = parsed.parameters.get(property)
 
         # in case we didn't find it
-        return None
-
-
-
-
-
-
+        if item_number is None:
+            return None
 
+        return dict(parsed.items[item_number])
 
+    def writeItemToConfig(self, item, to_file):
+        # write a complete item to the file, only its line is rewritten
+        # return None if the file doesn't contain this property
 
+        if Config.updateFile(self.configFilePath(to_file), {item["parameter"]: item}) is None:
+            return None
 
+        return 1
 
+    def writeOptionToConfig(self, option_name, option_value, to_file):
+        # change the value of an option in the file, only its line is rewritten
+        # return None if the file doesn't contain this option
 
+        if Config.updateFile(self.configFilePath(to_file), {option_name: option_value}) is None:
+            return None
 
+        return 1
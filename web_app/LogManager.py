@@ -26,10 +26,11 @@ import math
 from glob import glob
 
 from log_converter import convbin
+from log_converter.log_compression import DEFAULT_RINEX_COMPRESSION
 
 class LogManager():
 
-    supported_solution_formats = ["llh", "xyz", "enu", "nmea", "erb", "zip", "bz2", "tar", "tag"]
+    supported_solution_formats = ["llh", "xyz", "enu", "nmea", "erb", "zip", "bz2", "tar", "tag", "gz", "xz", "zst"]
 
     def __init__(self, rtklib_path, log_path):
 
@@ -38,12 +39,16 @@ class LogManager():
 
         self.log_being_converted = ""
 
+        # compression used for the RINEX packages (see log_compression.py)
+        self.rinex_compression = DEFAULT_RINEX_COMPRESSION
+
+        # filled by updateAvailableLogs(), in background during the web server startup
         self.available_logs = []
-        self.updateAvailableLogs()
 
     def updateAvailableLogs(self):
 
-        self.available_logs = []
+        # the list is built aside, the readers never get a partial list
+        available_logs = []
 
         print("Getting a list of available logs")
         for log in glob(self.log_path + "/*"):
@@ -57,20 +62,21 @@ class LogManager():
             log_format = self.getLogFormat(log)
             is_being_converted = True if log == self.log_being_converted else False
 
-            self.available_logs.append({
+            available_logs.append({
                 "name": log_name,
                 "size": log_size,
                 "format": log_format,
                 "is_being_converted": is_being_converted
             })
 
-            self.available_logs.sort(key = lambda date: date['name'], reverse = True)
-        
+        available_logs.sort(key = lambda date: date['name'], reverse = True)
+
         #Adding an id to each log
         id = 0
-        for log in self.available_logs:
+        for log in available_logs:
             log['id'] = id
             id += 1
+        self.available_logs = available_logs
 
         
     """
@@ -16,6 +16,7 @@ class RTKBaseConfigManager:
         self.user_settings_path = user_settings_path
         self.default_settings_path = default_settings_path
         self.config = None
+        self.settings_mtime = None
         self.merge_default_and_user(default_settings_path, user_settings_path)
         self.expand_path()
         self.write_file(self.config)
@@ -80,6 +81,24 @@ class RTKBaseConfigManager:
         config = ConfigParser(interpolation=None)
         config.read(settings_path)
         self.config=config
+        self.settings_mtime = self._get_mtime()
+
+    def _get_mtime(self):
+        try:
+            return os.stat(self.user_settings_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload_if_modified(self):
+        """
+            Reload the settings if settings.conf was modified by another process
+            (ie the other web server workers)
+            :return: True if the settings were reloaded
+        """
+        if self._get_mtime() != self.settings_mtime:
+            self.reload_settings()
+            return True
+        return False
 
     def expand_path(self):
         """
@@ -302,3 +321,4 @@ class RTKBaseConfigManager:
 
         with open(self.user_settings_path, "w") as configfile:
             settings.write(configfile, space_around_delimiters=False)
+        self.settings_mtime = self._get_mtime()
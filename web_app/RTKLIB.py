@@ -37,6 +37,8 @@ import zipfile
 from subprocess import check_output, Popen, PIPE
 from threading import Semaphore, Thread
 
+import profiling
+
 # master class for working with all RTKLIB programmes
 # prevents them from stacking up and handles errors
 # also handles all data broadcast through websockets
@@ -81,6 +83,11 @@ class RTKLIB:
         # we need this to broadcast stuff
         self.socketio = socketio
 
+        # an api_snapshot.StateSnapshot storing the last broadcasted values for the api
+        self.snapshot = None
+        # a broadcast_bus.BroadcastBus sending the live data to the clients
+        self.bus = None
+
         # these are necessary to handle rover mode
         self.rtkc = RtkController(rtklib_path, self.config_path)
         self.conm = ConfigManager(rtklib_path, self.config_path)
@@ -407,6 +414,7 @@ class RTKLIB:
 
             print("Canceled msg sent")
 
+    @profiling.timed("logs.processLogPackage")
     def processLogPackage(self, raw_log_path):
 
         currently_converting = False
@@ -536,7 +544,8 @@ class RTKLIB:
 
         self.socketio.emit("log conversion start", start_package, namespace="/test")
         try:
-            log = self.logm.convbin.convertRTKLIBLogToRINEX(raw_log_path, self.logm.getRINEXVersion())
+            with profiling.timer("logs.convbin"):
+                log = self.logm.convbin.convertRTKLIBLogToRINEX(raw_log_path, self.logm.getRINEXVersion())
         except (ValueError, IndexError):
             print("Conversion canceled")
             conversion_result_package["conversion_status"] = "Conversion canceled, downloading raw log"
@@ -546,7 +555,7 @@ class RTKLIB:
         print("Log conversion done!")
 
         if log is not None:
-            result = log.createLogPackage()
+            result = log.createLogPackage(compression = self.logm.rinex_compression)
             if log.isValid():
                 conversion_result_package["conversion_status"] = "Log converted to RINEX"
                 conversion_result_package["messages_parsed"] = log.log_metadata.formValidMessagesString()
@@ -694,6 +703,27 @@ class RTKLIB:
         self.socketio.emit("current state", state, namespace = "/test")
 
 
+    def broadcast(self, topic, payload):
+        """ Send live data to the clients, with the broadcast bus if available """
+        if self.bus is not None:
+            self.bus.publish(topic, payload)
+        else:
+            self.socketio.emit(topic, payload, namespace = "/test")
+
+    @staticmethod
+    def compactLevels(obs):
+        """
+            Convert the satellite levels to integers ("42.0" -> 42), smaller to send
+            than the strings read from rtkrcv (the chart uses integer levels)
+        """
+        levels = {}
+        for name, level in obs.items():
+            try:
+                levels[name] = round(float(level))
+            except (TypeError, ValueError):
+                levels[name] = 0
+        return levels
+
     # this function reads satellite levels from an existing rtkrcv instance
     # and emits them to the connected browser as messages
     def broadcastSatellites(self):
@@ -723,7 +753,9 @@ class RTKLIB:
                 del(self.rtkc.obs_rover["gps_time"])
             except:
                 pass
-            self.socketio.emit("satellite broadcast rover", self.rtkc.obs_rover, namespace = "/test")
+            self.broadcast("satellite broadcast rover", self.compactLevels(self.rtkc.obs_rover))
+            if self.snapshot is not None:
+                self.snapshot.update("satellites", self.rtkc.obs_rover)
             #self.socketio.emit("satellite broadcast base", self.rtkc.obs_base, namespace = "/test")
             count += 1
             self.sleep_count +=1
@@ -753,7 +785,9 @@ class RTKLIB:
 #                print("Sending RTKLIB status select information:")
 #                print(self.rtkc.status)
 
-            self.socketio.emit("coordinate broadcast", self.rtkc.status, namespace = "/test")
+            self.broadcast("coordinate broadcast", self.rtkc.status)
+            if self.snapshot is not None:
+                self.snapshot.update("rtkrcv", self.rtkc.status)
 
 #            if self.enable_led:
 #                self.updateLED()
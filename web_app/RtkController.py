@@ -24,9 +24,13 @@
 import os
 import time
 import signal
-import pexpect
 from threading import Semaphore, Thread
 
+import profiling
+import startup
+
+pexpect = startup.lazy_import("pexpect")
+
 # This module automates working with RTKRCV directly
 # You can get sat levels, current status, start and restart the software
 
@@ -223,6 +227,7 @@ class RtkController:
 
         return 1
 
+    @profiling.timed("rtkrcv.getStatus")
     def getStatus(self):
 
         if not self.launched:
@@ -253,6 +258,7 @@ class RtkController:
 
         return 1
 
+    @profiling.timed("rtkrcv.getObs")
     def getObs(self):
 
         self.semaphore.acquire()
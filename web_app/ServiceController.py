@@ -1,19 +1,36 @@
 import os
-from pystemd.systemd1 import Unit
-from pystemd.systemd1 import Manager
+
+import startup
+
+systemd1 = startup.lazy_import("pystemd.systemd1")
 
 class ServiceController(object):
     """
         A simple wrapper around pystemd to manage systemd services
+        The D-Bus objects are loaded on their first use, not during the web server startup.
     """
-    
-    manager = Manager(_autoload=True)
+
+    _manager = None
 
     def __init__(self, unit):
         """
             param: unit: a systemd unit name (ie str2str_tcp.service...)
         """
-        self.unit = Unit(bytes(unit, 'utf-8'), _autoload=True)
+        self.unit_name = unit
+        self._unit = None
+
+    @property
+    def unit(self):
+        if self._unit is None:
+            self._unit = systemd1.Unit(bytes(self.unit_name, 'utf-8'), _autoload=True)
+        return self._unit
+
+    @property
+    def manager(self):
+        # a single systemd manager shared by all the units
+        if ServiceController._manager is None:
+            ServiceController._manager = systemd1.Manager(_autoload=True)
+        return ServiceController._manager
         
     def isActive(self):
         if self.unit.Unit.ActiveState == b'active':
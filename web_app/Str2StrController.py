@@ -23,10 +23,12 @@
 
 import os
 import signal
-import pexpect
 from glob import glob
 
 from reach_tools import reach_tools
+import startup
+
+pexpect = startup.lazy_import("pexpect")
 
 # This module automates working with STR2STR software
 
@@ -0,0 +1,103 @@
+""" In-memory snapshot of the base station state, served by the /api/v1 routes.
+
+    The background probes (manager thread, rtkrcv broadcast threads) write the sections,
+    the api requests only read them, so polling the api never wakes up rtkrcv or D-Bus.
+    Each change of a section increments a global version number:
+    - the version is used as ETag, a request with a matching If-None-Match gets a 304
+    - ?since=<version> returns only the sections changed after this version
+"""
+
+import copy
+import threading
+import time
+
+# the only settings sent by the api {section : keys}. Positions, addresses, users,
+# mount names, passwords and keys are never sent.
+PUBLIC_SETTINGS = {"general" : ("version", "checkpoint_version", "web_port", "web_workers", "prerelease",
+                                "update_check_ttl", "cpu_temp_offset"),
+                   "main" : ("receiver", "receiver_format", "receiver_firmware", "receiver_carrier",
+                             "antenna_info", "tcp_port", "nmea_port"),
+                   "local_storage" : ("file_rotate_time", "file_overlap_time", "archive_rotate", "min_free_space",
+                                      "archive_compression", "archive_compression_by_type", "rinex_compression"),
+                   }
+
+class StateSnapshot:
+    """ Versioned store of the state sections ("status", "services", "satellites"...) """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.sections = {}
+        self.probes = {}
+
+    def update(self, name, data):
+        """
+            Store the new data of a section. The version changes only if the data changed.
+            :param name: the section name
+            :param data: the section data (must be json serializable)
+            :return the section version
+        """
+        now = time.time()
+        with self.lock:
+            section = self.sections.get(name)
+            if section is not None and section["data"] == data:
+                section["checked"] = now
+                return section["version"]
+            self.version += 1
+            self.sections[name] = {"version" : self.version, "updated" : now, "checked" : now, "data" : copy.deepcopy(data)}
+            return self.version
+
+    def register_probe(self, name, probe, ttl):
+        """
+            Register a function to refresh a section when it is requested and its data
+            is older than ttl. Used for the sections without a background thread.
+            :param name: the section name
+            :param probe: a function returning the section data
+            :param ttl: the maximum age of the data in seconds
+        """
+        self.probes[name] = (probe, ttl)
+
+    def _refresh(self, names):
+        for name in names:
+            if name not in self.probes:
+                continue
+            probe, ttl = self.probes[name]
+            section = self.sections.get(name)
+            if section is None or time.time() - section["checked"] > ttl:
+                try:
+                    self.update(name, probe())
+                except Exception as e:
+                    print("Api snapshot: can't refresh {}: {}".format(name, e))
+
+    def names(self):
+        return sorted(set(self.sections) | set(self.probes))
+
+    def get(self, names=None, since=0):
+        """
+            Get the sections changed after a version
+            :param names: a list of section names (None for all the sections)
+            :param since: only the sections with a version above this one are returned
+            :return a dict {"version" : the last version of these sections, "since" : since,
+                "sections" : {name : {"version", "updated", "data"}}}
+        """
+        names = self.names() if names is None else names
+        self._refresh(names)
+        with self.lock:
+            sections = {name : self.sections[name] for name in names if name in self.sections}
+            version = max([section["version"] for section in sections.values()], default=0)
+            return {"version" : version,
+                    "since" : since,
+                    "sections" : {name : {"version" : section["version"],
+                                          "updated" : section["updated"],
+                                          "data" : section["data"]}
+                                  for name, section in sections.items() if section["version"] > since}}
+
+def public_settings(config):
+    """
+        The settings listed in PUBLIC_SETTINGS
+        :param config: a RTKBaseConfigManager instance
+        :return a dict {section : {key : value}}
+    """
+    return {section : {key : config.config.get(section, key).strip("'") for key in keys
+                       if config.config.has_option(section, key)}
+            for section, keys in PUBLIC_SETTINGS.items() if config.config.has_section(section)}
@@ -0,0 +1,236 @@
+""" Broadcast bus for the live data sent to the web GUI (satellite levels, coordinates,
+    system informations, services status).
+
+    - the emitters publish the last value of a topic, nothing is sent when no client is connected
+    - every tick, the changed topics are sent together inside one "bus frame" event
+    - each topic payload is serialized once, and a payload identical to the previous one is skipped
+    - each client has its own minimum interval between two frames (slow or metered links),
+      it receives the last value of the topics changed since its previous frame
+    - the messages and bytes sent are counted by topic
+    - a client can ask for MessagePack binary frames instead of json (if msgpack is installed)
+    - when a dict payload keeps the same keys, only the changed values are sent (delta)
+      and the browser merges them with the previous payload
+
+    A frame is [{topic : payload}, [topics sent as json string], [delta topics]].
+    On the browser side, the frame is dispatched to the socket.on(<topic>) handlers,
+    so a topic is received like a normal socketio event. The topics published with
+    json_string=True are stringified by the browser for the handlers expecting a json
+    string, they aren't double encoded on the network.
+"""
+
+import copy
+import json
+import threading
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FRAME_EVENT = "bus frame"
+MAX_CLIENT_INTERVAL = 60
+ENCODINGS = ("json", "msgpack") if msgpack is not None else ("json",)
+
+def _msgpack_map_header(size):
+    if size < 16:
+        return bytes([0x80 | size])
+    return b"\xde" + size.to_bytes(2, "big")
+
+def _encode(payload, encoding):
+    if encoding == "msgpack":
+        return msgpack.packb(payload, use_bin_type=True)
+    return json.dumps(payload, separators=(",", ":"))
+
+def build_frame(parts, json_topics, delta_topics, encoding):
+    """
+        Assemble a frame from the topic payloads already encoded
+        :param parts: a list of (topic, encoded payload)
+        :param json_topics: the topics the browser must convert to a json string
+        :param delta_topics: the topics containing only the changed values
+        :param encoding: "json" or "msgpack"
+        :return the frame (str or bytes)
+    """
+    if encoding == "msgpack":
+        return (b"\x93" + _msgpack_map_header(len(parts))
+                + b"".join(msgpack.packb(topic) + part for topic, part in parts)
+                + msgpack.packb(json_topics) + msgpack.packb(delta_topics))
+    return ("[{" + ",".join(json.dumps(topic) + ":" + part for topic, part in parts) + "},"
+            + json.dumps(json_topics) + "," + json.dumps(delta_topics) + "]")
+
+def get_delta(previous, payload):
+    """
+        :return the changed values of a dict payload, or None if a full payload must
+            be sent (not a dict, keys added/removed, or most of the values changed)
+    """
+    if not isinstance(previous, dict) or not isinstance(payload, dict) or previous.keys() != payload.keys():
+        return None
+    delta = {key : value for key, value in payload.items() if previous[key] != value}
+    return delta if len(delta) <= len(payload) // 2 else None
+
+class BroadcastBus:
+    """ Coalescing and rate limiting of the socketio broadcasts """
+
+    def __init__(self, socketio, namespace="/test", tick=1.0):
+        """
+            :param socketio: the flask_socketio.SocketIO instance
+            :param namespace: the socketio namespace of the clients
+            :param tick: the delay between two frames (seconds), also the minimum client interval
+        """
+        self.socketio = socketio
+        self.namespace = namespace
+        self.tick = tick
+        self.lock = threading.Lock()
+        self.version = 0
+        # topic -> {"version", "payload", "json_string", "encoded" : {encoding : payload encoded}}
+        self.topics = {}
+        # sid -> {"interval", "encoding", "next_frame", "sent" : {topic : (version, payload) sent}}
+        self.clients = {}
+        # topic -> {"published", "unchanged", "messages", "bytes"}
+        self.stats = {}
+        self.frames = 0
+        self._thread = None
+
+    def _topic_stats(self, topic):
+        return self.stats.setdefault(topic, {"published" : 0, "unchanged" : 0, "messages" : 0, "bytes" : 0})
+
+    def publish(self, topic, payload, json_string=False):
+        """
+            Set the last value of a topic. It will be sent with the next frame.
+            :param topic: the socketio event name used by the browser
+            :param payload: the event data (json serializable)
+            :param json_string: True if the browser handler expects a json string
+                (the payload is still sent as an object)
+            :return False if the payload didn't change
+        """
+        with self.lock:
+            stats = self._topic_stats(topic)
+            stats["published"] += 1
+            current = self.topics.get(topic)
+            if current is not None and current["payload"] == payload:
+                stats["unchanged"] += 1
+                return False
+            self.version += 1
+            # the payload is encoded only when a frame needs it, the copy protects
+            # it from a later modification by the emitter
+            self.topics[topic] = {"version" : self.version, "payload" : copy.deepcopy(payload), "json_string" : json_string, "encoded" : {}}
+            return True
+
+    def add_client(self, sid, interval=None, encoding="json"):
+        """
+            Register a client, it will receive the last value of all the topics
+            :param sid: the socketio session id
+            :param interval: the minimum delay between two frames for this client
+            :param encoding: the frame encoding ("json" or "msgpack")
+        """
+        with self.lock:
+            self.clients[sid] = {"interval" : self.tick, "encoding" : "json", "next_frame" : 0, "sent" : {}}
+        self.set_client_options(sid, interval, encoding)
+
+    def remove_client(self, sid):
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def set_client_options(self, sid, interval=None, encoding=None):
+        """
+            Change the client options
+            :param interval: the minimum delay between two frames (tick to 60s)
+            :param encoding: the frame encoding, json is used if the encoding isn't available
+            :return the encoding used
+        """
+        with self.lock:
+            client = self.clients.get(sid)
+            if client is None:
+                return None
+            if interval is not None:
+                client["interval"] = min(max(float(interval), self.tick), MAX_CLIENT_INTERVAL)
+            if encoding is not None:
+                client["encoding"] = encoding if encoding in ENCODINGS else "json"
+            return client["encoding"]
+
+    def _encoded(self, topic, encoding, sent, deltas):
+        """
+            Encode a topic payload, or its delta from the version already sent to the client
+            :param sent: the (version, payload) sent to the client, or None
+            :param deltas: cache of the deltas encoded during this flush
+            :return a tuple (encoded payload, True if it's a delta)
+        """
+        state = self.topics[topic]
+        if sent is not None:
+            key = (topic, sent[0], encoding)
+            if key not in deltas:
+                delta = get_delta(sent[1], state["payload"])
+                deltas[key] = _encode(delta, encoding) if delta is not None else None
+            if deltas[key] is not None:
+                return deltas[key], True
+        if encoding not in state["encoded"]:
+            state["encoded"][encoding] = _encode(state["payload"], encoding)
+        return state["encoded"][encoding], False
+
+    def flush(self, now=None):
+        """
+            Send a frame to the clients waiting for one
+            :return the number of clients which received a frame
+        """
+        now = time.monotonic() if now is None else now
+        # (changed topics with the versions already sent, encoding) -> (frame, parts, sids),
+        # the clients at the same point share the frame
+        frames = {}
+        deltas = {}
+        with self.lock:
+            for sid, client in self.clients.items():
+                if now < client["next_frame"]:
+                    continue
+                sent = client["sent"]
+                changed = tuple(sorted((topic, sent[topic][0] if topic in sent else None)
+                                       for topic, state in self.topics.items()
+                                       if topic not in sent or sent[topic][0] != state["version"]))
+                if not changed:
+                    continue
+                client["next_frame"] = now + client["interval"]
+                key = (changed, client["encoding"])
+                if key not in frames:
+                    parts = []
+                    delta_topics = []
+                    for topic, version in changed:
+                        part, is_delta = self._encoded(topic, client["encoding"], sent.get(topic), deltas)
+                        parts.append((topic, part))
+                        if is_delta:
+                            delta_topics.append(topic)
+                    json_topics = [topic for topic, version in changed if self.topics[topic]["json_string"]]
+                    frames[key] = (build_frame(parts, json_topics, delta_topics, client["encoding"]), parts, [])
+                frames[key][2].append(sid)
+                for topic, version in changed:
+                    sent[topic] = (self.topics[topic]["version"], self.topics[topic]["payload"])
+            for frame, parts, sids in frames.values():
+                for topic, part in parts:
+                    stats = self._topic_stats(topic)
+                    stats["messages"] += len(sids)
+                    stats["bytes"] += len(part) * len(sids)
+            self.frames += len(frames)
+        for frame, parts, sids in frames.values():
+            # one emit for all the clients sharing the frame, the packet is encoded once
+            self.socketio.emit(FRAME_EVENT, frame, namespace=self.namespace, to=sids)
+        return sum(len(sids) for frame, parts, sids in frames.values())
+
+    def get_stats(self):
+        """ :return the counters: clients, frames sent and the messages/bytes by topic """
+        with self.lock:
+            return {"clients" : len(self.clients),
+                    "frames" : self.frames,
+                    "topics" : {topic : dict(stats) for topic, stats in self.stats.items()}}
+
+    def _run(self):
+        while True:
+            if self.clients:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print("Broadcast bus error: ", e)
+            time.sleep(self.tick)
+
+    def start(self):
+        """ Send the frames in a thread """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
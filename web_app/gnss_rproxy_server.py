@@ -8,8 +8,13 @@
 import os
 from gevent import monkey
 monkey.patch_all()
+import gevent
 import requests
 import argparse
+import socket
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
 
 from RTKBaseConfigManager import RTKBaseConfigManager
 #from dotenv import load_dotenv  # pip package python-dotenv
@@ -45,6 +50,72 @@ bootstrap = Bootstrap4(app)
 rtkbaseconfig = RTKBaseConfigManager(os.path.join(rtkbase_path, "settings.conf.default"), os.path.join(rtkbase_path, "settings.conf"))
 GNSS_RCV_WEB_URL = str("{}{}".format("http://", rtkbaseconfig.get("main", "gnss_rcv_web_ip")))
 
+CHUNK_SIZE = 64 * 1024
+PROXY_METHODS = ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
+#hop-by-hop headers (RFC 2616 section 13.5.1), they are not forwarded
+HOP_BY_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers', 'transfer-encoding', 'upgrade')
+
+#A single session to reuse the connections to the receiver web server
+rcv_session = requests.Session()
+rcv_session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=20))
+#the receiver cookies belong to the browsers, the session must not keep them
+rcv_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+class AssetCache:
+    """
+        A small LRU cache for the receiver web server static files (js, css, images),
+        they are requested again on each page load.
+    """
+    EXTENSIONS = ('.js', '.css', '.png', '.gif', '.jpg', '.svg', '.ico', '.woff', '.woff2', '.ttf')
+
+    def __init__(self, max_size=4 * 1024 * 1024, max_item_size=512 * 1024, ttl=600):
+        self.max_size = max_size
+        self.max_item_size = max_item_size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.size = 0
+
+    def is_cacheable(self, method, path, headers):
+        return method == "GET" and path.lower().endswith(self.EXTENSIONS) and 'Range' not in headers
+
+    def cache_key(self, url, headers):
+        """
+            The body is cached as sent by the receiver (ie gzip Content-Encoding): the key
+            includes the Accept-Encoding of the browser, which is forwarded to the receiver
+        """
+        return (url, ",".join(sorted(value.strip().lower() for value in headers.get('Accept-Encoding', '').split(",") if value.strip())))
+
+    def is_storable(self, response_headers):
+        """ A response varying on another header than Accept-Encoding can't be cached by url """
+        vary = {value.strip().lower() for value in response_headers.get('Vary', '').split(",") if value.strip()}
+        return vary <= {'accept-encoding'}
+
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item["time"] > self.ttl:
+            self.remove(key)
+            return None
+        self.items.move_to_end(key)
+        return item
+
+    def add(self, key, status, headers, body):
+        if len(body) > self.max_item_size:
+            return
+        self.remove(key)
+        self.items[key] = {"time" : time.monotonic(), "status" : status, "headers" : headers, "body" : body}
+        self.size += len(body)
+        while self.size > self.max_size:
+            self.remove(next(iter(self.items)))
+
+    def remove(self, key):
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.size -= len(item["body"])
+
+asset_cache = AssetCache()
+
 class StandaloneApplication(gunicorn.app.base.BaseApplication):
     def __init__(self, app, options=None):
         self.options = options or {}
@@ -87,42 +158,121 @@ def inject_release():
 def load_user(id):
     return User(id)
 
+def filter_response_headers(res):
+    """ Remove the hop-by-hop headers from the receiver response """
+    return [(k,v) for k,v in res.raw.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+
+def stream_response(res):
+    """ Send the receiver response by chunks, without decoding it (the content-encoding stays the same) """
+    try:
+        for chunk in res.raw.stream(CHUNK_SIZE, decode_content=False):
+            yield chunk
+    finally:
+        res.close()
+
+class RequestBody:
+    """ The browser request body, read by chunks while it is sent to the receiver """
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        return self.stream.read(size)
+
+def iter_request_body(stream):
+    """ A chunked browser request body, sent chunked to the receiver """
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+        yield chunk
+
+class TunnelClosedResponse(Response):
+    """ The connection was used by a websocket tunnel, gunicorn must close it without sending anything """
+    def __call__(self, environ, start_response):
+        raise StopIteration()
+
+def tunnel_websocket():
+    """
+        Forward a websocket connection to the receiver web server: the handshake is sent
+        to the receiver, then the data are copied in both directions until one side closes.
+    """
+    client_sock = request.environ.get("gunicorn.socket")
+    if client_sock is None:
+        abort(501)
+    rcv_url = urllib.parse.urlsplit(GNSS_RCV_WEB_URL)
+    try:
+        rcv_sock = socket.create_connection((rcv_url.hostname, rcv_url.port or 80), timeout=10)
+    except OSError:
+        abort(502)
+    rcv_sock.settimeout(None)
+    handshake = ["{} {} HTTP/1.1".format(request.method, request.full_path if request.query_string else request.path)]
+    for k, v in request.headers:
+        handshake.append("{}: {}".format(k, rcv_url.netloc if k.lower() == 'host' else v))
+    rcv_sock.sendall(("\r\n".join(handshake) + "\r\n\r\n").encode("latin-1"))
+
+    def pipe(source, destination):
+        try:
+            while True:
+                data = source.recv(CHUNK_SIZE)
+                if not data:
+                    break
+                destination.sendall(data)
+        except OSError:
+            pass
+
+    pipes = [gevent.spawn(pipe, client_sock, rcv_sock), gevent.spawn(pipe, rcv_sock, client_sock)]
+    gevent.wait(pipes, count=1)
+    rcv_sock.close()
+    client_sock.close()
+    gevent.killall(pipes)
+    return TunnelClosedResponse()
+
 #proxy code from https://stackoverflow.com/a/36601467
-@app.route('/', defaults={'path': ''}, methods=["GET", "POST"])  # ref. https://medium.com/@zwork101/making-a-flask-proxy-server-online-in-10-lines-of-code-44b8721bca6
-@app.route('/<path>', methods=["GET", "POST"])  # NOTE: better to specify which methods to be accepted. Otherwise, only GET will be accepted. Ref: 
+@app.route('/', defaults={'path': ''}, methods=PROXY_METHODS)  # ref. https://medium.com/@zwork101/making-a-flask-proxy-server-online-in-10-lines-of-code-44b8721bca6
+@app.route('/<path:path>', methods=PROXY_METHODS)
 @login_required
 def redirect_to_API_HOST(path):  #NOTE var :path will be unused as all path we need will be read from :request ie from flask import request
-    res = requests.request(  # ref. https://stackoverflow.com/a/36601467/248616
-        method          = request.method,
-        url             = request.url.replace(request.host_url, f'{GNSS_RCV_WEB_URL}/'),
-        headers         = {k:v for k,v in request.headers if k.lower() != 'host'}, # exclude 'host' header
-        data            = request.get_data(),
-        cookies         = request.cookies,
-        allow_redirects = False,
-    )
-    """ print("method: ", request.method)
-    print("request posturl: ", request.url)
-    print("request host: ", request.host_url)
-    print("url: ", request.url.replace(request.host_url, f'{GNSS_RCV_WEB_URL}/'))
-    print("header: ", {k:v for k,v in request.headers if k.lower() != 'host'})
-    print("data: ", request.get_data())
-    print("cookies: ", request.cookies)
-    print("host url split", urllib.parse.urlsplit(request.host_url))
-    print("host url split2", urllib.parse.urlsplit(request.base_url).hostname)
-    old = urllib.parse.urlparse(request.host_url)
-    new = urllib.parse.ParseResult(scheme=old.scheme, netloc="{}:{}".format(old.hostname, 9090),
-                  path=old.path, params=old.params, query=old.query, fragment=old.fragment)
-    print("new_url: ", new.geturl()) """
-    #region exlcude some keys in :res response
-    excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']  #NOTE we here exclude all "hop-by-hop headers" defined by RFC 2616 section 13.5.1 ref. https://www.rfc-editor.org/rfc/rfc2616#section-13.5.1
-    headers          = [
-        (k,v) for k,v in res.raw.headers.items()
-        if k.lower() not in excluded_headers
-    ]
-    #endregion exlcude some keys in :res response
-
-    response = Response(res.content, res.status_code, headers)
-    return response
+    if request.headers.get('Upgrade', '').lower() == 'websocket':
+        return tunnel_websocket()
+
+    url = request.url.replace(request.host_url, f'{GNSS_RCV_WEB_URL}/')
+    cacheable = asset_cache.is_cacheable(request.method, request.path, request.headers)
+    if cacheable:
+        cache_key = asset_cache.cache_key(url, request.headers)
+        cached = asset_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached["body"], cached["status"], cached["headers"])
+
+    # the request body is streamed too (ie firmware upload)
+    if request.content_length:
+        body = RequestBody(request.stream, request.content_length)
+    elif 'chunked' in request.headers.get('Transfer-Encoding', '').lower():
+        body = iter_request_body(request.stream)
+    else:
+        body = None
+    try:
+        res = rcv_session.request(  # ref. https://stackoverflow.com/a/36601467/248616
+            method          = request.method,
+            url             = url,
+            headers         = {k:v for k,v in request.headers if k.lower() not in ('host', 'content-length') + HOP_BY_HOP_HEADERS}, # exclude 'host' header
+            data            = body,
+            allow_redirects = False,
+            stream          = True,
+        )
+    except requests.ConnectionError:
+        abort(502)
+    headers = filter_response_headers(res)
+
+    cache_control = res.headers.get('Cache-Control', '').lower()
+    if cacheable and res.status_code == 200 and 'Set-Cookie' not in res.headers and 'no-store' not in cache_control \
+            and asset_cache.is_storable(res.headers) and int(res.headers.get('Content-Length', asset_cache.max_item_size + 1)) <= asset_cache.max_item_size:
+        body = res.raw.read(decode_content=False)
+        res.close()
+        asset_cache.add(cache_key, res.status_code, headers, body)
+        return Response(body, res.status_code, headers)
+
+    return Response(stream_response(res), res.status_code, headers, direct_passthrough=True)
 
 
 @app.route('/gnsslogin', methods=['GET', 'POST'])
@@ -0,0 +1,158 @@
+""" Read the systemd journal of the RTKBase services, page by page.
+
+    The entries are read from `journalctl -o json` and the reading stops as soon
+    as a page is full, so only the requested page is ever in memory. Each entry
+    contains the journal cursor, used to load the next (older) page or to start
+    a live tail after the last known entry.
+"""
+
+import json
+import subprocess
+import threading
+import time
+from datetime import datetime
+
+PRIORITIES = ("emerg", "alert", "crit", "err", "warning", "notice", "info", "debug")
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+def _message(entry):
+    """ The journal MESSAGE field could be a list of bytes if it's not valid utf-8 """
+    message = entry.get("MESSAGE", "")
+    if isinstance(message, list):
+        message = bytes(message).decode("utf-8", errors="replace")
+    return message if message is not None else ""
+
+def parse_entry(line):
+    """
+        Convert a `journalctl -o json` line to a smaller dict
+        :param line: a json line
+        :return a dict with the cursor, time, priority, identifier, pid and message
+    """
+    entry = json.loads(line)
+    timestamp = int(entry.get("__REALTIME_TIMESTAMP", 0)) / 1e6
+    return {"cursor" : entry.get("__CURSOR"),
+            "time" : datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds"),
+            "priority" : int(entry.get("PRIORITY", 6)),
+            "identifier" : entry.get("SYSLOG_IDENTIFIER", entry.get("_COMM", "")),
+            "pid" : entry.get("_PID", ""),
+            "message" : _message(entry)}
+
+def _journalctl_args(unit, priority=None, since=None):
+    args = ["journalctl", "--no-pager", "-o", "json", "-u", unit]
+    if priority is not None:
+        args += ["-p", str(priority)]
+    if since:
+        args += ["--since", since]
+    return args
+
+def iter_entries(unit, cursor=None, priority=None, since=None, limit=DEFAULT_PAGE_SIZE):
+    """
+        Read the journal entries of a unit, from the newest to the oldest
+        :param unit: the systemd unit name
+        :param cursor: start after this cursor (the last entry from the previous page)
+        :param priority: the maximum priority (0 emerg -> 7 debug)
+        :param since: a journalctl --since value (ie "7 days ago")
+        :param limit: the maximum number of entries
+        :return a generator of entries (see parse_entry)
+    """
+    args = _journalctl_args(unit, priority, since) + ["--reverse"]
+    if cursor:
+        args.append("--after-cursor={}".format(cursor))
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="UTF-8")
+    count = 0
+    try:
+        for line in process.stdout:
+            if count >= limit:
+                break
+            try:
+                entry = parse_entry(line)
+            except ValueError:
+                continue
+            count += 1
+            yield entry
+    finally:
+        process.kill()
+        process.stdout.close()
+        process.wait()
+
+def iter_page_json(unit, cursor=None, priority=None, since=None, limit=DEFAULT_PAGE_SIZE):
+    """
+        Stream a journal page as a json object:
+        {"unit" : .., "entries" : [...], "next_cursor" : .., "more" : true/false}
+        One more entry is read to know if another page exists.
+    """
+    yield '{{"unit": {}, "entries": ['.format(json.dumps(unit))
+    last_cursor = None
+    more = False
+    for count, entry in enumerate(iter_entries(unit, cursor, priority, since, limit + 1)):
+        if count == limit:
+            more = True
+            break
+        yield (", " if count else "") + json.dumps(entry)
+        last_cursor = entry["cursor"]
+    yield '], "next_cursor": {}, "more": {}}}'.format(json.dumps(last_cursor), json.dumps(more))
+
+def get_unit_status(unit):
+    """
+        Get the `systemctl status` output of a unit (without the journal lines)
+    """
+    answer = subprocess.run(["systemctl", "status", "--no-pager", "--lines=0", unit],
+                            stdout=subprocess.PIPE, universal_newlines=True, check=False)
+    return answer.stdout
+
+class JournalTail:
+    """
+        Follow the journal of a unit (`journalctl -f`) and send the new entries to a callback.
+        The entries are grouped by batch to limit the number of messages sent to the browsers.
+    """
+
+    def __init__(self, unit, callback, cursor=None, priority=None, batch_delay=0.5):
+        """
+            :param unit: the systemd unit name
+            :param callback: a function called with a list of new entries
+            :param cursor: send the entries after this cursor, or only the new ones if None
+            :param priority: the maximum priority (0 emerg -> 7 debug)
+            :param batch_delay: delay in seconds to gather the entries before calling the callback
+        """
+        self.unit = unit
+        self.callback = callback
+        self.cursor = cursor
+        self.priority = priority
+        self.batch_delay = batch_delay
+        self.process = None
+        self.entries = []
+        self.lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        args = _journalctl_args(self.unit, self.priority) + ["--follow"]
+        args.append("--after-cursor={}".format(self.cursor) if self.cursor else "--lines=0")
+        self.process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="UTF-8")
+        self.running = True
+        threading.Thread(target=self._read, daemon=True).start()
+        threading.Thread(target=self._flush, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                entry = parse_entry(line)
+            except ValueError:
+                continue
+            with self.lock:
+                self.entries.append(entry)
+        self.running = False
+
+    def _flush(self):
+        while self.running:
+            time.sleep(self.batch_delay)
+            with self.lock:
+                entries, self.entries = self.entries, []
+            if entries:
+                self.callback(entries)
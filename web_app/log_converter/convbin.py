@@ -21,7 +21,6 @@
 # You should have received a copy of the GNU General Public License
 # along with ReachView.  If not, see <http://www.gnu.org/licenses/>.
 
-import pexpect
 from .logs import Log, LogMetadata
 
 class Convbin:
@@ -71,6 +70,9 @@ class Convbin:
 
         print("Specified format is " + format)
 
+        # imported here, not during the web server startup
+        import pexpect
+
         print("Spawning convbin with " + spawn_command)
         self.child = pexpect.spawn(spawn_command, echo = False)
         print("Process spawned!")
@@ -0,0 +1,531 @@
+#!/usr/bin/env python3
+""" Compression backends for the raw gnss data archives and the RINEX packages.
+
+    A codec is selected with a small string: '<codec>[:<level>]' (ie 'xz:6', 'zstd:10').
+    Each data type (ubx, sbf, rtcm3, rinex...) can use its own codec, and the RINEX files
+    can be Hatanaka compressed with rnx2crx before the compression ('crx+xz:6').
+
+    The codecs are streaming: data is read and written by chunks, so memory usage stays
+    low even with multi-GB raw logs.
+
+    This module could be used from the command line:
+        - archive the raw files from archive_and_clean.sh
+        - decompress a file before a RINEX conversion (convbin.sh)
+        - benchmark the codecs with the recent logs stored on this base
+"""
+
+import os
+import sys
+import bz2
+import lzma
+import zlib
+import time
+import json
+import shutil
+import zipfile
+import argparse
+import subprocess
+from glob import glob
+from configparser import ConfigParser
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_ARCHIVE_COMPRESSION = "zip:9"
+DEFAULT_RINEX_COMPRESSION = "zip:6"
+
+# data type for each file extension. The RINEX observation files are .obs or .YYo
+RAW_DATA_TYPES = ("rtcm2", "rtcm3", "nov", "oem3", "ubx", "ss2", "hemis", "stq", "javad", "nvs", "binex", "unicore", "sbf")
+
+class Codec:
+    """ Base class for a streaming codec """
+
+    name = None
+    extension = None
+    default_level = None
+    levels = ()
+    # levels tested during a benchmark
+    benchmark_levels = ()
+
+    def available(self):
+        return True
+
+    def check_level(self, level):
+        """
+            Return a valid compression level
+            :param level: the wanted level (int or None)
+            :return the level, or the default level if level is None
+        """
+        if level is None:
+            return self.default_level
+        level = int(level)
+        if level not in self.levels:
+            raise ValueError("Level {} is not valid for {} (valid levels: {}-{})".format(level, self.name, self.levels[0], self.levels[-1]))
+        return level
+
+    def compressobj(self, level):
+        raise NotImplementedError
+
+    def decompressobj(self):
+        raise NotImplementedError
+
+class DeflateCodec(Codec):
+    """ Raw deflate stream, as used inside the zip archives """
+    name = "zip"
+    extension = ".zip"
+    default_level = 9
+    levels = range(0, 10)
+    benchmark_levels = (1, 6, 9)
+
+    def compressobj(self, level):
+        return zlib.compressobj(level, zlib.DEFLATED, -15)
+
+    def decompressobj(self):
+        return zlib.decompressobj(-15)
+
+class GzipCodec(Codec):
+    name = "gzip"
+    extension = ".gz"
+    default_level = 6
+    levels = range(0, 10)
+    benchmark_levels = (1, 6, 9)
+
+    def compressobj(self, level):
+        # wbits=31 writes a gzip header and trailer
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def decompressobj(self):
+        return zlib.decompressobj(31)
+
+class Bzip2Codec(Codec):
+    name = "bzip2"
+    extension = ".bz2"
+    default_level = 9
+    levels = range(1, 10)
+    benchmark_levels = (1, 9)
+
+    def compressobj(self, level):
+        return bz2.BZ2Compressor(level)
+
+    def decompressobj(self):
+        return bz2.BZ2Decompressor()
+
+class XzCodec(Codec):
+    name = "xz"
+    extension = ".xz"
+    default_level = 6
+    levels = range(0, 10)
+    benchmark_levels = (0, 3, 6)
+
+    def compressobj(self, level):
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=level)
+
+    def decompressobj(self):
+        return lzma.LZMADecompressor(format=lzma.FORMAT_XZ)
+
+class ZstdCodec(Codec):
+    """ Zstandard codec, needs the optional zstandard python module """
+    name = "zstd"
+    extension = ".zst"
+    default_level = 10
+    levels = range(1, 23)
+    benchmark_levels = (1, 3, 10, 19)
+
+    def available(self):
+        return zstandard is not None
+
+    def compressobj(self, level):
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+    def decompressobj(self):
+        return zstandard.ZstdDecompressor().decompressobj()
+
+CODECS = {codec.name : codec for codec in (DeflateCodec(), GzipCodec(), Bzip2Codec(), XzCodec(), ZstdCodec())}
+
+# compression method to use inside a zip archive for each codec
+ZIP_METHODS = {"zip" : zipfile.ZIP_DEFLATED,
+               "gzip" : zipfile.ZIP_DEFLATED,
+               "bzip2" : zipfile.ZIP_BZIP2,
+               "xz" : zipfile.ZIP_LZMA,
+               "zstd" : getattr(zipfile, "ZIP_ZSTANDARD", zipfile.ZIP_DEFLATED)}
+
+def parse_spec(spec):
+    """
+        Parse a compression string like 'xz:6' or 'crx+gzip:9'
+        :param spec: the compression string
+        :return a tuple (hatanaka, codec, level)
+    """
+    spec = spec.strip().strip("'").lower()
+    hatanaka = False
+    if spec.startswith("crx+"):
+        hatanaka = True
+        spec = spec[4:]
+    name, _, level = spec.partition(":")
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError("Unknown compression codec: {} (available: {})".format(name, ", ".join(CODECS)))
+    if not codec.available():
+        raise ValueError("Compression codec {} is not available on this system".format(name))
+    return hatanaka, codec, codec.check_level(level or None)
+
+def parse_by_type(by_type):
+    """
+        Parse the per data type compression settings
+        :param by_type: a string like 'ubx=zstd:10,sbf=xz:6'
+        :return a dict {data type : compression string}
+    """
+    specs = {}
+    for entry in by_type.strip().strip("'").split(","):
+        if "=" in entry:
+            data_type, spec = entry.split("=", 1)
+            specs[data_type.strip().lower()] = spec.strip()
+    return specs
+
+def get_data_type(file_path):
+    """
+        Find the data type of a file from its extension
+        :param file_path: path to a raw or RINEX file
+        :return the data type (ubx, sbf, rtcm3, rinex...) or None
+    """
+    extension = os.path.splitext(file_path)[1][1:].lower()
+    if extension in RAW_DATA_TYPES:
+        return extension
+    if extension == "obs" or (len(extension) == 3 and extension[:2].isdigit() and extension[2] == "o"):
+        return "rinex"
+    return None
+
+def compress_stream(src, dst, codec, level=None, chunk_size=CHUNK_SIZE):
+    """
+        Compress a file object into another file object, chunk by chunk
+        :param src: a readable binary file object
+        :param dst: a writable binary file object
+        :param codec: a Codec instance or a codec name
+        :param level: the compression level (codec default if None)
+        :return a tuple (bytes read, bytes written)
+    """
+    codec = CODECS[codec] if isinstance(codec, str) else codec
+    compressor = codec.compressobj(codec.check_level(level))
+    read_size = written_size = 0
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        read_size += len(chunk)
+        data = compressor.compress(chunk)
+        if data:
+            dst.write(data)
+            written_size += len(data)
+    data = compressor.flush()
+    dst.write(data)
+    written_size += len(data)
+    return read_size, written_size
+
+def decompress_stream(src, dst, codec, chunk_size=CHUNK_SIZE):
+    """
+        Decompress a file object into another file object, chunk by chunk
+        :param src: a readable binary file object
+        :param dst: a writable binary file object
+        :param codec: a Codec instance or a codec name
+        :return the number of bytes written
+    """
+    codec = CODECS[codec] if isinstance(codec, str) else codec
+    decompressor = codec.decompressobj()
+    written_size = 0
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            break
+        data = decompressor.decompress(chunk)
+        dst.write(data)
+        written_size += len(data)
+    if hasattr(decompressor, "flush"):
+        data = decompressor.flush()
+        dst.write(data)
+        written_size += len(data)
+    return written_size
+
+def codec_from_extension(file_path):
+    """
+        Get the codec used for a compressed file (not a zip archive)
+        :param file_path: path to a compressed file
+        :return a Codec instance or None
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    return next((codec for codec in CODECS.values() if codec.extension == extension and codec.name != "zip"), None)
+
+def compress_file(file_path, spec, remove=False):
+    """
+        Compress a single file to <file_path>.<codec extension>
+        :param file_path: the file to compress
+        :param spec: the compression string (ie 'xz:6')
+        :param remove: delete the source file after a successful compression
+        :return the compressed file path
+    """
+    hatanaka, codec, level = parse_spec(spec)
+    if hatanaka:
+        file_path = hatanaka_compress(file_path, remove=remove)
+    if codec.name == "zip":
+        destination = os.path.splitext(file_path)[0] + ".zip"
+        add_to_zip(destination, [file_path], level, remove=remove)
+        return destination
+
+    destination = file_path + codec.extension
+    tmp_destination = destination + ".part"
+    with open(file_path, "rb") as src, open(tmp_destination, "wb") as dst:
+        compress_stream(src, dst, codec, level)
+    shutil.copystat(file_path, tmp_destination)
+    os.replace(tmp_destination, destination)
+    if remove:
+        os.remove(file_path)
+    return destination
+
+def decompress_file(file_path, destination=None):
+    """
+        Decompress a .gz/.bz2/.xz/.zst file
+        :param file_path: the compressed file
+        :param destination: the decompressed file path (default: file_path without the codec extension)
+        :return the decompressed file path
+    """
+    codec = codec_from_extension(file_path)
+    if codec is None:
+        raise ValueError("{} is not a supported compressed file".format(file_path))
+    if destination is None:
+        destination = os.path.splitext(file_path)[0]
+    with open(file_path, "rb") as src, open(destination, "wb") as dst:
+        decompress_stream(src, dst, codec)
+    return destination
+
+def add_to_zip(zip_path, files, level=None, method=zipfile.ZIP_DEFLATED, arcnames=None, remove=False):
+    """
+        Add files to a zip archive (created if needed), like zip -m<level>
+        :param zip_path: the zip archive path
+        :param files: a list of files to add
+        :param level: the compression level
+        :param method: the zipfile compression method
+        :param arcnames: optional list of names inside the archive
+        :param remove: delete the files after adding them
+        :return the zip archive path
+    """
+    arcnames = arcnames or [os.path.basename(file) for file in files]
+    if method == zipfile.ZIP_LZMA:
+        # zipfile ignores compresslevel with lzma
+        level = None
+    with zipfile.ZipFile(zip_path, "a", compression=method, compresslevel=level) as zip_archive:
+        for file, arcname in zip(files, arcnames):
+            zip_archive.write(file, arcname)
+    if remove:
+        for file in files:
+            os.remove(file)
+    return zip_path
+
+def hatanaka_compress(rinex_path, remove=False):
+    """
+        Compress a RINEX observation file with the Hatanaka compression (rnx2crx)
+        If rnx2crx is not installed, the RINEX file is returned unchanged.
+        :param rinex_path: path to the .obs or .YYo file
+        :param remove: delete the RINEX file after the compression
+        :return the path to the .crx/.YYd file
+    """
+    rnx2crx = shutil.which("rnx2crx") or shutil.which("RNX2CRX")
+    if rnx2crx is None:
+        print("rnx2crx not found, skipping Hatanaka compression")
+        return rinex_path
+    name, extension = os.path.splitext(rinex_path)
+    crx_path = name + (".crx" if extension.lower() == ".obs" else extension[:-1] + "d")
+    answer = subprocess.run([rnx2crx, "-f", rinex_path], stderr=subprocess.PIPE, stdout=subprocess.PIPE, check=False)
+    if answer.returncode != 0 or not os.path.isfile(crx_path):
+        print("Hatanaka compression failed for {}: {}".format(rinex_path, answer.stderr.decode(errors="replace")))
+        return rinex_path
+    if remove:
+        os.remove(rinex_path)
+    return crx_path
+
+def create_package(package_path, files, spec=DEFAULT_RINEX_COMPRESSION, texts=None):
+    """
+        Create a zip package (RINEX package for example) with the codec from spec.
+        RINEX observation files are Hatanaka compressed first if spec starts with crx+
+        :param package_path: the zip file to create
+        :param files: a list of tuples [("abspath", "wanted_path_inside_zip"), ... ]
+        :param spec: the compression string
+        :param texts: optional dict {"name_inside_zip" : string} added to the package
+        :return the list of temporary files created (Hatanaka files)
+    """
+    hatanaka, codec, level = parse_spec(spec)
+    method = ZIP_METHODS[codec.name]
+    if method == zipfile.ZIP_LZMA or (method == zipfile.ZIP_DEFLATED and codec.name not in ("zip", "gzip")):
+        # the level is not usable with this zip compression method
+        level = None
+    temporary_files = []
+    with zipfile.ZipFile(package_path, "w", compression=method, compresslevel=level) as package:
+        for file_path, arcname in files:
+            if hatanaka and get_data_type(file_path) == "rinex":
+                crx_path = hatanaka_compress(file_path)
+                if crx_path != file_path:
+                    temporary_files.append(crx_path)
+                    arcname = os.path.join(os.path.dirname(arcname), os.path.basename(crx_path))
+                    file_path = crx_path
+            package.write(file_path, arcname)
+        for arcname, text in (texts or {}).items():
+            package.writestr(arcname, text)
+    return temporary_files
+
+def archive(files, spec=DEFAULT_ARCHIVE_COMPRESSION, by_type="", zip_name=None, remove=False):
+    """
+        Archive raw data files, with a codec chosen for each data type.
+        The files using the zip codec are stored together inside the zip_name archive
+        (the archive_and_clean.sh legacy behaviour), the others are compressed separately.
+        :param files: the list of files to archive
+        :param spec: the default compression string
+        :param by_type: the per data type compression strings (ie 'ubx=zstd:10,sbf=xz:6')
+        :param zip_name: the zip archive name for the files using the zip codec
+        :param remove: delete the source files
+        :return the list of the created archives
+    """
+    specs = parse_by_type(by_type)
+    archives = []
+    zip_files = {}
+    for file in files:
+        file_spec = specs.get(get_data_type(file), spec)
+        hatanaka, codec, level = parse_spec(file_spec)
+        if codec.name == "zip" and not hatanaka and zip_name is not None:
+            zip_files.setdefault(level, []).append(file)
+            continue
+        print("Compressing {} with {}".format(file, file_spec))
+        archives.append(compress_file(file, file_spec, remove=remove))
+    for level, level_files in zip_files.items():
+        print("Adding {} to {}".format(" ".join(level_files), zip_name))
+        archives.append(add_to_zip(zip_name, level_files, level, remove=remove))
+    return archives
+
+def read_samples(datadir, sample_size, max_files=10):
+    """
+        Read a sample of the recent logs for each data type. Raw files inside
+        zip archives are also used.
+        :param datadir: the gnss data directory
+        :param sample_size: the max sample size in bytes for each data type
+        :param max_files: the max number of recent files to read
+        :return a dict {data type : bytes}
+    """
+    samples = {}
+    recent_files = sorted(glob(os.path.join(datadir, "*")), key=os.path.getmtime, reverse=True)[:max_files]
+    for file in recent_files:
+        if file.endswith(".zip"):
+            try:
+                with zipfile.ZipFile(file) as zip_archive:
+                    for member in zip_archive.infolist():
+                        data_type = get_data_type(member.filename)
+                        if data_type is not None and len(samples.get(data_type, b"")) < sample_size:
+                            with zip_archive.open(member) as f:
+                                samples[data_type] = samples.get(data_type, b"") + f.read(sample_size - len(samples.get(data_type, b"")))
+            except zipfile.BadZipFile:
+                continue
+        else:
+            data_type = get_data_type(file)
+            if data_type is not None and len(samples.get(data_type, b"")) < sample_size:
+                with open(file, "rb") as f:
+                    samples[data_type] = samples.get(data_type, b"") + f.read(sample_size - len(samples.get(data_type, b"")))
+    return samples
+
+def benchmark_codec(sample, codec, level, chunk_size=CHUNK_SIZE):
+    """
+        Compress and decompress a sample with a codec
+        :return a dict with the ratio and the compression/decompression speed in MB/s
+    """
+    compressor = codec.compressobj(level)
+    compressed = []
+    start = time.perf_counter()
+    view = memoryview(sample)
+    for offset in range(0, len(sample), chunk_size):
+        compressed.append(compressor.compress(view[offset:offset + chunk_size]))
+    compressed.append(compressor.flush())
+    compression_time = time.perf_counter() - start
+    compressed = b"".join(compressed)
+
+    decompressor = codec.decompressobj()
+    start = time.perf_counter()
+    decompressor.decompress(compressed)
+    decompression_time = time.perf_counter() - start
+
+    size_mb = len(sample) / (1024 * 1024)
+    return {"codec" : "{}:{}".format(codec.name, level),
+            "ratio" : round(len(sample) / max(len(compressed), 1), 2),
+            "compression_speed" : round(size_mb / max(compression_time, 1e-9), 2),
+            "decompression_speed" : round(size_mb / max(decompression_time, 1e-9), 2)}
+
+def benchmark(datadir, sample_size=16 * 1024 * 1024, codecs=None):
+    """
+        Benchmark all the available codecs with the recent logs from datadir
+        :param datadir: the gnss data directory
+        :param sample_size: the max sample size in bytes for each data type
+        :param codecs: a list of compression strings to test (default: all codecs with a few levels)
+        :return a dict {data type : [results]}
+    """
+    if codecs is None:
+        codecs = ["{}:{}".format(codec.name, level) for codec in CODECS.values() if codec.available() for level in codec.benchmark_levels]
+    results = {}
+    for data_type, sample in read_samples(datadir, sample_size).items():
+        results[data_type] = []
+        for spec in codecs:
+            _, codec, level = parse_spec(spec)
+            results[data_type].append(benchmark_codec(sample, codec, level))
+        results[data_type].sort(key=lambda result: result["ratio"], reverse=True)
+    return results
+
+def get_datadir():
+    """ Read the gnss data directory from settings.conf """
+    rtkbase_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../"))
+    config = ConfigParser(interpolation=None)
+    config.read(os.path.join(rtkbase_path, "settings.conf"))
+    datadir = config.get("local_storage", "datadir", fallback="$BASEDIR/data").strip("'")
+    if "$BASEDIR" in datadir:
+        datadir = os.path.join(rtkbase_path, datadir.replace("$BASEDIR/", ""))
+    return datadir
+
+def arg_parse():
+    """ Parse the command line you use to launch the script """
+    parser = argparse.ArgumentParser(prog="log_compression", description="Compression backends for the RTKBase logs",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    archive_parser = subparsers.add_parser("archive", help="archive raw data files")
+    archive_parser.add_argument("files", nargs="+")
+    archive_parser.add_argument("--codec", default=DEFAULT_ARCHIVE_COMPRESSION, help="compression string (ie xz:6)")
+    archive_parser.add_argument("--by-type", default="", help="per data type compression (ie ubx=zstd:10,sbf=xz:6)")
+    archive_parser.add_argument("--zip-name", default=None, help="zip archive name for the files using the zip codec")
+    archive_parser.add_argument("--remove", action="store_true", help="delete the source files")
+
+    decompress_parser = subparsers.add_parser("decompress", help="decompress a .gz/.bz2/.xz/.zst file")
+    decompress_parser.add_argument("file")
+    decompress_parser.add_argument("-o", "--output", default=None)
+
+    benchmark_parser = subparsers.add_parser("benchmark", help="benchmark the codecs with the recent logs")
+    benchmark_parser.add_argument("--datadir", default=None, help="gnss data directory (default: from settings.conf)")
+    benchmark_parser.add_argument("--sample-size", type=int, default=16, help="sample size in MB for each data type")
+    benchmark_parser.add_argument("--codecs", nargs="+", default=None, help="compression strings to test (ie gzip:6 xz:3)")
+    benchmark_parser.add_argument("--json", action="store_true", help="json output")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = arg_parse()
+    if args.command == "archive":
+        archive(args.files, args.codec, args.by_type, args.zip_name, args.remove)
+    elif args.command == "decompress":
+        print(decompress_file(args.file, args.output))
+    elif args.command == "benchmark":
+        datadir = args.datadir or get_datadir()
+        results = benchmark(datadir, args.sample_size * 1024 * 1024, args.codecs)
+        if args.json:
+            print(json.dumps(results))
+        elif not results:
+            print("No raw data found in {}".format(datadir))
+            sys.exit(1)
+        else:
+            for data_type, type_results in results.items():
+                print("{}:".format(data_type))
+                print("    {:<10} {:>7} {:>14} {:>16}".format("codec", "ratio", "compress MB/s", "decompress MB/s"))
+                for result in type_results:
+                    print("    {codec:<10} {ratio:>7} {compression_speed:>14} {decompression_speed:>16}".format(**result))
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+""" Extract a time window from the raw gnss data files (.ubx, .sbf, .rtcm3)
+
+    The frames are scanned to find their epoch time, and the slice boundaries are located
+    with a binary search on the file offsets: only a few KB are read to find the
+    start and the end of a window, even inside a multi-GB file.
+    The slice always starts and stops on a frame boundary, at the first frame of an epoch.
+
+    The archived files (zip members, .gz, .bz2, .xz, .zst) can't be read at an offset:
+    they are decompressed on the fly and scanned from their start.
+
+    The times are handled as GPS seconds since the GPS epoch (1980-01-06).
+"""
+
+import os
+import re
+import sys
+import struct
+import binascii
+import zipfile
+import argparse
+from collections import namedtuple
+from glob import glob
+from datetime import datetime, timezone, timedelta
+
+try:
+    from . import log_compression
+except ImportError:
+    # used as a script
+    import log_compression
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from reach_tools import ubx_frames
+
+GPS_EPOCH = datetime(1980, 1, 6, tzinfo=timezone.utc)
+SECONDS_IN_WEEK = 604800
+# GPS - UTC offset since 2017-01-01
+LEAP_SECONDS = 18
+# GPS - BeiDou time offset
+BDT_OFFSET = 14
+
+READ_SIZE = 64 * 1024
+# max bytes scanned to find a timed frame after an offset
+MAX_PROBE_SIZE = 4 * 1024 * 1024
+
+# str2str file names contain the start date (ie 2024-05-03_00-00-00_GNSS-1.ubx)
+FILE_DATE_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})_(\d{2})-(\d{2})-(\d{2})")
+
+# a raw data stream inside a file:
+# name: the raw file name (ie 2024-05-03_00-00-00_GNSS-1.ubx)
+# path: the file on disk (the raw file, the zip archive or the compressed file)
+# member: the zip member name, or None
+# codec: the log_compression codec of a compressed file, or None
+LogSource = namedtuple("LogSource", ["name", "path", "member", "codec"])
+
+def to_utc(date_time):
+    """ Convert a datetime to an aware UTC datetime (naive datetime are considered as UTC) """
+    if date_time.tzinfo is None:
+        return date_time.replace(tzinfo=timezone.utc)
+    return date_time.astimezone(timezone.utc)
+
+def utc_to_gps_seconds(utc_datetime):
+    """
+        Convert an UTC datetime (naive datetime are considered as UTC) to GPS seconds
+    """
+    return (to_utc(utc_datetime) - GPS_EPOCH).total_seconds() + LEAP_SECONDS
+
+def gps_seconds_to_utc(gps_seconds):
+    """
+        Convert GPS seconds to an UTC datetime
+    """
+    return GPS_EPOCH + timedelta(seconds=gps_seconds - LEAP_SECONDS)
+
+def resolve_week(time_of_week, reference):
+    """
+        Find the full GPS time for a time of week, using the closest week from a reference time
+        :param time_of_week: the time of week in seconds
+        :param reference: a GPS time (seconds) close to the wanted time
+        :return the GPS time in seconds
+    """
+    week = round((reference - time_of_week) / SECONDS_IN_WEEK)
+    return week * SECONDS_IN_WEEK + time_of_week
+
+def _crc24q_table():
+    table = []
+    for i in range(256):
+        crc = i << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+        table.append(crc & 0xFFFFFF)
+    return table
+
+CRC24Q_TABLE = _crc24q_table()
+
+def crc24q(data):
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFF) ^ CRC24Q_TABLE[(crc >> 16) ^ byte]
+    return crc
+
+class FrameScanner:
+    """
+        Base class to decode the frames of a raw gnss stream.
+        read_frame() returns None if the data at pos is not a valid frame,
+        0 if more data is needed, or a tuple (frame length, gps time or None)
+    """
+
+    sync = b""
+    # min bytes needed to read the frame length
+    header_size = 0
+
+    def read_frame(self, buffer, pos, reference):
+        raise NotImplementedError
+
+class UbxScanner(FrameScanner):
+    """ u-blox UBX frames. The time comes from RXM-RAWX or from the iTOW of the NAV messages """
+
+    sync = ubx_frames.SYNC
+    header_size = ubx_frames.HEADER_SIZE
+
+    def read_frame(self, buffer, pos, reference):
+        msg_class, msg_id, length = ubx_frames.HEADER.unpack_from(buffer, pos + 2)
+        if length > ubx_frames.MAX_PAYLOAD_SIZE:
+            return None
+        frame_length = length + ubx_frames.HEADER_SIZE + ubx_frames.CHECKSUM_SIZE
+        if pos + frame_length > len(buffer):
+            return 0
+        # the same checksum as the streaming scanner, without a python loop over the bytes
+        frame = memoryview(buffer)[pos + 2:pos + frame_length]
+        try:
+            checksum_ok = ubx_frames.ubx_checksum(frame[:-ubx_frames.CHECKSUM_SIZE]) == tuple(frame[-ubx_frames.CHECKSUM_SIZE:])
+        finally:
+            frame.release()
+        if not checksum_ok:
+            return None
+
+        gps_time = None
+        if msg_class == 0x02 and msg_id == 0x15 and length >= 16:
+            # RXM-RAWX: rcvTow (s) and week
+            rcv_tow, week = struct.unpack_from("<dH", buffer, pos + 6)
+            gps_time = week * SECONDS_IN_WEEK + rcv_tow
+        elif msg_class == 0x01 and length >= 4:
+            # NAV messages start with iTOW (ms)
+            itow = struct.unpack_from("<I", buffer, pos + 6)[0]
+            gps_time = resolve_week(itow / 1000, reference)
+        return frame_length, gps_time
+
+class SbfScanner(FrameScanner):
+    """ Septentrio SBF blocks. Every block contains TOW and WNc """
+
+    sync = b"$@"
+    header_size = 8
+
+    def read_frame(self, buffer, pos, reference):
+        crc, block_id, length = struct.unpack_from("<HHH", buffer, pos + 2)
+        if length < 14 or length % 4 != 0:
+            return None
+        if pos + length > len(buffer):
+            return 0
+        if binascii.crc_hqx(bytes(buffer[pos + 4:pos + length]), 0) != crc:
+            return None
+        tow, wnc = struct.unpack_from("<IH", buffer, pos + 8)
+        gps_time = None
+        if tow != 4294967295 and wnc != 65535:
+            gps_time = wnc * SECONDS_IN_WEEK + tow / 1000
+        return length, gps_time
+
+class Rtcm3Scanner(FrameScanner):
+    """
+        RTCM3 frames. The time comes from the GPS (1001-1004) and MSM messages
+        (GPS, Galileo, SBAS, QZSS, BeiDou, NavIC). Glonass messages are ignored.
+    """
+
+    sync = b"\xd3"
+    header_size = 3
+    GPS_TIME_MESSAGES = set(range(1001, 1005)) | set(range(1071, 1078)) | set(range(1091, 1098)) \
+                        | set(range(1101, 1108)) | set(range(1111, 1118)) | set(range(1131, 1138))
+    BDS_TIME_MESSAGES = set(range(1121, 1128))
+
+    def read_frame(self, buffer, pos, reference):
+        if buffer[pos + 1] & 0xFC:
+            return None
+        length = ((buffer[pos + 1] & 0x03) << 8) | buffer[pos + 2]
+        frame_length = length + 6
+        if pos + frame_length > len(buffer):
+            return 0
+        if crc24q(buffer[pos:pos + 3 + length]) != int.from_bytes(buffer[pos + 3 + length:pos + 6 + length], "big"):
+            return None
+        gps_time = None
+        if length >= 8:
+            # message type (12 bits), station id (12 bits), epoch time (30 bits)
+            bits = int.from_bytes(buffer[pos + 3:pos + 11], "big")
+            msg_type = bits >> 52
+            epoch_ms = (bits >> 10) & 0x3FFFFFFF
+            if msg_type in self.GPS_TIME_MESSAGES:
+                gps_time = resolve_week(epoch_ms / 1000, reference)
+            elif msg_type in self.BDS_TIME_MESSAGES:
+                gps_time = resolve_week(epoch_ms / 1000 + BDT_OFFSET, reference)
+        return frame_length, gps_time
+
+SCANNERS = {"ubx" : UbxScanner(),
+            "sbf" : SbfScanner(),
+            "rtcm3" : Rtcm3Scanner()}
+
+def get_scanner(file_path):
+    """ Return the frame scanner for a file, from its extension, or None """
+    return SCANNERS.get(os.path.splitext(file_path)[1][1:].lower())
+
+def get_name_time(file_name):
+    """ Get the start date inside a str2str file name (GPS seconds), or None """
+    match = FILE_DATE_PATTERN.search(os.path.basename(file_name))
+    if match:
+        try:
+            return utc_to_gps_seconds(datetime(*map(int, match.groups())))
+        except ValueError:
+            pass
+    return None
+
+def get_stream_name(file_name):
+    """ :return the file name without its date (ie _GNSS-1.ubx), the same for all the rotated files of a stream """
+    return FILE_DATE_PATTERN.sub("", os.path.basename(file_name))
+
+def get_reference_time(file_path, name=None):
+    """
+        Get an approximate GPS time for the file start, needed to find the week
+        of the messages without a week number. It uses the date inside the file name,
+        or the file modification time.
+        :param name: the raw file name, if it isn't the file_path name (archive member)
+    """
+    name_time = get_name_time(name or file_path)
+    if name_time is not None:
+        return name_time
+    return utc_to_gps_seconds(datetime.fromtimestamp(os.path.getmtime(file_path), timezone.utc))
+
+def get_sources(file_path, stream_name=None):
+    """
+        Get the raw data streams of a file
+        :param file_path: a raw file, a zip archive or a compressed raw file (ie .ubx.xz)
+        :param stream_name: keep only this stream (see get_stream_name()), the first one by default
+        :return a list of LogSource (the files without supported raw data give an empty list)
+    """
+    name = os.path.basename(file_path)
+    if file_path.lower().endswith(".zip"):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                members = archive.namelist()
+        except (OSError, zipfile.BadZipFile):
+            return []
+        sources = sorted(LogSource(os.path.basename(member), file_path, member, None)
+                         for member in members if get_scanner(member) is not None)
+        if sources and stream_name is None:
+            # don't mix the streams of an archive containing several receivers
+            stream_name = get_stream_name(sources[0].name)
+    else:
+        codec = log_compression.codec_from_extension(file_path)
+        if codec is not None:
+            name = os.path.splitext(name)[0]
+            if not codec.available():
+                return []
+        sources = [LogSource(name, file_path, None, codec)] if get_scanner(name) is not None else []
+    return [source for source in sources if stream_name is None or get_stream_name(source.name) == stream_name]
+
+def iter_source_chunks(source, chunk_size=1024 * 1024):
+    """
+        Read the raw data of an archived source, decompressed on the fly
+        :param source: a LogSource with a member or a codec
+        :return a generator of bytes
+    """
+    if source.member is not None:
+        with zipfile.ZipFile(source.path) as archive, archive.open(source.member) as member:
+            while True:
+                data = member.read(chunk_size)
+                if not data:
+                    return
+                yield data
+    decompressor = source.codec.decompressobj()
+    with open(source.path, "rb") as compressed_file:
+        while True:
+            data = compressed_file.read(chunk_size)
+            if not data:
+                break
+            data = decompressor.decompress(data)
+            if data:
+                yield data
+    if hasattr(decompressor, "flush"):
+        data = decompressor.flush()
+        if data:
+            yield data
+
+class StreamReader:
+    """
+        Minimal file object over a chunks generator, for iter_frames(). The data read
+        is kept until release(), to copy the frames with take().
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.position = 0
+        self.data = bytearray()
+        self.data_offset = 0
+
+    def seek(self, offset):
+        if offset != self.position:
+            raise ValueError("a compressed stream can't seek")
+
+    def read(self, size):
+        data = next(self.chunks, b"")
+        self.data += data
+        self.position += len(data)
+        return data
+
+    def take(self, start, end):
+        return self.data[start - self.data_offset:end - self.data_offset]
+
+    def release(self, offset):
+        # drop the data before offset, once it's half of the buffer: not a copy for each frame
+        if offset - self.data_offset >= len(self.data) // 2:
+            del self.data[:offset - self.data_offset]
+            self.data_offset = offset
+
+def iter_stream_slice(source, start, end, chunk_size=1024 * 1024):
+    """
+        Read the epochs between start and end from an archived source, with the same
+        boundaries as get_slice(): from the first timed frame >= start to the first timed frame > end
+        :param source: a LogSource with a member or a codec
+        :param start: the window start (GPS seconds)
+        :param end: the window end (GPS seconds, included)
+        :return a generator of bytes
+    """
+    scanner = get_scanner(source.name)
+    reader = StreamReader(iter_source_chunks(source))
+    output = bytearray()
+    started = False
+    for frame_offset, frame_length, gps_time in iter_frames(reader, 0, scanner, get_reference_time(source.path, source.name)):
+        if gps_time is not None:
+            if gps_time > end:
+                break
+            started = started or gps_time >= start
+        if started:
+            output += reader.take(frame_offset, frame_offset + frame_length)
+            if len(output) >= chunk_size:
+                yield bytes(output)
+                output.clear()
+        reader.release(frame_offset + frame_length)
+    if output:
+        yield bytes(output)
+
+def iter_frames(log_file, offset, scanner, reference, max_size=None):
+    """
+        Iterate over the valid frames of a file, from offset
+        :param log_file: a binary file object
+        :param offset: the start offset (not necessary a frame boundary)
+        :param scanner: a FrameScanner
+        :param reference: the reference GPS time for the week resolution
+        :param max_size: stop after scanning this number of bytes
+        :return a generator of tuples (frame offset, frame length, gps time or None)
+    """
+    log_file.seek(offset)
+    buffer = bytearray()
+    buffer_offset = offset
+    pos = 0
+    eof = False
+    while True:
+        if max_size is not None and buffer_offset + pos - offset > max_size:
+            return
+        sync_pos = buffer.find(scanner.sync, pos)
+        if sync_pos < 0 or len(buffer) - sync_pos < scanner.header_size:
+            if eof:
+                return
+            # keep the incomplete data, and read more
+            keep_from = sync_pos if sync_pos >= 0 else max(len(buffer) - len(scanner.sync) + 1, pos)
+            del buffer[:keep_from]
+            buffer_offset += keep_from
+            pos = 0
+            data = log_file.read(READ_SIZE)
+            eof = not data
+            buffer += data
+            continue
+        result = scanner.read_frame(buffer, sync_pos, reference)
+        if result == 0:
+            if eof:
+                pos = sync_pos + 1
+                continue
+            pos = sync_pos
+            del buffer[:pos]
+            buffer_offset += pos
+            pos = 0
+            data = log_file.read(max(READ_SIZE, 65536 + 8))
+            eof = not data
+            buffer += data
+            continue
+        if result is None:
+            pos = sync_pos + 1
+            continue
+        frame_length, gps_time = result
+        yield buffer_offset + sync_pos, frame_length, gps_time
+        pos = sync_pos + frame_length
+
+def _first_timed_frame(log_file, offset, scanner, reference, max_size=MAX_PROBE_SIZE):
+    """ Return the first (offset, length, gps time) frame with a time after offset, or None """
+    return next((frame for frame in iter_frames(log_file, offset, scanner, reference, max_size) if frame[2] is not None), None)
+
+def find_offset(log_file, file_size, scanner, target, reference, strict=False):
+    """
+        Find the offset of the first timed frame with a time >= target (> target if strict)
+        with a binary search, then a short linear scan.
+        :return the frame offset, or file_size if all the frames are before target
+    """
+    def after_target(gps_time):
+        return gps_time > target if strict else gps_time >= target
+
+    low, high = 0, file_size
+    while high - low > READ_SIZE:
+        middle = (low + high) // 2
+        frame = _first_timed_frame(log_file, middle, scanner, reference)
+        if frame is None or after_target(frame[2]) or frame[0] >= high:
+            high = middle
+        else:
+            low = frame[0] + frame[1]
+    for frame_offset, frame_length, gps_time in iter_frames(log_file, low, scanner, reference):
+        if gps_time is not None and after_target(gps_time):
+            return frame_offset
+    return file_size
+
+def get_time_span(file_path):
+    """
+        Get the GPS time of the first and last timed frames of a file
+        :return a tuple (first time, last time), or None if there is no timed frame
+    """
+    scanner = get_scanner(file_path)
+    reference = get_reference_time(file_path)
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as log_file:
+        first = _first_timed_frame(log_file, 0, scanner, reference)
+        if first is None:
+            return None
+        window = READ_SIZE
+        while True:
+            start = max(file_size - window, 0)
+            last = None
+            for frame in iter_frames(log_file, start, scanner, reference):
+                if frame[2] is not None:
+                    last = frame
+            if last is not None or start == 0:
+                break
+            window *= 4
+    return first[2], (last or first)[2]
+
+def get_slice(file_path, start, end):
+    """
+        Find the byte range of a file containing the epochs between start and end
+        :param file_path: the raw file path
+        :param start: the window start (GPS seconds)
+        :param end: the window end (GPS seconds, included)
+        :return a tuple (start offset, end offset) with end offset excluded
+    """
+    scanner = get_scanner(file_path)
+    if scanner is None:
+        raise ValueError("{} is not a supported file type".format(file_path))
+    reference = get_reference_time(file_path)
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as log_file:
+        start_offset = find_offset(log_file, file_size, scanner, start, reference)
+        end_offset = find_offset(log_file, file_size, scanner, end, reference, strict=True)
+    return start_offset, max(start_offset, end_offset)
+
+def find_adjacent_logs(file_path):
+    """
+        Find the rotated files from the same stream: same directory and same raw file name
+        once the date is removed (ie *_GNSS-1.ubx), raw or archived, sorted by name.
+        :return a list of LogSource
+    """
+    sources = get_sources(file_path)
+    if not sources:
+        return []
+    stream_name = get_stream_name(sources[0].name)
+    adjacent = set(sources)
+    for path in glob(os.path.join(os.path.dirname(file_path), "*")):
+        if path != file_path and os.path.isfile(path):
+            adjacent.update(get_sources(path, stream_name))
+    return sorted(adjacent)
+
+def get_slices(sources, start, end):
+    """
+        Get the parts of the sources for a time window across several rotated files
+        :param sources: the LogSource list, in chronological order
+        :param start: the window start (GPS seconds)
+        :param end: the window end (GPS seconds, included)
+        :return a list of tuples (file path, start offset, end offset) for the raw files, without
+                empty slices, and (LogSource, None, None) for the archived sources, read with iter_stream_slice()
+    """
+    slices = []
+    for index, source in enumerate(sources):
+        if source.member is not None or source.codec is not None:
+            # an archive is scanned from its start: skip it when the file names show it's outside the window
+            name_time = get_name_time(source.name)
+            next_time = get_name_time(sources[index + 1].name) if index + 1 < len(sources) else None
+            if (name_time is not None and name_time > end) or (next_time is not None and next_time <= start):
+                continue
+            slices.append((source, None, None))
+            continue
+        time_span = get_time_span(source.path)
+        if time_span is None or time_span[1] < start or time_span[0] > end:
+            continue
+        start_offset, end_offset = get_slice(source.path, start, end)
+        if end_offset > start_offset:
+            slices.append((source.path, start_offset, end_offset))
+    return slices
+
+def get_slices_size(slices):
+    """ :return the total size of the slices, or None if an archived source is used """
+    if any(start_offset is None for _, start_offset, _ in slices):
+        return None
+    return sum(end_offset - start_offset for _, start_offset, end_offset in slices)
+
+def iter_slices(slices, start=None, end=None, chunk_size=1024 * 1024):
+    """
+        Read the data from a list of slices
+        :param slices: a list from get_slices()
+        :param start: the window start (GPS seconds), for the archived sources
+        :param end: the window end (GPS seconds, included), for the archived sources
+        :return a generator of bytes
+    """
+    for file_path, start_offset, end_offset in slices:
+        if start_offset is None:
+            yield from iter_stream_slice(file_path, start, end, chunk_size)
+            continue
+        with open(file_path, "rb") as log_file:
+            log_file.seek(start_offset)
+            remaining = end_offset - start_offset
+            while remaining > 0:
+                data = log_file.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+def arg_parse():
+    """ Parse the command line you use to launch the script """
+    parser = argparse.ArgumentParser(prog="log_slicer", description="Extract a time window from raw gnss data files",
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("file", help="raw file (.ubx, .sbf or .rtcm3), zip archive or compressed raw file")
+    parser.add_argument("-s", "--start", help="window start, UTC (ie 2024-05-03T10:00:00)")
+    parser.add_argument("-e", "--end", help="window end, UTC (ie 2024-05-03T12:00:00)")
+    parser.add_argument("-a", "--adjacent", action="store_true", help="use the adjacent rotated files too")
+    parser.add_argument("-o", "--output", help="output file (default: print the time span and the slices)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = arg_parse()
+    sources = find_adjacent_logs(os.path.abspath(args.file)) if args.adjacent else get_sources(os.path.abspath(args.file))
+    if not args.start or not args.end:
+        for source in sources:
+            if source.member is not None or source.codec is not None:
+                print(source.path, source.member or "", "archived")
+                continue
+            span = get_time_span(source.path)
+            print(source.path, "no timed frame" if span is None else " - ".join(str(gps_seconds_to_utc(t)) for t in span))
+    else:
+        start = utc_to_gps_seconds(datetime.fromisoformat(args.start))
+        end = utc_to_gps_seconds(datetime.fromisoformat(args.end))
+        slices = get_slices(sources, start, end)
+        if args.output:
+            with open(args.output, "wb") as output:
+                for data in iter_slices(slices, start, end):
+                    output.write(data)
+        else:
+            for file, start_offset, end_offset in slices:
+                if start_offset is None:
+                    print("{} {} : archived, scanned from its start".format(file.path, file.member or ""))
+                else:
+                    print("{} : {} - {} ({} bytes)".format(file, start_offset, end_offset, end_offset - start_offset))
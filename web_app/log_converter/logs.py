@@ -22,9 +22,10 @@
 # along with ReachView.  If not, see <http://www.gnu.org/licenses/>.
 
 import glob
-import zipfile
 import os
 
+from .log_compression import create_package, DEFAULT_RINEX_COMPRESSION
+
 class LogMetadata:
 
     message_names = {
@@ -208,27 +209,26 @@ class Log:
 
         return files_list
 
-    def createLogPackage(self, package_destination=None):
+    def createLogPackage(self, package_destination=None, compression=DEFAULT_RINEX_COMPRESSION):
         # files_list is a list of tuples [("abspath", "wanted_path_inside_zip"), ... ]
+        # compression is a string like "zip:6" or "crx+xz:6" (see log_compression.py)
 
         if package_destination is None:
             package_destination = os.path.dirname(self.log_path) + "/" + self.log_name + ".zip"
         file_tree = self.prepareLogPackage()
 
-        with zipfile.ZipFile(package_destination, "w") as newzip:
-            for f in file_tree:
-                newzip.write(f[0], f[1])
-
-            newzip.writestr("readme.txt", str(self.log_metadata))
+        # Hatanaka files are temporary files, we delete them with the RINEX files
+        temporary_files = create_package(package_destination, file_tree, compression,
+                                         texts = {"readme.txt": str(self.log_metadata)})
 
         # delete unzipped files
-        self.deleteLogFiles()
+        self.deleteLogFiles(temporary_files)
 
         return package_destination
 
-    def deleteLogFiles(self):
+    def deleteLogFiles(self, extra_files=()):
 
-        all_log_files = self.RINEX_files
+        all_log_files = self.RINEX_files + list(extra_files)
         # all_log_files.append(self.log_path)
 
         for log in all_log_files:
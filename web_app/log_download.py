@@ -0,0 +1,262 @@
+""" Helpers to send the raw gnss data files to the web browser.
+
+    - HTTP Range requests, so a broken download can resume where it stopped
+    - ETag based on the file size and modification time, with If-None-Match/If-Range
+    - zero-copy transfer with os.sendfile when running under gunicorn + gevent
+    - several logs streamed inside a single zip file, without any temporary file
+    - the cpu bound generators (archived log slices) run in the gevent threadpool
+"""
+
+import os
+import time
+import zipfile
+from email.utils import formatdate, parsedate_to_datetime
+
+from flask import Response, abort, request
+
+CHUNK_SIZE = 1024 * 1024
+
+def make_etag(file_stat):
+    """
+        Build an ETag from the file size and modification time
+        :param file_stat: an os.stat_result
+        :return the quoted ETag string
+    """
+    return '"{:x}-{:x}"'.format(file_stat.st_size, file_stat.st_mtime_ns)
+
+def parse_range(range_header, file_size):
+    """
+        Parse a single range "Range: bytes=start-end" header
+        (multiple ranges are not supported, the whole file is sent instead)
+        :param range_header: the Range header value
+        :param file_size: the file size
+        :return a tuple (start, end) with end included, None if the header is not usable,
+            or False if the range is not satisfiable
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    start, _, end = range_header[6:].strip().partition("-")
+    try:
+        if start == "":
+            # suffix range: the last n bytes
+            length = int(end)
+            if length == 0:
+                return False
+            return max(file_size - length, 0), file_size - 1
+        start = int(start)
+        end = int(end) if end else file_size - 1
+    except ValueError:
+        return None
+    if start >= file_size or end < start:
+        return False
+    return start, min(end, file_size - 1)
+
+def _if_range_matches(if_range, etag, file_stat):
+    """ Check if the If-Range header (an ETag or a date) matches the current file """
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    try:
+        return parsedate_to_datetime(if_range).timestamp() >= int(file_stat.st_mtime)
+    except (TypeError, ValueError):
+        return False
+
+def send_log(file_path, download_name=None):
+    """
+        Send a file with Range/ETag support. The file object is sent through the
+        wsgi.file_wrapper so gunicorn can use sendfile, starting at the range offset.
+        :param file_path: the absolute file path (must be already checked against path traversal)
+        :param download_name: the file name proposed to the browser
+        :return a Flask Response
+    """
+    try:
+        file_stat = os.stat(file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        abort(404)
+    if not os.path.isfile(file_path):
+        abort(404)
+
+    download_name = download_name or os.path.basename(file_path)
+    etag = make_etag(file_stat)
+    headers = {"ETag" : etag,
+               "Last-Modified" : formatdate(file_stat.st_mtime, usegmt=True),
+               "Accept-Ranges" : "bytes",
+               "Cache-Control" : "no-cache",
+               "Content-Disposition" : "attachment; filename=\"{}\"".format(download_name.replace('"', ""))}
+
+    if etag in request.headers.get("If-None-Match", ""):
+        return Response(status=304, headers=headers)
+
+    file_size = file_stat.st_size
+    status = 200
+    start, length = 0, file_size
+    if request.headers.get("Range") and _if_range_matches(request.headers.get("If-Range"), etag, file_stat):
+        byte_range = parse_range(request.headers.get("Range"), file_size)
+        if byte_range is False:
+            headers["Content-Range"] = "bytes */{}".format(file_size)
+            return Response(status=416, headers=headers)
+        elif byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            status = 206
+            headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, file_size)
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status=status, headers=headers, content_type="application/octet-stream")
+
+    log_file = open(file_path, "rb")
+    log_file.seek(start)
+    if length == file_size - start or "gunicorn.socket" in request.environ:
+        # gunicorn reads the offset with lseek and sends Content-Length bytes with sendfile
+        body = request.environ.get("wsgi.file_wrapper", _FileWrapper)(log_file, CHUNK_SIZE)
+    else:
+        body = _FileWrapper(log_file, CHUNK_SIZE, length)
+    response = Response(body, status=status, headers=headers, content_type="application/octet-stream",
+                        direct_passthrough=True)
+    return response
+
+class _FileWrapper:
+    """ Iterate over a file by chunks, with an optional length limit """
+
+    def __init__(self, filelike, block_size=CHUNK_SIZE, length=None):
+        self.filelike = filelike
+        self.block_size = block_size
+        self.remaining = length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        size = self.block_size if self.remaining is None else min(self.block_size, self.remaining)
+        data = self.filelike.read(size) if size > 0 else b""
+        if not data:
+            raise StopIteration
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
+
+class _ZipStream:
+    """ A write only buffer used as an unseekable file for zipfile """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def stream_zip(file_paths, download_name):
+    """
+        Stream several files inside a single zip archive, without any temporary file.
+        The files are stored without compression (raw logs are often already compressed
+        and the base cpu is slow), so the zip is built as fast as the files are read.
+        :param file_paths: a list of absolute file paths (already checked against path traversal)
+        :param download_name: the zip file name proposed to the browser
+        :return a Flask Response
+    """
+    for file_path in file_paths:
+        if not os.path.isfile(file_path):
+            abort(404)
+
+    def generate():
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_STORED) as zip_archive:
+            for file_path in file_paths:
+                file_stat = os.stat(file_path)
+                zip_info = zipfile.ZipInfo(os.path.basename(file_path), time.localtime(file_stat.st_mtime)[:6])
+                zip_info.file_size = file_stat.st_size
+                with open(file_path, "rb") as log_file, \
+                     zip_archive.open(zip_info, "w", force_zip64=file_stat.st_size >= zipfile.ZIP64_LIMIT) as zip_member:
+                    while True:
+                        data = log_file.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        zip_member.write(data)
+                        yield stream.pop()
+                yield stream.pop()
+        yield stream.pop()
+
+    headers = {"Content-Disposition" : "attachment; filename=\"{}\"".format(download_name.replace('"', ""))}
+    return Response(generate(), headers=headers, content_type="application/zip")
+
+def iter_in_threadpool(iterator):
+    """
+        Run each step of a blocking or cpu bound iterator in the gevent threadpool, so the
+        other greenlets of the worker (http and socketio clients) aren't stalled meanwhile.
+        Without gevent, the iterator is used as is.
+        :return a generator with the iterator items
+    """
+    try:
+        import gevent
+    except ImportError:
+        yield from iterator
+        return
+    threadpool = gevent.get_hub().threadpool
+    iterator = iter(iterator)
+    end = object()
+    while True:
+        item = threadpool.apply(next, (iterator, end))
+        if item is end:
+            return
+        yield item
+
+def enable_gevent_sendfile():
+    """
+        gevent sockets emulate socket.sendfile() with send() (the file is copied through
+        userspace). This function replaces it with a cooperative os.sendfile() loop
+        so gunicorn sends the files with a zero-copy transfer.
+    """
+    try:
+        from gevent import socket as gsocket
+    except ImportError:
+        return False
+    if not hasattr(os, "sendfile"):
+        return False
+
+    def sendfile(self, file, offset=0, count=None):
+        try:
+            file_no = file.fileno()
+            file_size = os.fstat(file_no).st_size
+        except (AttributeError, OSError):
+            return self._sendfile_use_send(file, offset, count)
+        if not file_size:
+            return 0
+        socket_no = self.fileno()
+        total_sent = 0
+        try:
+            while count is None or total_sent < count:
+                block_size = min(count - total_sent if count else file_size, 1 << 30)
+                try:
+                    sent = os.sendfile(socket_no, file_no, offset, block_size)
+                except BlockingIOError:
+                    gsocket.wait_write(socket_no, timeout=self.gettimeout())
+                    continue
+                except OSError:
+                    if total_sent == 0:
+                        # not a regular file or sendfile not supported by this socket
+                        return self._sendfile_use_send(file, offset, count)
+                    raise
+                if sent == 0:
+                    break
+                offset += sent
+                total_sent += sent
+            return total_sent
+        finally:
+            if total_sent > 0 and hasattr(file, "seek"):
+                file.seek(offset)
+
+    gsocket.socket.sendfile = sendfile
+    return True
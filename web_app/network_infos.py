@@ -1,19 +1,28 @@
 #!/usr/bin/python
 """ Module to get up network interfaces with their ip address and connection name
     These informations are then displayed inside the RTKBase web GUI.
+    NetworkState keeps the last result, and builds it again only when the kernel
+    reports a link or address change (rtnetlink).
 """
 
+import errno
 import logging
-import psutil
-import nmcli
+import socket
+import threading
+import time
 import argparse
 
+import profiling
+import startup
+
+# imported on their first use, not during the web server startup
+psutil = startup.lazy_import("psutil")
+nmcli = startup.lazy_import("nmcli")
+
 logging.basicConfig(format='%(levelname)s: %(message)s')
 log = logging.getLogger(__name__)
 log.setLevel('ERROR')
 
-nmcli.disable_use_sudo()
-
 
 def get_conn_name(device):
     """
@@ -25,6 +34,7 @@ def get_conn_name(device):
         Return:
             str: connection name
     """
+    nmcli.disable_use_sudo()
     try:
         device_infos = nmcli.device.show(device)
         return device_infos["GENERAL.CONNECTION"]
@@ -48,6 +58,7 @@ def get_up_if():
     if_stats = {k:v for (k,v) in if_stats.items() if not k.startswith('docker')} # remove docker interface
     return if_stats
 
+@profiling.timed("network.get_interfaces_infos")
 def get_interfaces_infos():
     """
         Get all up network interfaces with their ip v4/v6 addresses
@@ -70,6 +81,13 @@ def get_interfaces_infos():
     for k,v in up_interface.items():
         up_interface[k] = [ x for x in v if not x.address.startswith('fe80')]
 
+    #all the devices properties with only one nmcli call
+    devices_details = {}
+    if up_interface:
+        nmcli.disable_use_sudo()
+        for details in nmcli.device.show_all(fields="GENERAL.DEVICE,GENERAL.CONNECTION,GENERAL.HWADDR"):
+            devices_details[details.get("GENERAL.DEVICE")] = details
+
     interfaces_infos = []
     for k,v in up_interface.items():
         device_info = {"device" : k}
@@ -83,13 +101,89 @@ def get_interfaces_infos():
             log.debug("{} : {} : {}".format(k, part.family.name, part.address))
         device_info["ipv4"] = ipv4 if len(ipv4) > 0 else None
         device_info["ipv6"] = ipv6 if len(ipv6) > 0 else None
-        conn_name = get_conn_name(k)
+        details = devices_details.get(k, {})
+        conn_name = details.get("GENERAL.CONNECTION")
         if conn_name:
             device_info["conn_name"] = conn_name
-        device_info["hwaddr"] = nmcli.device.show(k).get('GENERAL.HWADDR')
+        device_info["hwaddr"] = details.get("GENERAL.HWADDR")
         interfaces_infos.append(device_info)
     return interfaces_infos
 
+# rtnetlink multicast groups
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+class NetworkState:
+    """ Cached result of get_interfaces_infos() """
+
+    def __init__(self, max_age=60, fallback_max_age=5):
+        """
+            :param max_age: the snapshot is built again after this delay even without
+                any netlink event (a connection renamed in NetworkManager doesn't send one)
+            :param fallback_max_age: the max age used when the netlink socket isn't available
+        """
+        self.max_age = max_age
+        self.fallback_max_age = fallback_max_age
+        self.listening = False
+        self._changed = True
+        self._snapshot = None
+        self._timestamp = 0
+        self._lock = threading.Lock()
+
+    def start_listener(self):
+        """
+            Listen to the rtnetlink link and address events in a thread
+            :return True if the listener is started
+        """
+        if self.listening:
+            return True
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+        except (AttributeError, OSError) as e:
+            log.debug("No netlink socket ({}), the network infos are refreshed every {}s".format(e, self.fallback_max_age))
+            return False
+        self.listening = True
+        threading.Thread(target=self._listen, args=(sock,), daemon=True).start()
+        return True
+
+    def _listen(self, sock):
+        while True:
+            try:
+                # the message content isn't needed, any event means the snapshot is outdated
+                sock.recv(65536)
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    # the socket is unusable: back to the fallback_max_age polling, not a busy loop
+                    log.debug("netlink socket error ({}), the network infos are refreshed every {}s".format(e, self.fallback_max_age))
+                    self.listening = False
+                    self._changed = True
+                    sock.close()
+                    return
+                # ENOBUFS: events were lost, so something changed
+                log.debug("netlink socket error: {}".format(e))
+            self._changed = True
+
+    def get(self):
+        """
+            Get the network interfaces infos, from the cache if nothing changed
+            Return:
+                list: the get_interfaces_infos() result, or None if it failed (no network-manager ?)
+        """
+        max_age = self.max_age if self.listening else self.fallback_max_age
+        with self._lock:
+            if self._changed or time.monotonic() - self._timestamp > max_age:
+                # reset before reading, a change during the reading is kept for the next call
+                self._changed = False
+                try:
+                    self._snapshot = get_interfaces_infos()
+                except Exception as e:
+                    log.debug("Can't get the network interfaces infos: {}".format(e))
+                    self._snapshot = None
+                self._timestamp = time.monotonic()
+            return self._snapshot
+
 def arg_parse():
     """ Parse the command line you use to launch the script """
     
@@ -0,0 +1,299 @@
+""" Profiling and timing hooks for the RTKBase web server.
+
+    - @timed("name") and "with timer(name):" measure a hot path (rtkrcv commands,
+      systemd/D-Bus calls, nmcli, socketio emits, log conversions)
+    - the durations go into log2 histograms owned by the OS thread recording them:
+      no lock when recording. With gevent, all the greenlets of a thread share its
+      histograms, they can't be interrupted during an update.
+    - a time-limited profiler can be started on demand:
+        - "sample": a real OS thread samples the running python stack every few ms,
+          the result is a collapsed stacks text file (flamegraph.pl, speedscope)
+        - "cprofile": cProfile on the server thread, the result is a pstats file
+      the results are written inside a private directory (mode 0700), through a temporary
+      file renamed when complete: no fixed name in a shared directory like /tmp.
+"""
+
+import _thread
+import cProfile
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
+# 1µs to ~30 minutes
+BUCKETS = 32
+MAX_PROFILE_DURATION = 300
+SAMPLE_INTERVAL = 0.005
+# result file name by profiling mode
+PROFILE_RESULTS = {"sample" : "rtkbase_profile.folded", "cprofile" : "rtkbase_profile.pstats"}
+
+# gevent replaces threading.get_ident with the greenlet id, the native id is the OS thread
+_get_thread_id = getattr(threading, "get_native_id", threading.get_ident)
+
+def _original(module, name, default):
+    """ :return the function before the gevent monkey patching """
+    if gevent_monkey is not None and gevent_monkey.is_module_patched(module):
+        return gevent_monkey.get_original(module, name)
+    return default
+
+class Histogram:
+    """ Durations histogram with log2 buckets (in µs) """
+
+    __slots__ = ("count", "total", "max", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[min(int(seconds * 1e6).bit_length(), BUCKETS - 1)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self.buckets = [a + b for a, b in zip(self.buckets, other.buckets)]
+
+    def percentile(self, ratio):
+        """ :return the upper bound (seconds) of the bucket containing the percentile """
+        rank = ratio * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {"count" : self.count,
+                "total" : round(self.total, 6),
+                "avg" : round(self.total / self.count, 6) if self.count else 0,
+                "max" : round(self.max, 6),
+                "p50" : self.percentile(0.5),
+                "p90" : self.percentile(0.9),
+                "p99" : self.percentile(0.99)}
+
+# thread id -> {"name" : thread name, "histograms" : {timer name : Histogram}}
+_threads = {}
+_threads_lock = threading.Lock()
+enabled = True
+
+def _histograms():
+    thread_id = _get_thread_id()
+    thread_stats = _threads.get(thread_id)
+    if thread_stats is None:
+        # only the first record of a thread takes the lock
+        with _threads_lock:
+            thread_stats = _threads.setdefault(thread_id, {"name" : threading.current_thread().name, "histograms" : {}})
+    return thread_stats["histograms"]
+
+def record(name, seconds):
+    """
+        Add a duration to the histograms of the current thread
+        :param name: the timer name (ie rtkrcv.getStatus)
+        :param seconds: the duration
+    """
+    histograms = _histograms()
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = Histogram()
+    histogram.add(seconds)
+
+class timer:
+    """ Context manager measuring a block: with timer("nmcli.show_all"): ... """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if enabled:
+            record(self.name, time.perf_counter() - self.start)
+        return False
+
+def timed(name=None):
+    """
+        Decorator measuring each call of a function
+        :param name: the timer name, the function qualified name by default
+    """
+    def decorator(function):
+        timer_name = name or "{}.{}".format(function.__module__, function.__qualname__)
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(timer_name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def get_timings(by_thread=False):
+    """
+        :param by_thread: also return the histograms of each thread
+        :return a dict {"timers" : {name : stats}} (+ "threads" : {thread name : {name : stats}})
+    """
+    merged = {}
+    threads = {}
+    for thread_id, thread_stats in list(_threads.items()):
+        thread_timers = {}
+        for name, histogram in list(thread_stats["histograms"].items()):
+            merged.setdefault(name, Histogram()).merge(histogram)
+            thread_timers[name] = histogram.to_dict()
+        threads["{} ({})".format(thread_stats["name"], thread_id)] = thread_timers
+    result = {"enabled" : enabled, "timers" : {name : histogram.to_dict() for name, histogram in sorted(merged.items())}}
+    if by_thread:
+        result["threads"] = threads
+    return result
+
+def reset_timings():
+    with _threads_lock:
+        _threads.clear()
+
+class Profiler:
+    """ A single time-limited profiling session at a time """
+
+    def __init__(self, output_dir):
+        """ :param output_dir: the private directory where the results are written, the same for all the workers """
+        self.output_dir = output_dir
+        self.lock = threading.Lock()
+        self.mode = None
+        self.started = None
+        self.duration = 0
+        self.result_path = None
+        self.error = None
+        self._stop = False
+
+    def status(self):
+        """ :return the session state: running, mode, elapsed time, result available """
+        running = self.started is not None
+        return {"running" : running,
+                "mode" : self.mode,
+                "duration" : self.duration,
+                "elapsed" : round(time.time() - self.started, 1) if running else None,
+                "result" : self.result_path is not None and os.path.exists(self.result_path),
+                "error" : self.error}
+
+    def start(self, mode="sample", duration=30):
+        """
+            Start a profiling session in background
+            :param mode: "sample" (statistical, all the threads) or "cprofile"
+            :param duration: the session length in seconds (1 to MAX_PROFILE_DURATION)
+            :return the status, or raise a ValueError if a session is running or the mode is unknown
+        """
+        if mode not in PROFILE_RESULTS:
+            raise ValueError("unknown profiling mode: {}".format(mode))
+        duration = min(max(int(duration), 1), MAX_PROFILE_DURATION)
+        try:
+            self._make_output_dir()
+        except OSError as e:
+            raise ValueError("can't create the profiling directory: {}".format(e))
+        with self.lock:
+            if self.started is not None:
+                raise ValueError("a profiling session is already running")
+            self.mode = mode
+            self.duration = duration
+            self.started = time.time()
+            self.result_path = None
+            self.error = None
+            self._stop = False
+        if mode == "sample":
+            # a real OS thread: it must run while the gevent loop is busy
+            start_new_thread = _original("_thread", "start_new_thread", _thread.start_new_thread)
+            start_new_thread(self._sample, (duration,))
+        else:
+            profile = cProfile.Profile()
+            profile.enable()
+            threading.Thread(target=self._stop_cprofile, args=(profile, duration), daemon=True).start()
+        return self.status()
+
+    def stop(self):
+        """ Stop the running session before its end """
+        self._stop = True
+
+    def _make_output_dir(self):
+        """ Create the output directory, only readable by the web server user """
+        os.makedirs(self.output_dir, mode=0o700, exist_ok=True)
+        if os.path.islink(self.output_dir):
+            raise OSError("{} is a symbolic link".format(self.output_dir))
+        os.chmod(self.output_dir, 0o700)
+
+    def _write_result(self, mode, write):
+        """
+            Write a result to a new temporary file, then rename it to its final name
+            :param mode: the profiling mode, for the result file name
+            :param write: a function writing the result to the path given as argument
+            :return the result path
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.output_dir, prefix=".", suffix=".tmp")
+        os.close(fd)
+        try:
+            write(temp_path)
+            path = os.path.join(self.output_dir, PROFILE_RESULTS[mode])
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return path
+
+    def _finish(self, path, error=None):
+        self.result_path = path if error is None else None
+        self.error = error
+        self.started = None
+
+    def _stop_cprofile(self, profile, duration):
+        deadline = time.time() + duration
+        while not self._stop and time.time() < deadline:
+            time.sleep(0.5)
+        profile.disable()
+        try:
+            self._finish(self._write_result("cprofile", profile.dump_stats))
+        except OSError as e:
+            self._finish(None, str(e))
+
+    def _sample(self, duration):
+        """ Sample the stacks of all the threads except this one """
+        sleep = _original("time", "sleep", time.sleep)
+        own_id = _original("_thread", "get_ident", _thread.get_ident)()
+        stacks = Counter()
+        deadline = time.time() + duration
+        try:
+            while not self._stop and time.time() < deadline:
+                for frame_thread, frame in sys._current_frames().items():
+                    if frame_thread == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append("{} ({}:{})".format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                        frame = frame.f_back
+                    stacks[";".join(reversed(stack))] += 1
+                sleep(SAMPLE_INTERVAL)
+            def write(path):
+                with open(path, "w") as f:
+                    for stack, count in stacks.most_common():
+                        f.write("{} {}\n".format(stack, count))
+            self._finish(self._write_result("sample", write))
+        except Exception as e:
+            self._finish(None, str(e))
@@ -24,18 +24,14 @@
 # along with ReachView.  If not, see <http://www.gnu.org/licenses/>.
 
 import serial
-import binascii
-import ctypes
+import struct
 import subprocess
 from . import reach_tools
-
-def hexify(char_list):
-    """ transform a char list into a list of int values"""
-    return [ord(c) for c in char_list]
+from . import ubx_frames
 
 def enable_nav_timeutc(port):
-    poll_time_utc = ["b5", "62", "06", "01", "03", "00", "01", "21", "01", "2d", "85"]
-    msg = binascii.unhexlify("".join(poll_time_utc))
+    # CFG-MSG: NAV-TIMEUTC on the current port, rate 1
+    msg = ubx_frames.build_frame(0x06, 0x01, bytes(ubx_frames.NAV_TIMEUTC) + b"\x01")
     port.write(msg)
 
 def time_synchronised_by_ntp():
@@ -62,15 +58,22 @@ def update_system_time(date, time):
     cmd = ["date", "-s", datetime_string]
     out = subprocess.check_output(cmd)
 
-def get_gps_time(port):
-
+def get_gps_time(port, scanner=None):
+    """
+        Read the receiver until a NAV-TIMEUTC message
+        :param scanner: a UbxFrameScanner kept between the calls, a message split
+            between two reads is not lost
+        :return the date and time lists, or None, None
+    """
+    if scanner is None:
+        scanner = ubx_frames.UbxFrameScanner(messages={ubx_frames.NAV_TIMEUTC})
     try:
         multiple_bytes = port.read(1024)
     except OSError:
         print("Could not open serial device")
     else:
-        ubx_log = hexify(multiple_bytes)
-        time_data = MSG_NAV_TIMEUTC(ubx_log)
+        time_data = MSG_NAV_TIMEUTC(frame.payload for frame in scanner.feed(multiple_bytes)
+                                    if (frame.msg_class, frame.msg_id) == ubx_frames.NAV_TIMEUTC)
         print(time_data)
 
         if time_data.time_valid:
@@ -90,9 +93,10 @@ def set_gps_time(serial_device, baud_rate):
     print("TIMEUTC enabled")
     time = None
     ntp_not_synced = True
+    scanner = ubx_frames.UbxFrameScanner(messages={ubx_frames.NAV_TIMEUTC})
 
     while time is None and ntp_not_synced:
-        date, time = get_gps_time(port)
+        date, time = get_gps_time(port, scanner)
         ntp_not_synced = not time_synchronised_by_ntp()
 
     if ntp_not_synced:
@@ -100,22 +104,19 @@ def set_gps_time(serial_device, baud_rate):
 
 class MSG_NAV_TIMEUTC:
 
-    msg_start = [0xb5, 0x62, 0x01, 0x21, 0x14, 0x00]
-    msg_length = 28
+    # iTOW, tAcc, nano, year, month, day, hour, min, sec, valid
+    payload_format = struct.Struct("<IIiHBBBBBB")
 
-    def __init__(self, ubx_hex_log):
+    def __init__(self, payloads):
+        """ :param payloads: the payloads of the NAV-TIMEUTC frames (checksum already verified) """
         self.time_valid = False
         self.date = None
         self.time = None
 
-        extracted_messages = self.scan_log(ubx_hex_log)
-
-        if extracted_messages:
-            for msg in extracted_messages:
-                if self.is_valid(msg):
-                    if self.time_is_valid(msg):
-                        self.time_valid = True
-                        self.date, self.time= self.unpack(msg)
+        for payload in payloads:
+            if len(payload) >= self.payload_format.size and self.time_is_valid(payload):
+                self.time_valid = True
+                self.date, self.time = self.unpack(payload)
 
     def __str__(self):
         to_print = "ubx NAV-TIMEUTC message\n"
@@ -130,57 +131,14 @@ class MSG_NAV_TIMEUTC:
 
         return to_print
 
-    def scan_log(self, ubx_hex_log):
-        """Search the provided log for a required msg header"""
-        matches = []
-        pattern = self.msg_start
-        msg_length = self.msg_length
-
-        for i in range(0, len(ubx_hex_log)):
-            if ubx_hex_log[i] == pattern[0] and ubx_hex_log[i:i + len(pattern)] == pattern:
-                matches.append(ubx_hex_log[i:i + msg_length])
-
-        return matches
-
-    def is_valid(self, msg):
-        """Count and verify the checksum of a ubx message. msg is a list of hex values"""
-
-        to_check = msg[2:-2]
-
-        ck_a = ctypes.c_uint8(0)
-        ck_b = ctypes.c_uint8(0)
-
-        for num in to_check:
-            byte = ctypes.c_uint8(num)
-            ck_a.value = ck_a.value + byte.value
-            ck_b.value = ck_b.value + ck_a.value
-
-        if (ck_a.value, ck_b.value) == (ctypes.c_uint8(msg[-2]).value, ctypes.c_uint8(msg[-1]).value):
-            return True
-        else:
-            return False
-
-    def time_is_valid(self, msg):
+    def time_is_valid(self, payload):
         """Check the flags confirming utc time in the message is valid"""
-        flag_byte = ctypes.c_uint8(msg[-3])
-        return True if flag_byte.value & 4 == 4 else False
+        return payload[19] & 4 == 4
 
-    def unpack(self, msg):
+    def unpack(self, payload):
         """Extract the actual time from the message"""
-        datetime = []
-
-        # unpack year
-        byte1 = ctypes.c_uint8(msg[18])
-        byte2 = ctypes.c_uint8(msg[19])
-
-        year = ctypes.c_uint16(byte2.value << 8 | byte1.value).value
-        datetime.append(year)
-        # unpack month, day, hour, minute, second
-        for i in range(20, 25):
-            datetime.append(msg[i])
-
-        date = datetime[:3]
-        time = datetime[3:]
+        values = self.payload_format.unpack_from(payload)
+        date = list(values[3:6])
+        time = list(values[6:9])
 
         return date, time
-
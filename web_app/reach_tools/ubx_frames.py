@@ -0,0 +1,127 @@
+""" Streaming scanner for the u-blox UBX frames
+
+    - the sync chars are found with bytes.find, the header is read with struct
+    - the Fletcher checksum is computed with itertools.accumulate, without a python
+      loop over the bytes
+    - the data can be fed by chunks of any size, a frame split between two reads is
+      completed with the next one
+    - the frames with a bad checksum or an unlikely length are skipped (resync on the
+      next sync chars)
+
+    Example:
+        scanner = UbxFrameScanner(messages={NAV_TIMEUTC})
+        for frame in scanner.feed(port.read(1024)):
+            print(frame.msg_class, frame.msg_id, frame.payload)
+"""
+
+import struct
+from collections import namedtuple
+from itertools import accumulate
+
+SYNC = b"\xb5\x62"
+HEADER = struct.Struct("<BBH")
+HEADER_SIZE = 6
+CHECKSUM_SIZE = 2
+# the biggest payload accepted, a corrupted length must not block the scanner
+MAX_PAYLOAD_SIZE = 8192
+
+# (class, id) of the messages used in the project
+NAV_TIMEUTC = (0x01, 0x21)
+RXM_RAWX = (0x02, 0x15)
+
+UbxFrame = namedtuple("UbxFrame", ["msg_class", "msg_id", "payload"])
+
+def ubx_checksum(data):
+    """
+        Compute the UBX (8 bits Fletcher) checksum
+        :param data: the bytes from the class to the end of the payload
+        :return a tuple (ck_a, ck_b)
+    """
+    sums = list(accumulate(data))
+    if not sums:
+        return 0, 0
+    return sums[-1] & 0xFF, sum(sums) & 0xFF
+
+def build_frame(msg_class, msg_id, payload=b""):
+    """ :return a complete UBX frame (bytes) for a message """
+    body = HEADER.pack(msg_class, msg_id, len(payload)) + bytes(payload)
+    return SYNC + body + bytes(ubx_checksum(body))
+
+class UbxFrameScanner:
+    """ Extract the UBX frames from a byte stream """
+
+    def __init__(self, messages=None, max_payload_size=MAX_PAYLOAD_SIZE):
+        """
+            :param messages: a set of (class, id) to return, None for all the messages
+            :param max_payload_size: the frames with a bigger payload length are
+                considered as corrupted
+        """
+        self.messages = set(messages) if messages is not None else None
+        self.max_payload_size = max_payload_size
+        self.buffer = bytearray()
+        self.frames = 0
+        self.bad_checksums = 0
+
+    def feed(self, data):
+        """
+            Add data to the stream
+            :param data: bytes read from the receiver or a file
+            :return a list of the complete UbxFrame found
+        """
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        pos = 0
+        while True:
+            sync_pos = buffer.find(SYNC, pos)
+            if sync_pos < 0:
+                # keep a last byte which could be the first sync char
+                pos = len(buffer) - 1 if buffer.endswith(SYNC[:1]) else len(buffer)
+                break
+            if len(buffer) - sync_pos < HEADER_SIZE:
+                pos = sync_pos
+                break
+            msg_class, msg_id, length = HEADER.unpack_from(buffer, sync_pos + 2)
+            if length > self.max_payload_size:
+                pos = sync_pos + 1
+                continue
+            end = sync_pos + HEADER_SIZE + length + CHECKSUM_SIZE
+            if end > len(buffer):
+                # wait for the end of the frame
+                pos = sync_pos
+                break
+            wanted = self.messages is None or (msg_class, msg_id) in self.messages
+            if wanted:
+                frame = memoryview(buffer)[sync_pos + 2:end]
+                try:
+                    checksum_ok = ubx_checksum(frame[:-CHECKSUM_SIZE]) == tuple(frame[-CHECKSUM_SIZE:])
+                finally:
+                    frame.release()
+                if not checksum_ok:
+                    self.bad_checksums += 1
+                    pos = sync_pos + 1
+                    continue
+                self.frames += 1
+                frames.append(UbxFrame(msg_class, msg_id, bytes(buffer[sync_pos + HEADER_SIZE:end - CHECKSUM_SIZE])))
+            # the unwanted frames are skipped without checksum, a wrong length only
+            # delays the resync until the next sync chars
+            pos = end if wanted else sync_pos + 2
+        del buffer[:pos]
+        return frames
+
+    def reset(self):
+        self.buffer.clear()
+
+def iter_frames(stream, messages=None, read_size=65536):
+    """
+        Iterate over the UBX frames of a binary file object
+        :param stream: an object with a read(size) method (file, serial port)
+        :param messages: a set of (class, id) to return, None for all the messages
+        :return a generator of UbxFrame
+    """
+    scanner = UbxFrameScanner(messages)
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            return
+        yield from scanner.feed(data)
@@ -0,0 +1,149 @@
+""" Find the RTKBase releases, with a local cache.
+
+    - the release list is stored in a json cache file and reused during a ttl
+    - after the ttl, github is queried with If-None-Match (a 304 answer doesn't
+      count in the github api rate limit)
+    - if github isn't reachable, the cached list is used
+    - the source could be a mirror: another url or a local json file using the
+      github api format (for the bases without internet access)
+    - versions are compared as numbers (2.10.0 > 2.9.0, 2.7.0b1 < 2.7.0)
+"""
+
+import json
+import os
+import re
+import time
+
+import startup
+
+requests = startup.lazy_import("requests")
+
+GITHUB_RELEASES_URL = "https://api.github.com/repos/stefal/rtkbase/releases"
+CACHE_FILE = "/var/tmp/rtkbase_releases.json"
+DEFAULT_TTL = 3600
+
+PRERELEASE_RANKS = {"dev" : 0, "a" : 1, "alpha" : 1, "b" : 2, "beta" : 2, "rc" : 3}
+VERSION_PATTERN = re.compile(r"^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?[-._]?([a-z]+)?[-._]?(\d+)?", re.IGNORECASE)
+
+def parse_version(version):
+    """
+        Convert a version string to a tuple which can be compared
+        ie: "v2.7.0" -> (2, 7, 0, 4, 0)  "2.7.0-beta2" -> (2, 7, 0, 2, 2)
+        :param version: the version string
+        :return a tuple (major, minor, patch, prerelease rank, prerelease number)
+    """
+    match = VERSION_PATTERN.match(version.strip())
+    if match is None:
+        raise ValueError("Invalid version: {}".format(version))
+    major, minor, patch, pre_name, pre_number = match.groups()
+    # a final release is ranked after all its prereleases
+    pre_rank = PRERELEASE_RANKS.get(pre_name.lower(), 0) if pre_name else len(PRERELEASE_RANKS)
+    return (int(major), int(minor or 0), int(patch or 0), pre_rank, int(pre_number or 0))
+
+def _is_local(source):
+    return source.startswith("/") or source.startswith("file://")
+
+def _trim_release(release):
+    """ Keep only the release fields used by RTKBase """
+    return {"tag_name" : release.get("tag_name"),
+            "prerelease" : release.get("prerelease", False),
+            "body" : release.get("body", ""),
+            "assets" : [{"name" : asset.get("name"),
+                         "browser_download_url" : asset.get("browser_download_url"),
+                         "digest" : asset.get("digest"),
+                         "size" : asset.get("size")} for asset in release.get("assets", [])]}
+
+class ReleaseCache:
+    """ The release list, from the cache file or the source """
+
+    def __init__(self, source=None, cache_file=CACHE_FILE, ttl=DEFAULT_TTL, timeout=10):
+        """
+            :param source: the github api url, a mirror url or a local json file (None for github)
+            :param cache_file: the json cache file path
+            :param ttl: how long the cached list is used without asking the source (in seconds)
+            :param timeout: the source request timeout
+        """
+        self.source = source or GITHUB_RELEASES_URL
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # the source has been modified in the settings
+        return cache if cache.get("source") == self.source else None
+
+    def _write_cache(self, cache):
+        tmp_file = self.cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def _fetch(self, cache):
+        """ Get the release list from the source, return the new cache dict """
+        if _is_local(self.source):
+            with open(self.source[7:] if self.source.startswith("file://") else self.source) as f:
+                releases = json.load(f)
+            return {"source" : self.source, "etag" : None, "fetched" : time.time(), "releases" : [_trim_release(release) for release in releases]}
+
+        headers = {"Accept" : "application/vnd.github+json"}
+        if cache is not None and cache.get("etag"):
+            headers["If-None-Match"] = cache["etag"]
+        response = requests.get(self.source, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cache is not None:
+            cache["fetched"] = time.time()
+            return cache
+        response.raise_for_status()
+        return {"source" : self.source,
+                "etag" : response.headers.get("ETag"),
+                "fetched" : time.time(),
+                "releases" : [_trim_release(release) for release in response.json()]}
+
+    def get_releases(self, force=False):
+        """
+            Get the release list
+            :param force: ask the source even if the ttl isn't elapsed
+            :return a list of releases (github api format, only tag_name, prerelease, body and assets)
+        """
+        cache = self._read_cache()
+        if cache is not None and not force and time.time() - cache.get("fetched", 0) < self.ttl:
+            return cache["releases"]
+        try:
+            cache = self._fetch(cache)
+        except Exception as e:
+            if cache is None:
+                raise
+            print("Can't refresh the release list, using the cached one: ", e)
+            return cache["releases"]
+        try:
+            self._write_cache(cache)
+        except OSError as e:
+            print("Can't write the release cache: ", e)
+        return cache["releases"]
+
+def find_update(releases, current_version, prerelease=False, checkpoint_version=None):
+    """
+        Find the most recent release newer than the current version
+        :param releases: a release list (see ReleaseCache.get_releases)
+        :param current_version: the current RTKBase version
+        :param prerelease: True to accept the prereleases
+        :param checkpoint_version: don't go beyond this version (a mandatory step for the updates)
+        :return the release dict or None
+    """
+    current = parse_version(current_version)
+    checkpoint = parse_version(checkpoint_version) if checkpoint_version else None
+    candidates = []
+    for release in releases:
+        if release.get("prerelease") and not prerelease:
+            continue
+        try:
+            version = parse_version(release.get("tag_name", ""))
+        except ValueError:
+            continue
+        if version > current and (checkpoint is None or version <= checkpoint):
+            candidates.append((version, release))
+    return max(candidates, key=lambda candidate: candidate[0])[1] if candidates else None
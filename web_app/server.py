@@ -31,21 +31,34 @@
 from gevent import monkey
 monkey.patch_all()
 
+#first import: the startup timeline starts here
+import startup
 import time
 import json
 import os
 import shutil
 import sys
-import requests
 import tempfile
 import argparse
 import html
+import itertools
 
 from threading import Thread
+from datetime import datetime
 from RTKLIB import RTKLIB
 from ServiceController import ServiceController
 from RTKBaseConfigManager import RTKBaseConfigManager
 import network_infos
+import log_download
+import state_bus
+import api_snapshot
+import journal_reader
+import update_fetcher
+import release_checker
+import system_metrics
+import broadcast_bus
+import profiling
+from log_converter import log_slicer
 
 #print("Installing all required packages")
 #provisioner.provision_reach()
@@ -64,8 +77,7 @@ from wtforms.validators import ValidationError, DataRequired, EqualTo
 from flask_socketio import SocketIO, emit, disconnect
 import urllib
 import subprocess
-import psutil
-import distro
+distro = startup.lazy_import("distro")
 import socket
 
 from werkzeug.security import generate_password_hash
@@ -85,19 +97,44 @@ app.config['UPLOAD_EXTENSIONS'] = ['.conf', '.txt', 'ini']
 rtkbase_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../"))
 path_to_rtklib = "/usr/local/bin" #TODO find path with which or another tool
 
+#Get settings from settings.conf.default and settings.conf
+rtkbaseconfig = RTKBaseConfigManager(os.path.join(rtkbase_path, "settings.conf.default"), os.path.join(rtkbase_path, "settings.conf"))
+
 login=LoginManager(app)
 login.login_view = 'login_page'
-socketio = SocketIO(app, async_mode = 'gevent')
+#With several workers, the socketio messages are relayed between the processes through the state bus
+web_workers = max(1, int(rtkbaseconfig.get("general", "web_workers", fallback="1").strip("'") or 1))
+if web_workers > 1:
+    socketio = SocketIO(app, async_mode = 'gevent', client_manager=state_bus.HubManager(state_bus.SOCKET_PATH))
+else:
+    socketio = SocketIO(app, async_mode = 'gevent')
+#time spent in each emit (serialization, relay to the other workers)
+socketio.emit = profiling.timed("socketio.emit")(socketio.emit)
+#slow initialisations, run in background once the web server listens
+startup_stages = startup.StagedStartup()
 bootstrap = Bootstrap4(app)
 
-#Get settings from settings.conf.default and settings.conf
-rtkbaseconfig = RTKBaseConfigManager(os.path.join(rtkbase_path, "settings.conf.default"), os.path.join(rtkbase_path, "settings.conf"))
 app.config["DOWNLOAD_FOLDER"] = rtkbaseconfig.get("local_storage", "datadir").strip("'")
+#on-demand profiling session, started from /api/v1/profiling/start. The results go to a private
+#directory inside the datadir (hidden from the logs list), reachable by all the workers
+profiler = profiling.Profiler(os.path.join(app.config["DOWNLOAD_FOLDER"], ".profiling"))
 
 rtk = RTKLIB(socketio,
             rtklib_path=path_to_rtklib,
             log_path=app.config["DOWNLOAD_FOLDER"],
             )
+rtk.logm.rinex_compression = rtkbaseconfig.get("local_storage", "rinex_compression", fallback="zip:6").strip("'")
+#state served by the /api/v1 routes, updated by the manager and the rtkrcv broadcast threads
+state_snapshot = api_snapshot.StateSnapshot()
+#network interfaces infos, refreshed only after a netlink event
+network_state = network_infos.NetworkState()
+#live data sent to the web clients, coalesced by tick and rate limited by client
+bus = broadcast_bus.BroadcastBus(socketio, namespace="/test")
+rtk.bus = bus
+#system metrics (cpu temperature, load, memory, storage, network) with a 24h history
+metrics_sampler = system_metrics.MetricsSampler(volume=rtk.logm.log_path,
+                                                cpu_temp_offset=int(rtkbaseconfig.get("general", "cpu_temp_offset")))
+rtk.snapshot = state_snapshot
 
 services_list = [{"service_unit" : "str2str_tcp.service", "name" : "main"},
                  {"service_unit" : "str2str_ntrip_A.service", "name" : "ntrip_A"},
@@ -112,9 +149,15 @@ services_list = [{"service_unit" : "str2str_tcp.service", "name" : "main"},
                  {'service_unit' : 'rtkbase_gnss_web_proxy.service', "name": "RTKBase Reverse Proxy for Gnss receiver Web Server"}
                  ]
 
+rtkbase_web_service = {'service_unit' : 'rtkbase_web.service', 'name' : 'RTKBase Web Server', 'active' : True}
+#journal live tails for the diagnostic page {socketio sid : JournalTail}
+journal_tails = {}
+
 #Delay before rtkrcv will stop if no user is on status.html page
 rtkcv_standby_delay = 600
 connected_clients = 0
+#Delay between two services/system probes for the api when nobody is on the web pages
+api_probe_interval = 10
 
 class StandaloneApplication(gunicorn.app.base.BaseApplication):
     def __init__(self, app, options=None):
@@ -131,6 +174,15 @@ class StandaloneApplication(gunicorn.app.base.BaseApplication):
     def load(self):
         return self.application
 
+def post_fork(server, worker):
+    """
+        gunicorn hook running in each new worker when web_workers > 1
+        The master process keeps rtkrcv, the services and the manager thread,
+        the worker only serves the web pages and the socketio clients.
+    """
+    state_bus.set_role(state_bus.ROLE_WORKER)
+    state_bus.detach_inherited_greenlets()
+
 class User(UserMixin):
     """ Class for user authentification """
     def __init__(self, username):
@@ -166,39 +218,44 @@ def manager():
         And it sends various system informations to the web interface
     """
     max_cpu_temp = 0
-    cpu_temp_offset = int(rtkbaseconfig.get("general", "cpu_temp_offset"))
     services_status = getServicesStatus(emit_pingback=False)
     main_service = {}
+    loop_count = 0
     while True:
-        # Make sure max_cpu_temp is always updated
-        cpu_temp = get_cpu_temp() + cpu_temp_offset
+        # Make sure max_cpu_temp and the metrics history are always updated
+        metrics = metrics_sampler.sample()
+        cpu_temp = metrics["cpu_temp"]
         max_cpu_temp = max(cpu_temp, max_cpu_temp)
 
-        if connected_clients > 0:
+        if connected_clients > 0 or loop_count % api_probe_interval == 0:
             # We only need to emit to the socket if there are clients able to receive it.
+            # Without clients, the status is only refreshed for the api snapshot.
             updated_services_status = getServicesStatus(emit_pingback=False)
             main_service = updated_services_status[0]
-            if  services_status != updated_services_status:
+            state_snapshot.update("services", updated_services_status)
+            if  services_status != updated_services_status and connected_clients > 0:
                 services_status = updated_services_status
-                socketio.emit("services status", json.dumps(services_status), namespace="/test")
+                bus.publish("services status", services_status, json_string=True)
                 #print("service status", services_status)
 
-            try:
-                interfaces_infos = network_infos.get_interfaces_infos()
-            except Exception:
-                # network-manager not installed ?
-                interfaces_infos = None
+            interfaces_infos = network_state.get()
 
-            volume_usage = get_volume_usage()
             sys_infos = {"cpu_temp" : cpu_temp,
                         "max_cpu_temp" : max_cpu_temp,
                         "uptime" : get_uptime(),
-                        "volume_free" : round(volume_usage.free / 10E8, 2),
-                        "volume_used" : round(volume_usage.used / 10E8, 2),
-                        "volume_total" : round(volume_usage.total / 10E8, 2),
-                        "volume_percent_used" : volume_usage.percent,
+                        "volume_free" : round(metrics["volume_free"] / 10E8, 2),
+                        "volume_used" : round(metrics["volume_used"] / 10E8, 2),
+                        "volume_total" : round(metrics["volume_total"] / 10E8, 2),
+                        "volume_percent_used" : metrics["volume_percent"],
                         "network_infos" : interfaces_infos}
-            socketio.emit("sys_informations", json.dumps(sys_infos), namespace="/test")
+            #the api status only keeps slow changing values, else each probe would make a new snapshot version
+            #and the ETag/since polling would never get a 304: boot time instead of uptime, temperature by 5°C steps
+            api_status = {key : value for key, value in sys_infos.items() if key != "uptime"}
+            api_status.update(cpu_temp=round(cpu_temp / 5) * 5, boot_time=metrics_sampler.boot_time(),
+                              rtk_state=rtk.state, app_version=rtkbaseconfig.get("general", "version"))
+            state_snapshot.update("status", api_status)
+            if connected_clients > 0:
+                bus.publish("sys_informations", sys_infos, json_string=True)
 
         if rtk.sleep_count > rtkcv_standby_delay and rtk.state != "inactive" or \
                  main_service.get("active") == False and rtk.state != "inactive":
@@ -207,6 +264,7 @@ def manager():
                 rtk.sleep_count = 0
         elif rtk.sleep_count > rtkcv_standby_delay:
             print("I'd like to stop rtkrcv (sleep_count = {}), but rtk.state is: {}".format(rtk.sleep_count, rtk.state))
+        loop_count += 1
         time.sleep(1)
 
 def repaint_services_button(services_list):
@@ -257,70 +315,44 @@ def old_get_cpu_temp():
         current_temp = 75
     return current_temp
 
-def get_cpu_temp():
-    try:
-        temps = psutil.sensors_temperatures()
-        current_cpu_temp = round(temps.get('cpu_thermal')[0].current, 1)
-    except:
-        current_cpu_temp = 0
-    return current_cpu_temp
-
 def get_uptime():
-    return round(time.time() - psutil.boot_time())
-
-def get_volume_usage(volume = rtk.logm.log_path):
-    try:
-        volume_info = psutil.disk_usage(volume)
-    except FileNotFoundError:
-        volume_info = psutil.disk_usage("/")
-    return volume_info
+    return metrics_sampler.uptime()
 
 def get_sbc_model():
     """
         Try to detect the single board computer used
         :return the model name or unknown if not detected
     """
-    answer = subprocess.run(["cat", "/proc/device-tree/model"], encoding="UTF-8", stderr=subprocess.PIPE, stdout=subprocess.PIPE, check=False)
-    if answer.returncode == 0:
-        sbc_model = answer.stdout.split("\n").pop().strip()
-    else:
-        sbc_model = "unknown"
-    return sbc_model
+    # read once at startup
+    return metrics_sampler.sbc_model
 
 @socketio.on("check update", namespace="/test")
 def check_update(source_url = None, current_release = None, prerelease=rtkbaseconfig.getboolean("general", "prerelease"), return_emit = True):
     """
         Check if a RTKBase update exists
-        :param source_url: the url where we will try to find an update. It uses the github api.
+        :param source_url: the url where we will try to find an update. It uses the github api,
+            or the update_source setting (a mirror url or a local json file)
         :param current_release: The current RTKBase release
         :param prerelease: True/False Get prerelease or not
         :param emit: send the result to the web front end with socketio
         :return The new release version inside a dict (release version and url for this release)
     """
-    ## test
-    #new_release = {'url' : 'http://localhost', 'new_release' : "3.9", "comment" : "blabla"}
-    #if emit:
-    #    socketio.emit("new release", json.dumps(new_release), namespace="/test")
-    #return new_release
-    ## test
     new_release = {}
-    source_url = source_url if source_url is not None else "https://api.github.com/repos/stefal/rtkbase/releases"
     current_release = current_release if current_release is not None else rtkbaseconfig.get("general", "version").strip("v")
-    current_release = current_release.split("-beta", 1)[0].split("-alpha", 1)[0].split("-rc", 1)[0].split("b", 1)[0]
+    release_cache = release_checker.ReleaseCache(source_url or rtkbaseconfig.get("general", "update_source", fallback="").strip("'") or None,
+                                                 ttl=int(rtkbaseconfig.get("general", "update_check_ttl", fallback="3600").strip("'") or 0))
 
     try:
-        response = requests.get(source_url)
-        response = response.json()
-        for release in response:
-            if release.get("prerelease") & prerelease or release.get("prerelease") == False:
-                latest_release = release.get("tag_name").strip("v").replace("-beta", "").replace("-alpha", "").replace("-rc", "")
-                if latest_release > current_release and latest_release <= rtkbaseconfig.get("general", "checkpoint_version"):
-                    new_release = {"new_release" : release.get("tag_name"), "comment" : release.get("body")}
-                    #find url for rtkbase.tar.gz
-                    for i, asset in enumerate(release["assets"]):
-                        if "rtkbase.tar.gz" in asset["name"]:
-                            new_release["url"] = asset.get("browser_download_url")
-                            break
+        release = release_checker.find_update(release_cache.get_releases(), current_release, prerelease,
+                                              rtkbaseconfig.get("general", "checkpoint_version"))
+        if release is not None:
+            new_release = {"new_release" : release.get("tag_name"), "comment" : release.get("body")}
+            #find url for rtkbase.tar.gz
+            for asset in release["assets"]:
+                if "rtkbase.tar.gz" in asset["name"]:
+                    new_release["url"] = asset.get("browser_download_url")
+                    new_release["digest"] = asset.get("digest")
+                    new_release["size"] = asset.get("size")
                     break
 
     except Exception as e:
@@ -332,6 +364,8 @@ def check_update(source_url = None, current_release = None, prerelease=rtkbaseco
     return new_release
 
 @socketio.on("update rtkbase", namespace="/test")
+#downloads/extracts an archive or runs the receiver configuration script: can take several minutes
+@state_bus.owner_call(timeout=1800)
 def update_rtkbase(update_file=False):
     """
         Check if a RTKBase update exists, download it and update rtkbase
@@ -339,19 +373,17 @@ def update_rtkbase(update_file=False):
     """
 
     shutil.rmtree("/var/tmp/rtkbase", ignore_errors=True)
-    import tarfile
 
     if not update_file:
         #Check if an update is available
-        update_url = check_update(return_emit=False).get("url")
-        if update_url is None:
+        new_release = check_update(return_emit=False)
+        if new_release.get("url") is None:
             return
         #Download update
-        update_archive = download_update(update_url)
+        update_archive = download_update(new_release["url"], new_release.get("digest"), new_release.get("size"))
     else:
-        #update from file
-        update_file.save("/var/tmp/rtkbase_update.tar.gz")
-        update_archive = "/var/tmp/rtkbase_update.tar.gz"
+        #update from file (already saved by settings_page)
+        update_archive = update_file
         print("update stored in /var/tmp/")
 
     if update_archive is None:
@@ -360,22 +392,13 @@ def update_rtkbase(update_file=False):
     else:
         socketio.emit("downloading_update", json.dumps({"result": 'true'}), namespace="/test")
 
-    #Get the "root" folder in the archive
-    tar = tarfile.open(update_archive)
-    for tarinfo in tar:
-        if tarinfo.isdir():
-            primary_folder = tarinfo.name
-            break
-    #Delete previous update directory
+    #Extract archive (with a tar process, the web server is not blocked)
     try:
-        os.rmdir("/var/tmp/rtkbase")
-    except FileNotFoundError:
-        print("/var/tmp/rtkbase directory doesn't exist")
-
-    #Extract archive
-    tar.extractall("/var/tmp")
-
-    source_path = os.path.join("/var/tmp/", primary_folder)
+        source_path = update_fetcher.extract(update_archive, "/var/tmp")
+    except Exception as e:
+        print("Error: Can't extract update - ", e)
+        socketio.emit("updating_rtkbase_stopped", json.dumps({"error" : ["Can't extract the update archive", repr(e)]}), namespace="/test")
+        return
     script_path = os.path.join(source_path, "tools", "rtkbase_update.sh")
     data_dir = app.config["DOWNLOAD_FOLDER"].split("/")[-1]
     current_release = rtkbaseconfig.get("general", "version").strip("v")
@@ -395,26 +418,37 @@ def update_rtkbase(update_file=False):
         subprocess.Popen([script_path, source_path, rtkbase_path, data_dir, current_release, standard_user])
         #os.execl('/var/tmp/rtkbase_update.sh', "unused arg0", source_path, rtkbase_path, data_dir, current_release, standard_user)
 
-def download_update(update_path):
-    update_archive = "/var/tmp/rtkbase_update.tar.gz"
+def download_update(update_path, digest=None, size=None):
+    """
+        Download the update archive to /var/tmp, streamed to disk and resumed if the connection breaks.
+        The download progress is sent to the web front end.
+        :param update_path: the archive url
+        :param digest: the archive expected digest ("sha256:<hex>")
+        :param size: the archive size from the release metadata
+        :return the archive path or None if the download failed
+    """
+    def send_progress(downloaded, total):
+        socketio.emit("downloading_update", json.dumps({"result": "progress", "downloaded" : downloaded, "total" : total}), namespace="/test")
+
     try:
-        response = requests.get(update_path)
-        with open(update_archive, "wb") as f:
-            f.write(response.content)
+        return update_fetcher.download(update_path, "/var/tmp/rtkbase_update.tar.gz", digest=digest, size=size, progress=send_progress)
     except Exception as e:
         print("Error: Can't download update - ", e)
         return None
-    else:
-        return update_archive
 
 @app.before_request
 def inject_global_infos():
     """
         Insert various informations as global variables for Flask/Jinja
     """
+    if state_bus.is_worker():
+        #settings.conf could have been modified by the master process
+        rtkbaseconfig.reload_if_modified()
     g.version = rtkbaseconfig.get("general", "version")
     g.station_name = rtkbaseconfig.get_ntrip_A_settings()[4]['mnt_name_A']
     g.sbc_model = get_sbc_model()
+    #the workers don't share the long-polling sessions, the clients must use websocket only
+    g.socketio_options = {"transports" : ["websocket"]} if web_workers > 1 else {}
 
 @login.user_loader
 def load_user(user_id):
@@ -442,7 +476,8 @@ def settings_page():
     if request.method == 'POST':
         uploaded_file = request.files['file']
         if uploaded_file.filename != '':
-            update_rtkbase(uploaded_file)
+            uploaded_file.save("/var/tmp/rtkbase_update.tar.gz")
+            update_rtkbase("/var/tmp/rtkbase_update.tar.gz")
         else:
             print("wrong update file")
         return ('', 204)
@@ -489,11 +524,66 @@ def logs_page():
 @app.route("/logs/download/<path:log_name>")
 @login_required
 def downloadLog(log_name):
-    """ Route for downloading raw gnss data"""
+    """ Route for downloading raw gnss data (with Range requests support to resume a download)"""
+    log_path = safe_join(rtk.logm.log_path, log_name)
+    if log_path is None:
+        abort(404)
+    return log_download.send_log(log_path)
+
+@app.route("/logs/download_slice/<path:log_name>")
+@login_required
+def downloadLogSlice(log_name):
+    """ Route for downloading a time window from a raw gnss data file (.ubx, .sbf, .rtcm3)
+        ie: /logs/download_slice/file.ubx?start=2024-05-03T10:00:00&end=2024-05-03T12:00:00&adjacent=true
+        start and end are UTC times, or times with an offset. With adjacent=true, the other rotated files from the same stream
+        are used too. The archived files (zip, gz, bz2, xz, zst) are decompressed on the fly.
+    """
+    log_path = safe_join(rtk.logm.log_path, log_name)
+    if log_path is None or not os.path.isfile(log_path):
+        abort(404)
+    sources = log_slicer.get_sources(log_path)
+    if not sources:
+        abort(400, "Only ubx, sbf and rtcm3 files (raw or archived) can be sliced")
     try:
-        return send_from_directory(rtk.logm.log_path, log_name, as_attachment = True)
-    except FileNotFoundError:
+        start = log_slicer.to_utc(datetime.fromisoformat(request.args.get("start", "")))
+        end = log_slicer.to_utc(datetime.fromisoformat(request.args.get("end", "")))
+    except ValueError:
+        abort(400, "start and end must be ISO 8601 times")
+    if end < start:
+        abort(400, "end is before start")
+
+    if request.args.get("adjacent", "false").lower() == "true":
+        sources = log_slicer.find_adjacent_logs(log_path)
+    gps_start, gps_end = log_slicer.utc_to_gps_seconds(start), log_slicer.utc_to_gps_seconds(end)
+    slices = log_slicer.get_slices(sources, gps_start, gps_end)
+    # the archived files are decompressed and scanned from their start: in the threadpool, not in the worker loop
+    data = log_download.iter_in_threadpool(log_slicer.iter_slices(slices, gps_start, gps_end))
+    # the archived files are only scanned while streaming: read the first chunk to know if the window is empty
+    first_chunk = next(data, None)
+    if first_chunk is None:
+        abort(404, "No data in this time window")
+    name, extension = os.path.splitext(sources[0].name)
+    slice_name = "{}_{}_{}{}".format(name, start.strftime("%Y%m%d%H%M%S"), end.strftime("%Y%m%d%H%M%S"), extension)
+    headers = {"Content-Disposition" : "attachment; filename=\"{}\"".format(slice_name)}
+    size = log_slicer.get_slices_size(slices)
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return app.response_class(itertools.chain((first_chunk,), data), headers=headers, content_type="application/octet-stream")
+
+@app.route("/logs/download_zip")
+@login_required
+def downloadLogsZip():
+    """ Route for downloading several raw gnss data files inside a single zip file
+        ie: /logs/download_zip?log=file1.ubx&log=file2.ubx
+    """
+    log_names = request.args.getlist("log")
+    if not log_names:
+        abort(400)
+    log_paths = [safe_join(rtk.logm.log_path, log_name) for log_name in log_names]
+    if None in log_paths:
         abort(404)
+    zip_name = "RTKBase_{}_{}.zip".format(rtkbaseconfig.get("ntrip_A", "mnt_name_a").strip("'"), time.strftime("%Y-%m-%d_%HH%M"))
+    return log_download.stream_zip(log_paths, zip_name)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login_page():
@@ -524,28 +614,47 @@ def logout():
 @login_required
 def diagnostic():
     """
-    Get services journal and status
+    Get services list and status. The page loads the systemctl status
+    and the journal of a service only when it is opened.
     """
-    getServicesStatus()
-    rtkbase_web_service = {'service_unit' : 'rtkbase_web.service', 'name' : 'RTKBase Web Server', 'active' : True}
-    logs = []
-    for service in services_list + [rtkbase_web_service]:
-        sysctl_status = subprocess.run(['systemctl', 'status', service['service_unit']],
-                                stdout=subprocess.PIPE,
-                                universal_newlines=True,
-                                check=False)
-        journalctl = subprocess.run(['journalctl', '--since', '7 days ago', '-u', service['service_unit']], 
-                                 stdout=subprocess.PIPE,
-                                 universal_newlines=True,
-                                 check=False)
-        
-        #Replace carrier return to <br> for html view
-        sysctl_status = html.escape(sysctl_status.stdout).replace('\n', '<br>')
-        journalctl = html.escape(journalctl.stdout).replace('\n', '<br>')
+    services_status = getServicesStatus()
+    services = []
+    for service in services_status + [rtkbase_web_service]:
         active_state = "Active" if service.get('active') == True else "Inactive"
-        logs.append({'name' : service['service_unit'], 'active' : active_state, 'sysctl_status' : sysctl_status, 'journalctl' : journalctl})
-        
-    return render_template('diagnostic.html', logs = logs)
+        services.append({'name' : service['service_unit'], 'active' : active_state})
+    return render_template('diagnostic.html', services = services, priorities = journal_reader.PRIORITIES)
+
+def get_diagnostic_units():
+    """Only the RTKBase services journal can be read"""
+    return [service['service_unit'] for service in services_list + [rtkbase_web_service]]
+
+def check_diagnostic_unit(unit):
+    if unit not in get_diagnostic_units():
+        abort(404)
+
+@app.route('/diagnostic/status/<unit>')
+@login_required
+def diagnostic_status(unit):
+    """Get the systemctl status of a service"""
+    check_diagnostic_unit(unit)
+    return app.response_class(journal_reader.get_unit_status(unit), mimetype="text/plain")
+
+@app.route('/diagnostic/journal/<unit>')
+@login_required
+def diagnostic_journal(unit):
+    """
+    Stream a page of the service journal, from the newest to the oldest entry
+    ie: /diagnostic/journal/str2str_tcp.service?cursor=..&priority=4&limit=200
+    cursor is the next_cursor value from the previous page
+    """
+    check_diagnostic_unit(unit)
+    limit = min(max(request.args.get("limit", journal_reader.DEFAULT_PAGE_SIZE, type=int), 1), journal_reader.MAX_PAGE_SIZE)
+    priority = request.args.get("priority", None, type=int)
+    if priority not in range(len(journal_reader.PRIORITIES)):
+        priority = None
+    page = journal_reader.iter_page_json(unit, cursor=request.args.get("cursor") or None, priority=priority,
+                                         since=request.args.get("since") or None, limit=limit)
+    return app.response_class(page, mimetype="application/json")
 
 
 @app.route('/api/v1/infos', methods=['GET'])
@@ -560,12 +669,172 @@ def get_infos():
              "hostname" : socket.gethostname()}
     return json.dumps(infos)
 
+@state_bus.owner_call
+def get_startup_status():
+    """ Read the startup timeline (inside the process running the startup stages) """
+    return startup_stages.status()
+
+@app.route('/api/v1/startup', methods=['GET'])
+@login_required
+def get_api_startup():
+    """Api route to get the web server startup timeline: imports, listening, background stages, ready"""
+    return app.response_class(json.dumps(get_startup_status()), mimetype="application/json")
+
+@app.route('/api/v1/startup/ready', methods=['GET'])
+def get_api_startup_ready():
+    """Public api route to know if the background startup stages are done, without the timeline"""
+    return app.response_class(json.dumps({"ready" : get_startup_status()["ready"]}), mimetype="application/json")
+
+@state_bus.owner_call
+def get_api_state(sections=None, since=0):
+    """
+        Read the state snapshot (inside the process owning it)
+        :param sections: a list of section names (None for all the sections)
+        :param since: only the sections changed after this version are returned
+    """
+    return state_snapshot.get(sections, since)
+
+def api_snapshot_response(sections=None):
+    """
+        Build the api response from the state snapshot, with the snapshot version
+        as ETag. An If-None-Match request with the same version gets a 304 Not Modified.
+        :param sections: a list of section names (None for all the sections)
+    """
+    since = request.args.get("since", 0, type=int)
+    state = get_api_state(sections, since)
+    etag = str(state["version"]) if since == 0 else "{}-{}".format(state["version"], since)
+    response = app.response_class(json.dumps(state), mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+@app.route('/api/v1/state', methods=['GET'])
+@login_required
+def get_api_full_state():
+    """
+        Api route to get all the state sections: status, services, satellites, rtkrcv, logs, settings
+        ie: /api/v1/state?since=152 to get only the sections updated after the version 152
+    """
+    return api_snapshot_response()
+
+@app.route('/api/v1/<any(status, services, satellites, rtkrcv, logs, settings):section>', methods=['GET'])
+@login_required
+def get_api_section(section):
+    """Api route to get a single state section"""
+    return api_snapshot_response([section])
+
+@state_bus.owner_call
+def get_metrics_history(metrics=None, since=0):
+    """
+        Read the system metrics history (inside the process running the sampler)
+        :param metrics: a list of metric names (None for all the metrics)
+        :param since: skip the values older than this timestamp
+    """
+    return metrics_sampler.get_history(metrics, since)
+
+@state_bus.owner_call
+def get_bus_stats():
+    """ Read the broadcast bus counters (inside the process running the bus) """
+    return bus.get_stats()
+
+@app.route('/api/v1/broadcast', methods=['GET'])
+@login_required
+def get_api_broadcast_stats():
+    """Api route to get the live data counters: messages and bytes sent by topic"""
+    return app.response_class(json.dumps(get_bus_stats()), mimetype="application/json")
+
+@app.route('/api/v1/metrics', methods=['GET'])
+@login_required
+def get_api_metrics():
+    """
+        Api route to get the system metrics history (24h, min/max/avg by minute)
+        ie: /api/v1/metrics?metrics=cpu_temp,load&since=1760000000
+    """
+    metrics = request.args.get("metrics")
+    history = get_metrics_history(metrics.split(",") if metrics else None, request.args.get("since", 0, type=int))
+    return app.response_class(json.dumps({"metrics" : history}), mimetype="application/json")
+
+@state_bus.owner_call
+def get_profiling_timings(by_thread=False, reset=False):
+    """
+        Read the timing histograms (inside the process running rtkrcv and the services)
+        :param by_thread: also return the histograms of each thread
+        :param reset: clear the histograms after reading them
+    """
+    timings = profiling.get_timings(by_thread)
+    if reset:
+        profiling.reset_timings()
+    return timings
+
+@state_bus.owner_call
+def start_profiler(mode="sample", duration=30):
+    """ Start a profiling session, return its status or an error message """
+    try:
+        return profiler.start(mode, duration)
+    except ValueError as e:
+        return {"error" : str(e)}
+
+@state_bus.owner_call
+def get_profiler_status(stop=False):
+    """ :param stop: stop the running session before its end """
+    if stop:
+        profiler.stop()
+    return profiler.status()
+
+@app.route('/api/v1/profiling/timings', methods=['GET'])
+@login_required
+def get_api_profiling_timings():
+    """
+        Api route to get the duration histograms of the hot paths (rtkrcv, services, network, emits, conversions)
+        ie: /api/v1/profiling/timings?threads=true&reset=true
+    """
+    timings = get_profiling_timings(request.args.get("threads") == "true", request.args.get("reset") == "true")
+    return app.response_class(json.dumps(timings), mimetype="application/json")
+
+@app.route('/api/v1/profiling/start', methods=['POST'])
+@login_required
+def start_api_profiling():
+    """
+        Api route to start a time-limited profiling session
+        ie: /api/v1/profiling/start?mode=sample&duration=60 (mode: sample or cprofile, duration max 300s)
+    """
+    status = start_profiler(request.args.get("mode", "sample"), request.args.get("duration", 30, type=int))
+    return app.response_class(json.dumps(status), status=409 if "error" in status else 200, mimetype="application/json")
+
+@app.route('/api/v1/profiling/status', methods=['GET'])
+@login_required
+def get_api_profiling_status():
+    """Api route to get the profiling session state, ?stop=true ends it early"""
+    return app.response_class(json.dumps(get_profiler_status(request.args.get("stop") == "true")), mimetype="application/json")
+
+@app.route('/api/v1/profiling/result', methods=['GET'])
+@login_required
+def download_profiling_result():
+    """Route for downloading the last profiling result (collapsed stacks or pstats file)"""
+    status = get_profiler_status()
+    if not status["result"]:
+        abort(404)
+    return send_from_directory(profiler.output_dir, profiling.PROFILE_RESULTS[status["mode"]], as_attachment=True)
+
+def get_logs_list():
+    """List the raw data files for the api snapshot"""
+    rtk.logm.updateAvailableLogs()
+    return rtk.logm.available_logs
+
+state_snapshot.register_probe("logs", get_logs_list, ttl=30)
+state_snapshot.register_probe("settings", lambda: api_snapshot.public_settings(rtkbaseconfig), ttl=5)
+
 #### Handle connect/disconnect events ####
 
 @socketio.on("connect", namespace="/test")
-def clientConnect():
+def onClientConnect(auth=None):
+    clientConnect(request.sid)
+
+@state_bus.owner_call
+def clientConnect(sid=None):
     global connected_clients
     connected_clients += 1
+    bus.add_client(sid)
     print("Browser client connected")
     if rtkbaseconfig.get("general", "updated", fallback="False").lower() == "true":
         rtkbaseconfig.remove_option("general", "updated")
@@ -574,11 +843,63 @@ def clientConnect():
     rtk.sendState()
 
 @socketio.on("disconnect", namespace="/test")
-def clientDisconnect():
+def onClientDisconnect(reason=None):
+    stopJournalTail()
+    clientDisconnect(request.sid)
+
+@state_bus.owner_call
+def clientDisconnect(sid=None):
     global connected_clients
     connected_clients -=1
+    bus.remove_client(sid)
     print("Browser client disconnected")
 
+@socketio.on("bus options", namespace="/test")
+def onBusOptions(json_msg):
+    """
+        Set the live data options for this client
+        :param json_msg: {"interval" : minimum seconds between two frames, "encoding" : "json" or "msgpack"}
+        :return the encoding used (json if msgpack isn't available)
+    """
+    if not isinstance(json_msg, dict):
+        return None
+    try:
+        interval = float(json_msg["interval"]) if json_msg.get("interval") is not None else None
+    except (TypeError, ValueError):
+        interval = None
+    return setBusOptions(request.sid, interval, json_msg.get("encoding"))
+
+@state_bus.owner_call
+def setBusOptions(sid, interval=None, encoding=None):
+    return bus.set_client_options(sid, interval, encoding)
+
+#### Diagnostic journal live tail ####
+
+@socketio.on("journal tail start", namespace="/test")
+def startJournalTail(json_msg):
+    """
+        Send the new journal entries of a service to this client
+        :param json_msg: {"unit" : the service unit, "cursor" : the last entry received, "priority" : 0-7}
+    """
+    unit = json_msg.get("unit")
+    if unit not in get_diagnostic_units():
+        return
+    stopJournalTail()
+    sid = request.sid
+    def send_entries(entries):
+        socketio.emit("journal entries", json.dumps({"unit" : unit, "entries" : entries}), namespace="/test", to=sid)
+    priority = json_msg.get("priority")
+    tail = journal_reader.JournalTail(unit, send_entries, cursor=json_msg.get("cursor"),
+                                      priority=int(priority) if str(priority).isdigit() else None)
+    journal_tails[sid] = tail
+    tail.start()
+
+@socketio.on("journal tail stop", namespace="/test")
+def stopJournalTail():
+    tail = journal_tails.pop(request.sid, None)
+    if tail is not None:
+        tail.stop()
+
 #### Log list handling ###
 
 @socketio.on("get logs list", namespace="/test")
@@ -591,16 +912,19 @@ def getAvailableLogs():
 #### str2str launch/shutdown handling ####
 
 @socketio.on("launch base", namespace="/test")
+@state_bus.owner_call
 def launchBase():
     rtk.launchBase()
 
 @socketio.on("shutdown base", namespace="/test")
+@state_bus.owner_call
 def shutdownBase():
     rtk.shutdownBase()
 
 #### str2str start/stop handling ####
 
 @socketio.on("start base", namespace="/test")
+@state_bus.owner_call
 def startBase():
     saved_input_type = rtkbaseconfig.get("main", "receiver_format").strip("'")
     #check if the main service is running and the gnss format is correct. If not, don't try to start rtkrcv with startBase() 
@@ -624,10 +948,12 @@ def startBase():
         rtk.startBase()
 
 @socketio.on("stop base", namespace="/test")
+@state_bus.owner_call
 def stopBase():
     rtk.stopBase()
 
 @socketio.on("on graph", namespace="/test")
+@state_bus.owner_call
 def continueBase():
     rtk.sleep_count = 0
 
@@ -669,6 +995,7 @@ def detect_receiver(json_msg):
     socketio.emit("gnss_detection_result", json.dumps(result), namespace="/test")
 
 @socketio.on("apply_receiver_settings", namespace="/test")
+@state_bus.owner_call
 def apply_receiver_settings(json_msg):
     print("Applying gnss receiver new settings")
     print(json_msg)
@@ -680,6 +1007,8 @@ def apply_receiver_settings(json_msg):
     socketio.emit("gnss_settings_saved", json.dumps(json_msg), namespace="/test")
 
 @socketio.on("configure_receiver", namespace="/test")
+#downloads/extracts an archive or runs the receiver configuration script: can take several minutes
+@state_bus.owner_call(timeout=1800)
 def configure_receiver(brand="", model=""):
     # only some receiver could be configured automaticaly
     # After port detection, the main service will be restarted, and it will take some time. But we have to stop it to
@@ -711,6 +1040,7 @@ def configure_receiver(brand="", model=""):
 #### Settings Backup Restore Reset ####
 
 @socketio.on("reset settings", namespace="/test")
+@state_bus.owner_call
 def reset_settings():
     switchService({"name":"main", "active":False})
     rtkbaseconfig.merge_default_and_user(os.path.join(rtkbase_path, "settings.conf.default"), os.path.join(rtkbase_path, "settings.conf.default"))
@@ -728,6 +1058,7 @@ def backup_settings():
 
 
 @socketio.on("restore settings", namespace="/test")
+@state_bus.owner_call
 def restore_settings_file(json_msg):
     #print("DEBUG: type: ", type(json_msg))
     #print("DEBUG: print msg: ", msg)
@@ -778,6 +1109,7 @@ def rinex_ign(json_msg):
 #### Download and convert log handlers ####
 
 @socketio.on("process log", namespace="/test")
+@state_bus.owner_call
 def processLog(json_msg):
     log_name = json_msg.get("name")
 
@@ -788,6 +1120,7 @@ def processLog(json_msg):
     rtk.processLogPackage(raw_log_path)
 
 @socketio.on("cancel log conversion", namespace="/test")
+@state_bus.owner_call
 def cancelLogConversion(json_msg):
     log_name = json_msg.get("name")
     raw_log_path = rtk.logm.log_path + "/" + log_name
@@ -801,6 +1134,7 @@ def readRINEXVersion():
     rtk.socketio.emit("current RINEX version", {"version": rinex_version}, namespace="/test")
 
 @socketio.on("write RINEX version", namespace="/test")
+@state_bus.owner_call
 def writeRINEXVersion(json_msg):
     rinex_version = json_msg.get("version")
     rtk.logm.setRINEXVersion(rinex_version)
@@ -808,6 +1142,7 @@ def writeRINEXVersion(json_msg):
 #### Device hardware functions ####
 
 @socketio.on("reboot device", namespace="/test")
+@state_bus.owner_call
 def rebootRtkbase():
     print("Rebooting...")
     rtk.shutdown()
@@ -816,6 +1151,7 @@ def rebootRtkbase():
     subprocess.check_output("reboot")
 
 @socketio.on("shutdown device", namespace="/test")
+@state_bus.owner_call
 def shutdownRtkbase():
     print("Shutdown...")
     rtk.shutdown()
@@ -888,6 +1224,8 @@ def restartServices(restart_services_list=None):
     getServicesStatus()
 
 @socketio.on("get services status", namespace="/test")
+@state_bus.owner_call
+@profiling.timed("services.getServicesStatus")
 def getServicesStatus(emit_pingback=True):
     """
         Get the status of services listed in services_list
@@ -926,6 +1264,7 @@ def getServicesStatus(emit_pingback=True):
     return services_status
 
 @socketio.on("services switch", namespace="/test")
+@state_bus.owner_call
 def switchService(json_msg):
     """
         Start or stop some systemd services
@@ -958,6 +1297,7 @@ def switchService(json_msg):
     #    getServicesStatus()
 
 @socketio.on("form data", namespace="/test")
+@state_bus.owner_call
 def update_settings(json_msg):
     """
         Get the form data from the web front end, and save theses values to settings.conf
@@ -1034,20 +1374,34 @@ if __name__ == "__main__":
         #check if authentification is required
         if not rtkbaseconfig.get_web_authentification():
             app.config["LOGIN_DISABLED"] = True
-        #load services status managed with systemd
+        #load services status managed with systemd (the D-Bus objects are loaded on their first use)
         services_list = load_units(services_list)
-        #Update standard user in settings.conf
-        update_std_user(services_list)
-        #Start a "manager" thread
+        #The slow initialisations run in background, the login page is served meanwhile:
+        #update standard user in settings.conf, listen to the network changes,
+        #start the "manager" thread, then list the log files
+        startup_stages.add("services user", update_std_user, services_list)
+        startup_stages.add("network listener", network_state.start_listener)
+        startup_stages.add("broadcast bus", bus.start)
         manager_thread = Thread(target=manager, daemon=True)
-        manager_thread.start()
+        startup_stages.add("manager", manager_thread.start)
+        startup_stages.add("logs index", rtk.logm.updateAvailableLogs)
+        #Send the log files with a zero-copy sendfile
+        log_download.enable_gevent_sendfile()
+        if web_workers > 1:
+            #this process owns rtkrcv and the services, the workers reach them with the state bus
+            state_bus.set_role(state_bus.ROLE_OWNER, state_bus.SOCKET_PATH)
+            state_hub = state_bus.StateHub(state_bus.SOCKET_PATH)
+            state_hub.start()
 
         app.secret_key = rtkbaseconfig.get_secret_key()
+        startup_stages.start()
         #socketio.run(app, host = "::", port = args.port or rtkbaseconfig.get("general", "web_port", fallback=80), debug=args.debug) # IPv6 "::" is mapped to IPv4
         gunicorn_options = {
         'bind': ['%s:%s' % ('0.0.0.0', args.port or rtkbaseconfig.get("general", "web_port", fallback=80)),
                     '%s:%s' % ('[::1]', args.port or rtkbaseconfig.get("general", "web_port", fallback=80)) ],
-        'workers': 1,
+        'workers': web_workers,
+        'post_fork': post_fork if web_workers > 1 else None,
+        'when_ready': lambda server: startup_stages.mark("listening"),
         'worker_class': 'gevent',
         'graceful_timeout': 10,
         'loglevel': 'debug' if args.debug else 'warning',
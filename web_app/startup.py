@@ -0,0 +1,94 @@
+""" Staged startup of the RTKBase web server
+
+    - lazy_import() returns a module which is really imported on its first attribute
+      access: the heavy modules (requests, psutil, distro, nmcli, pystemd, pexpect)
+      are not loaded before the web server listens.
+    - StagedStartup runs the slow initialisations (systemd units, network listener,
+      log index, manager thread...) in background, in order, after the port is bound.
+      The login page is served meanwhile.
+    - the durations of the import and of each stage are kept for /api/v1/startup and
+      the startup benchmark (startup_benchmark.py), which reads the timeline printed
+      once the server is ready.
+"""
+
+import importlib.util
+import json
+import sys
+import threading
+import time
+
+# the reference of the startup timeline, as early as possible: server.py imports this module first
+STARTED = time.time()
+_process_start = time.monotonic()
+
+def uptime():
+    """ :return the seconds elapsed since the web server started """
+    return round(time.monotonic() - _process_start, 3)
+
+def lazy_import(name):
+    """
+        Import a module on its first use
+        :param name: the module name (ie "psutil", "pystemd.systemd1")
+        :return the module, or a lazy module loaded on its first attribute access.
+                A missing module raises an ImportError here, not on the first use.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named '{}'".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+class StagedStartup:
+    """ Run the startup stages in a background thread, one after the other """
+
+    def __init__(self):
+        self.stages = []
+        self.timeline = [{"stage" : "imports", "start" : 0, "duration" : uptime()}]
+        self.done = threading.Event()
+        self.thread = None
+
+    def add(self, name, function, *args, **kwargs):
+        """
+            Add a stage
+            :param name: the stage name in the timeline
+            :param function: the function to call, an exception is printed and the next stages still run
+        """
+        self.stages.append((name, function, args, kwargs))
+
+    def mark(self, name):
+        """ Add an event (ie listening) to the timeline """
+        self.timeline.append({"stage" : name, "start" : uptime(), "duration" : 0})
+
+    def start(self):
+        """ Start the stages, the web server can bind its port meanwhile """
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        for name, function, args, kwargs in self.stages:
+            # let the server answer between two stages
+            time.sleep(0)
+            start = uptime()
+            error = None
+            try:
+                function(*args, **kwargs)
+            except Exception as e:
+                error = repr(e)
+                print("Startup stage {} failed: {}".format(name, error))
+            self.timeline.append({"stage" : name, "start" : start, "duration" : round(uptime() - start, 3), "error" : error})
+        self.mark("ready")
+        self.done.set()
+        print("Startup timeline: {}".format(json.dumps(self.timeline)), flush=True)
+
+    def status(self):
+        """ :return the startup timeline (seconds since the start) """
+        return {"started" : STARTED,
+                "ready" : self.done.is_set(),
+                "timeline" : list(self.timeline)}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+""" Startup benchmark of the RTKBase web server
+
+    Start server.py on a free port and measure:
+        - listening: the port accepts connections
+        - first byte: time to the first byte of the login page
+        - ready: all the background startup stages are done (/api/v1/startup/ready)
+    The startup timeline printed by the server and, with --importtime, the slowest
+    imports are printed too.
+
+    ie: python3 startup_benchmark.py --runs 5 --port 8081 --importtime
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+def http_get(port, path, timeout=5):
+    """
+        Send a GET request to the local web server
+        :return a tuple (seconds to the first byte, the whole response as bytes)
+    """
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as connection:
+        start = time.monotonic()
+        connection.sendall("GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n".format(path).encode())
+        response = connection.recv(65536)
+        first_byte = time.monotonic() - start
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            response += data
+    return first_byte, response
+
+def wait_for(check, deadline, interval=0.01):
+    """ Call check() until it returns a true value or the deadline is reached """
+    while time.monotonic() < deadline:
+        try:
+            result = check()
+            if result:
+                return result
+        except (OSError, ValueError):
+            # not listening yet, or an incomplete answer
+            pass
+        time.sleep(interval)
+    raise TimeoutError
+
+def read_timeline(stdout):
+    """
+        :param stdout: the server stdout file
+        :return the startup timeline printed by the server once ready, or None
+    """
+    stdout.seek(0)
+    for line in stdout:
+        if line.startswith("Startup timeline: "):
+            return json.loads(line[len("Startup timeline: "):])
+    return None
+
+def parse_importtime(stderr, top=15):
+    """
+        :param stderr: the server stderr with -X importtime
+        :return the slowest imports [(cumulative µs, module)]
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|", 2)
+        # only the top level imports (no indentation), the ones which could be lazy
+        if not module[1:].startswith(" "):
+            imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+def run_once(port, timeout=120, importtime=False):
+    """
+        Start the web server, measure its startup, then stop it
+        :return a dict with the durations in seconds, the server timeline and the slowest imports
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + [SERVER_PATH, "-p", str(port)]
+    start = time.monotonic()
+    deadline = start + timeout
+    # files, not pipes: the server must never block on a full stdout/stderr.
+    # stdout is read while the server writes: append mode, the server writes at the end whatever the read position
+    stdout = tempfile.TemporaryFile("a+", encoding="UTF-8")
+    stderr = tempfile.TemporaryFile("w+", encoding="UTF-8")
+    server = subprocess.Popen(command, cwd=os.path.dirname(SERVER_PATH), stdout=stdout,
+                              stderr=stderr, start_new_session=True)
+    result = {}
+    try:
+        wait_for(lambda: socket.create_connection(("127.0.0.1", port), timeout=1).close() or True, deadline)
+        result["listening"] = round(time.monotonic() - start, 3)
+        # a first request waits for the worker
+        first_byte, _ = wait_for(lambda: http_get(port, "/login"), deadline)
+        result["first_byte"] = round(time.monotonic() - start, 3)
+        result["login_ttfb"] = round(first_byte, 3)
+        # the full timeline needs a login, the public route only tells if the server is ready
+        wait_for(lambda: json.loads(http_get(port, "/api/v1/startup/ready")[1].split(b"\r\n\r\n", 1)[1])["ready"],
+                 deadline, interval=0.1)
+        result["ready"] = round(time.monotonic() - start, 3)
+        result["timeline"] = wait_for(lambda: read_timeline(stdout), deadline, interval=0.1)
+    finally:
+        os.killpg(server.pid, signal.SIGINT)
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(server.pid, signal.SIGKILL)
+            server.wait()
+    stdout.close()
+    with stderr:
+        if importtime:
+            stderr.seek(0)
+            result["imports"] = parse_importtime(stderr.read())
+    return result
+
+def arg_parse():
+    """ Parse the command line you use to launch the script """
+    parser = argparse.ArgumentParser(prog="startup_benchmark", description="Measure the RTKBase web server startup")
+    parser.add_argument("--port", type=int, default=8081, help="a free port for the tested server (default: 8081)")
+    parser.add_argument("--runs", type=int, default=3, help="number of server starts")
+    parser.add_argument("--timeout", type=int, default=120, help="maximum startup duration in seconds")
+    parser.add_argument("--importtime", action="store_true", help="show the slowest imports (python -X importtime)")
+    parser.add_argument("--json", action="store_true", help="json output")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = arg_parse()
+    results = [run_once(args.port, args.timeout, args.importtime and run == 0) for run in range(args.runs)]
+    if args.json:
+        print(json.dumps(results))
+        sys.exit(0)
+    for key in ("listening", "first_byte", "login_ttfb", "ready"):
+        values = [result[key] for result in results]
+        print("{:<12} median {:>7.3f}s  min {:>7.3f}s  max {:>7.3f}s".format(key, statistics.median(values), min(values), max(values)))
+    print("Server timeline (last run):")
+    for stage in results[-1]["timeline"]:
+        print("    {:<18} at {:>7.3f}s  {:>7.3f}s{}".format(stage["stage"], stage["start"], stage["duration"],
+                                                          "  error: {}".format(stage["error"]) if stage.get("error") else ""))
+    if args.importtime:
+        print("Slowest imports (cumulative, first run):")
+        for cumulative, module in results[0]["imports"]:
+            print("    {:>9.1f}ms  {}".format(cumulative / 1000, module))
@@ -0,0 +1,343 @@
+""" Local state bus used when rtkbase_web runs with several gunicorn workers.
+
+    - The gunicorn master process is the "owner": it runs rtkrcv, the systemd units,
+      the manager thread and a StateHub listening on a local unix socket.
+    - The workers serve http and socketio. Their socketio emits are relayed through the hub
+      (HubManager, a python-socketio message queue), and the handlers decorated with
+      @owner_call are executed by the owner process.
+    - The hub keeps the last data emitted for each event, so a worker can read the
+      current state without waking up rtkrcv or D-Bus.
+
+    With a single worker (the default), nothing changes: role stays "standalone".
+
+    The hub socket is inside a private directory (mode 0700), only the processes of the
+    web server user are accepted (SO_PEERCRED), and the frames are json, never pickles.
+"""
+
+import os
+import gc
+import json
+import stat
+import base64
+import socket
+import struct
+import functools
+import threading
+import time
+import uuid
+
+import socketio
+
+SOCKET_DIR = "/run/rtkbase"
+SOCKET_PATH = os.path.join(SOCKET_DIR, "state.sock")
+# seconds before a worker gives up waiting for an owner call
+CALL_TIMEOUT = 120
+
+ROLE_STANDALONE = "standalone"
+ROLE_OWNER = "owner"
+ROLE_WORKER = "worker"
+
+# frame types
+SUBSCRIBE = b"S"
+PUBLISH = b"P"
+CALL = b"C"
+RESULT = b"R"
+SNAPSHOT = b"G"
+
+_role = ROLE_STANDALONE
+_socket_path = SOCKET_PATH
+# functions which must run inside the owner process {name : function}
+owner_calls = {}
+
+def set_role(role, socket_path=None):
+    """
+        Set the role of the current process
+        :param role: ROLE_STANDALONE, ROLE_OWNER or ROLE_WORKER
+        :param socket_path: the hub unix socket path
+    """
+    global _role, _socket_path
+    _role = role
+    if socket_path is not None:
+        _socket_path = socket_path
+
+def get_role():
+    return _role
+
+def is_worker():
+    return _role == ROLE_WORKER
+
+def _encode(obj):
+    """ Tag the values json can't keep (bytes, tuples) """
+    if isinstance(obj, (bytes, bytearray)):
+        return {"__bytes__" : base64.b64encode(obj).decode("ascii")}
+    if isinstance(obj, tuple):
+        return {"__tuple__" : [_encode(value) for value in obj]}
+    if isinstance(obj, list):
+        return [_encode(value) for value in obj]
+    if isinstance(obj, dict):
+        return {key : _encode(value) for key, value in obj.items()}
+    return obj
+
+def _decode(obj):
+    if len(obj) == 1:
+        if "__bytes__" in obj:
+            return base64.b64decode(obj["__bytes__"])
+        if "__tuple__" in obj:
+            return tuple(obj["__tuple__"])
+    return obj
+
+def dumps(obj):
+    """ Serialize a message for the state bus (json, bytes and tuples are kept) """
+    return json.dumps(_encode(obj), separators=(",", ":")).encode()
+
+def loads(payload):
+    return json.loads(payload, object_hook=_decode)
+
+def send_frame(conn, frame_type, payload=b""):
+    conn.sendall(frame_type + struct.pack("!I", len(payload)) + payload)
+
+def _recv_exactly(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("state bus connection closed")
+        data += chunk
+    return bytes(data)
+
+def read_frame(conn):
+    """ Read a frame, return a tuple (frame type, payload) """
+    header = _recv_exactly(conn, 5)
+    return header[:1], _recv_exactly(conn, struct.unpack("!I", header[1:])[0])
+
+def _connect(socket_path, timeout=None):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    conn.connect(socket_path)
+    return conn
+
+def _make_private_dir(path):
+    """ Create a directory only usable by the current user, or raise a PermissionError """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError("{} is not a private directory".format(path))
+    os.chmod(path, 0o700)
+
+def _peer_allowed(conn):
+    """ Only the processes of the same user (or root) can use the hub """
+    credentials = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    _, uid, _ = struct.unpack("3i", credentials)
+    return uid in (0, os.getuid())
+
+class StateHub:
+    """
+        The hub running inside the owner process. It relays the published messages
+        to all the subscribers, runs the owner calls and keeps the last emitted data
+        for each event.
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH):
+        self.socket_path = socket_path
+        self.listener = None
+        self.subscribers = {}
+        self.snapshot = {}
+
+    def start(self):
+        # the socket is created inside a private directory: no other user can reach it or replace it
+        _make_private_dir(os.path.dirname(self.socket_path))
+        try:
+            os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            self.listener.bind(self.socket_path)
+        finally:
+            os.umask(umask)
+        self.listener.listen(64)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def close(self):
+        """ Close the listening socket (used in a worker after the fork) """
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def _accept_loop(self):
+        while self.listener is not None:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        try:
+            if not _peer_allowed(conn):
+                print("State bus: connection refused from another user")
+                return
+            while True:
+                frame_type, payload = read_frame(conn)
+                if frame_type == SUBSCRIBE:
+                    self.subscribers[conn] = threading.Lock()
+                elif frame_type == PUBLISH:
+                    self._update_snapshot(payload)
+                    self._relay(payload)
+                elif frame_type == CALL:
+                    send_frame(conn, RESULT, self._run_call(payload))
+                elif frame_type == SNAPSHOT:
+                    send_frame(conn, RESULT, dumps((True, self.snapshot)))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.subscribers.pop(conn, None)
+            conn.close()
+
+    def _update_snapshot(self, payload):
+        try:
+            message = loads(payload)
+        except ValueError:
+            return
+        if message.get("method") == "emit" and message.get("room") is None:
+            self.snapshot[message["event"]] = {"data" : message["data"], "time" : time.time()}
+
+    def _relay(self, payload):
+        for conn, lock in list(self.subscribers.items()):
+            try:
+                with lock:
+                    send_frame(conn, PUBLISH, payload)
+            except OSError:
+                self.subscribers.pop(conn, None)
+
+    def _run_call(self, payload):
+        try:
+            name, args, kwargs = loads(payload)
+            result = (True, owner_calls[name][0](*args, **kwargs))
+        except Exception as e:
+            print("State bus: owner call error: ", repr(e))
+            result = (False, repr(e))
+        try:
+            return dumps(result)
+        except (TypeError, ValueError) as e:
+            return dumps((False, repr(e)))
+
+def call(name, *args, **kwargs):
+    """
+        Run an owner function inside the owner process and return its result.
+        A socket.timeout is raised if the owner doesn't answer within the function timeout.
+    """
+    conn = _connect(_socket_path, timeout=owner_calls[name][1])
+    try:
+        send_frame(conn, CALL, dumps((name, args, kwargs)))
+        _, payload = read_frame(conn)
+    finally:
+        conn.close()
+    success, result = loads(payload)
+    if not success:
+        raise RuntimeError("owner call {} failed: {}".format(name, result))
+    return result
+
+def get_snapshot():
+    """
+        Get the last data emitted for each event
+        :return a dict {event : {"data" : data, "time" : timestamp}}
+    """
+    conn = _connect(_socket_path, timeout=5)
+    try:
+        send_frame(conn, SNAPSHOT)
+        _, payload = read_frame(conn)
+    finally:
+        conn.close()
+    return loads(payload)[1]
+
+def owner_call(func=None, timeout=CALL_TIMEOUT):
+    """
+        Decorator for the functions which use the state owned by the owner process
+        (rtkrcv, systemd units, settings writes...). Inside a worker, the call
+        is sent to the owner process.
+        ie: @owner_call or @owner_call(timeout=1800) for a long call
+        :param timeout: seconds before the worker stops waiting for the result
+    """
+    if func is None:
+        return functools.partial(owner_call, timeout=timeout)
+    owner_calls[func.__name__] = (func, timeout)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if is_worker():
+            return call(func.__name__, *args, **kwargs)
+        return func(*args, **kwargs)
+    return wrapper
+
+def detach_inherited_greenlets():
+    """
+        gevent greenlets (and monkey patched threads) survive a fork. In a new worker,
+        kill the copies of the owner threads (manager, rtkrcv broadcast, hub...), they
+        must only run in the owner process.
+    """
+    import gevent
+    greenlets = [g for g in gc.get_objects() if isinstance(g, gevent.Greenlet) and not g.dead]
+    gevent.killall(greenlets, block=False)
+
+class HubManager(socketio.PubSubManager):
+    """
+        python-socketio client manager using the StateHub as message queue, so the
+        emits from any process reach the clients connected to every worker
+    """
+
+    name = "rtkbase_hub"
+
+    def __init__(self, socket_path=SOCKET_PATH, channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.socket_path = socket_path
+        self.pid = os.getpid()
+        self.publish_conn = None
+        self.publish_lock = threading.Lock()
+
+    def _check_fork(self):
+        """
+            The manager is created before gunicorn forks the workers. Each process
+            needs its own host_id (the messages from the same host_id are ignored)
+            and its own connection to the hub.
+        """
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.host_id = uuid.uuid4().hex
+            self.publish_conn = None
+
+    def initialize(self):
+        self._check_fork()
+        super().initialize()
+
+    def _publish(self, data):
+        with self.publish_lock:
+            self._check_fork()
+            data["host_id"] = self.host_id
+            payload = dumps(data)
+            for retry in range(2):
+                try:
+                    if self.publish_conn is None:
+                        self.publish_conn = _connect(self.socket_path)
+                    send_frame(self.publish_conn, PUBLISH, payload)
+                    return
+                except OSError as e:
+                    self.publish_conn = None
+                    if retry:
+                        self._get_logger().error("Can't publish to the state hub: {}".format(e))
+
+    def _listen(self):
+        while True:
+            try:
+                conn = _connect(self.socket_path)
+                send_frame(conn, SUBSCRIBE)
+                while True:
+                    _, payload = read_frame(conn)
+                    try:
+                        yield loads(payload)
+                    except ValueError:
+                        continue
+            except (ConnectionError, OSError):
+                # the hub is not ready or restarting
+                time.sleep(1)
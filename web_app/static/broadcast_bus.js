@@ -0,0 +1,105 @@
+// The live data (satellite levels, coordinates, system informations...) are sent together
+// inside a "bus frame" event: [{topic : payload}, [topics expected as a json string], [delta topics]].
+// Each topic of the frame is dispatched to the socket.on(<topic>) handlers, like a normal socketio event.
+// A delta topic contains only the changed values, they are merged with the previous payload.
+// The frame is json, or MessagePack (binary) when the server supports it.
+
+const textDecoder = new TextDecoder();
+
+// Minimal MessagePack decoder (the types used by the server)
+function msgpackDecode(buffer) {
+    var view = new DataView(buffer);
+    var bytes = new Uint8Array(buffer);
+    var pos = 0;
+
+    function str(length) {
+        var value = textDecoder.decode(bytes.subarray(pos, pos + length));
+        pos += length;
+        return value;
+    }
+    function array(length) {
+        var value = new Array(length);
+        for (var i = 0; i < length; i++) {
+            value[i] = next();
+        }
+        return value;
+    }
+    function map(length) {
+        var value = {};
+        for (var i = 0; i < length; i++) {
+            var key = next();
+            value[key] = next();
+        }
+        return value;
+    }
+    function read(method, size) {
+        var value = view[method](pos);
+        pos += size;
+        return value;
+    }
+    function next() {
+        var type = bytes[pos++];
+        if (type < 0x80) return type;
+        if (type < 0x90) return map(type & 0x0f);
+        if (type < 0xa0) return array(type & 0x0f);
+        if (type < 0xc0) return str(type & 0x1f);
+        if (type >= 0xe0) return type - 0x100;
+        switch (type) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc4: var length = read("getUint8", 1); pos += length; return bytes.slice(pos - length, pos);
+            case 0xc5: var length = read("getUint16", 2); pos += length; return bytes.slice(pos - length, pos);
+            case 0xc6: var length = read("getUint32", 4); pos += length; return bytes.slice(pos - length, pos);
+            case 0xca: return read("getFloat32", 4);
+            case 0xcb: return read("getFloat64", 8);
+            case 0xcc: return read("getUint8", 1);
+            case 0xcd: return read("getUint16", 2);
+            case 0xce: return read("getUint32", 4);
+            case 0xcf: return Number(read("getBigUint64", 8));
+            case 0xd0: return read("getInt8", 1);
+            case 0xd1: return read("getInt16", 2);
+            case 0xd2: return read("getInt32", 4);
+            case 0xd3: return Number(read("getBigInt64", 8));
+            case 0xd9: return str(read("getUint8", 1));
+            case 0xda: return str(read("getUint16", 2));
+            case 0xdb: return str(read("getUint32", 4));
+            case 0xdc: return array(read("getUint16", 2));
+            case 0xdd: return array(read("getUint32", 4));
+            case 0xde: return map(read("getUint16", 2));
+            case 0xdf: return map(read("getUint32", 4));
+        }
+        throw new Error("msgpack: unsupported type 0x" + type.toString(16));
+    }
+    return next();
+}
+
+function listenBusFrames(socket) {
+    // last payload received for each topic
+    var topicsState = {};
+    socket.on("bus frame", function(msg) {
+        var frame = (typeof msg === "string") ? JSON.parse(msg) : msgpackDecode(msg);
+        var data = frame[0];
+        var jsonTopics = frame[1];
+        var deltaTopics = frame[2];
+        for (const topic in data) {
+            if (deltaTopics.includes(topic)) {
+                topicsState[topic] = Object.assign({}, topicsState[topic], data[topic]);
+            } else {
+                topicsState[topic] = data[topic];
+            }
+            var payload = jsonTopics.includes(topic) ? JSON.stringify(topicsState[topic]) : topicsState[topic];
+            socket.listeners(topic).forEach(listener => listener(payload));
+        }
+    });
+    socket.on("connect", function() {
+        // the server sends full payloads to a new connection
+        topicsState = {};
+        var options = {"encoding" : "msgpack"};
+        // less frames on a metered link (browser data saver enabled)
+        if (navigator.connection && navigator.connection.saveData) {
+            options["interval"] = 5;
+        }
+        socket.emit("bus options", options);
+    });
+}
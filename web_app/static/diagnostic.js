@@ -0,0 +1,115 @@
+// Diagnostic page: the service status and journal are loaded only when a service is opened.
+// The journal is read page by page (newest entries first) and a live tail can be enabled with socketio.
+
+var socket = null;
+var liveElt = null;
+const priorityClass = {0 : "text-danger", 1 : "text-danger", 2 : "text-danger", 3 : "text-danger", 4 : "text-warning"};
+
+function entryElement(entry) {
+    var lineElt = document.createElement("div");
+    lineElt.textContent = entry.time + " " + entry.identifier + "[" + entry.pid + "]: " + entry.message;
+    if (entry.priority in priorityClass) {
+        lineElt.classList.add(priorityClass[entry.priority]);
+    }
+    return lineElt;
+}
+
+function loadJournalPage(serviceElt, reset) {
+    var journalElt = serviceElt.querySelector(".journal");
+    var moreBtnElt = serviceElt.querySelector(".journal-more");
+    if (reset) {
+        journalElt.replaceChildren();
+        delete serviceElt.dataset.nextCursor;
+        delete serviceElt.dataset.newestCursor;
+    }
+    var params = new URLSearchParams({"priority" : serviceElt.querySelector(".journal-priority").value});
+    if (serviceElt.dataset.nextCursor) {
+        params.append("cursor", serviceElt.dataset.nextCursor);
+    }
+    moreBtnElt.disabled = true;
+    fetch("/diagnostic/journal/" + encodeURIComponent(serviceElt.dataset.unit) + "?" + params.toString())
+        .then(response => response.json())
+        .then(page => {
+            for (entry of page.entries) {
+                journalElt.appendChild(entryElement(entry));
+            }
+            if (page.entries.length > 0 && !serviceElt.dataset.newestCursor) {
+                serviceElt.dataset.newestCursor = page.entries[0].cursor;
+            }
+            if (page.next_cursor) {
+                serviceElt.dataset.nextCursor = page.next_cursor;
+            }
+            moreBtnElt.disabled = !page.more;
+        });
+}
+
+function startLiveTail(serviceElt) {
+    if (socket === null) {
+        socket = io.connect("/test", socketio_options);
+        socket.on("journal entries", function(msg) {
+            var data = JSON.parse(msg);
+            if (liveElt === null || liveElt.dataset.unit !== data.unit) {
+                return;
+            }
+            var journalElt = liveElt.querySelector(".journal");
+            // the newest entries are on top
+            for (entry of data.entries) {
+                journalElt.prepend(entryElement(entry));
+                liveElt.dataset.newestCursor = entry.cursor;
+            }
+        });
+    }
+    if (liveElt !== null && liveElt !== serviceElt) {
+        liveElt.querySelector(".journal-live").checked = false;
+    }
+    liveElt = serviceElt;
+    socket.emit("journal tail start", {"unit" : serviceElt.dataset.unit,
+                                       "cursor" : serviceElt.dataset.newestCursor,
+                                       "priority" : serviceElt.querySelector(".journal-priority").value});
+}
+
+function stopLiveTail(serviceElt) {
+    if (socket !== null && liveElt === serviceElt) {
+        socket.emit("journal tail stop");
+        liveElt = null;
+    }
+}
+
+$(document).ready(function () {
+    $('.diagnostic-service').on('show.bs.collapse', function () {
+        var serviceElt = this;
+        if (serviceElt.dataset.loaded) {
+            return;
+        }
+        serviceElt.dataset.loaded = true;
+        fetch("/diagnostic/status/" + encodeURIComponent(serviceElt.dataset.unit))
+            .then(response => response.text())
+            .then(status => { serviceElt.querySelector(".service-status").textContent = status; });
+        loadJournalPage(serviceElt, true);
+    });
+
+    $('.diagnostic-service').on('hide.bs.collapse', function () {
+        this.querySelector(".journal-live").checked = false;
+        stopLiveTail(this);
+    });
+
+    $('.journal-more').on('click', function () {
+        loadJournalPage(this.closest('.diagnostic-service'), false);
+    });
+
+    $('.journal-priority').on('change', function () {
+        var serviceElt = this.closest('.diagnostic-service');
+        stopLiveTail(serviceElt);
+        serviceElt.querySelector(".journal-live").checked = false;
+        loadJournalPage(serviceElt, true);
+    });
+
+    $('.journal-live').on('change', function () {
+        var serviceElt = this.closest('.diagnostic-service');
+        if (this.checked) {
+            startLiveTail(serviceElt);
+        } else {
+            stopLiveTail(serviceElt);
+        }
+    });
+});
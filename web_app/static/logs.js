@@ -23,6 +23,42 @@ window.operateEvents = {
     }
 };
 
+const sliceDownloadBtnElt = document.getElementById('slice-download-button');
+
+sliceDownloadBtnElt.onclick = function (){
+    var params = new URLSearchParams({
+        "start" : document.getElementById('slice-start').value,
+        "end" : document.getElementById('slice-end').value,
+        "adjacent" : document.getElementById('slice-adjacent').checked
+    });
+    var link = document.createElement("a");
+    link.setAttribute('download', '');
+    link.href = "/logs/download_slice/" + encodeURIComponent(createRinexBtnElt.dataset.filename) + "?" + params.toString();
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+};
+
+const downloadSelectedBtnElt = document.getElementById('download-selected-button');
+
+$('#logtable').on('check.bs.table uncheck.bs.table check-all.bs.table uncheck-all.bs.table load-success.bs.table', function () {
+    downloadSelectedBtnElt.disabled = $('#logtable').bootstrapTable('getSelections').length == 0;
+});
+
+downloadSelectedBtnElt.onclick = function (){
+    var params = new URLSearchParams();
+    for (row of $('#logtable').bootstrapTable('getSelections')) {
+        params.append("log", row.name);
+    };
+    //Using a temporary link to download, because location.href disconnect socketio
+    var link = document.createElement("a");
+    link.setAttribute('download', '');
+    link.href = "/logs/download_zip?" + params.toString();
+    document.body.appendChild(link);
+    link.click();
+    link.remove();
+};
+
 $('#confirm-delete-button').on("click", function (){
     socket.emit("delete log", $('#confirm-delete-button').data.row);
 });
@@ -40,7 +76,7 @@ $(document).ready(function () {
     namespace = "/test";
 
     // initiate SocketIO connection
-    socket = io.connect(namespace);
+    socket = io.connect(namespace, socketio_options);
 
     // say hello on connect
     socket.on("connect", function () {
@@ -125,6 +161,7 @@ $(document).ready(function () {
         $('#logtable').bootstrapTable('removeAll');
         
         $('#logtable').bootstrapTable('load', msg);
+        downloadSelectedBtnElt.disabled = true;
         //var zz = $('#logtable').bootstrapTable('getData');
         //console.log(" table data : ");
         //console.log(zz);
@@ -37,7 +37,8 @@ $(document).ready(function () {
     namespace = "/test";
 
     // initiate SocketIO connection
-    socket = io.connect(namespace);
+    socket = io.connect(namespace, socketio_options);
+    listenBusFrames(socket);
 
     // say hello on connect
     socket.on("connect", function () {
@@ -474,7 +475,13 @@ $(document).ready(function () {
     socket.on("downloading_update", function(msg) {
         response = JSON.parse(msg);
         console.log("Downloading result: " + response);
-        if (response['result'] === 'true') {
+        if (response['result'] === 'progress') {
+            var downloaded = (response['downloaded'] / 1048576).toFixed(1) + " MB";
+            if (response['total']) {
+                downloaded += " / " + (response['total'] / 1048576).toFixed(1) + " MB (" + Math.floor(100 * response['downloaded'] / response['total']) + "%)";
+            }
+            $("#updateModal .modal-body").text("Please wait...Downloading update... " + downloaded);
+        } else if (response['result'] === 'true') {
             $("#updateModal .modal-body").text("Please wait...Preparing update...");
         } else {
             $("#updateModal .modal-body").text("Download failure");
@@ -648,6 +655,70 @@ $(document).ready(function () {
         return returntext.trim();
     }
 
+    // #################### SYSTEM METRICS HISTORY #################
+    // The history (min/max/avg by minute) is loaded only when a metric is selected.
+
+    var metricsTimer = null;
+    var metricsScale = {"net_rx" : 1/1000, "net_tx" : 1/1000};
+
+    function drawMetricsChart(history, scale) {
+        var chartElt = document.getElementById("metrics_chart");
+        var legendElt = document.getElementById("metrics_legend");
+        chartElt.replaceChildren();
+        if (history.time.length === 0) {
+            chartElt.classList.add("d-none");
+            legendElt.textContent = "No data yet";
+            return;
+        }
+        chartElt.classList.remove("d-none");
+        var minValue = Math.min(...history.min) * scale;
+        var maxValue = Math.max(...history.max) * scale;
+        var range = (maxValue - minValue) || 1;
+        var endTime = history.time[history.time.length - 1];
+        var startTime = endTime - 86400;
+        var x = t => ((t - startTime) / 86400 * 600).toFixed(1);
+        var y = v => (155 - (v * scale - minValue) / range * 150).toFixed(1);
+        // min/max band then the average line
+        var band = history.time.map((t, i) => x(t) + "," + y(history.max[i]));
+        for (var i = history.time.length - 1; i >= 0; i--) {
+            band.push(x(history.time[i]) + "," + y(history.min[i]));
+        }
+        var svgNS = "http://www.w3.org/2000/svg";
+        var bandElt = document.createElementNS(svgNS, "polygon");
+        bandElt.setAttribute("points", band.join(" "));
+        bandElt.setAttribute("fill", "rgba(0, 123, 255, 0.25)");
+        chartElt.appendChild(bandElt);
+        var lineElt = document.createElementNS(svgNS, "polyline");
+        lineElt.setAttribute("points", history.time.map((t, i) => x(t) + "," + y(history.avg[i])).join(" "));
+        lineElt.setAttribute("fill", "none");
+        lineElt.setAttribute("stroke", "#007bff");
+        lineElt.setAttribute("vector-effect", "non-scaling-stroke");
+        chartElt.appendChild(lineElt);
+        var avg = history.avg.reduce((sum, value) => sum + value, 0) / history.avg.length * scale;
+        var numberFormat = new Intl.NumberFormat('fullwide', { maximumFractionDigits : 1 });
+        legendElt.textContent = "min " + numberFormat.format(minValue) + " - max " + numberFormat.format(maxValue) +
+                                " - avg " + numberFormat.format(avg) + " (since " + new Date(history.time[0] * 1000).toLocaleTimeString() + ")";
+    }
+
+    function loadMetricsChart() {
+        var metric = document.getElementById("metrics_select").value;
+        clearTimeout(metricsTimer);
+        if (metric === "") {
+            document.getElementById("metrics_chart").classList.add("d-none");
+            document.getElementById("metrics_legend").textContent = "";
+            return;
+        }
+        fetch("/api/v1/metrics?metrics=" + metric)
+            .then(response => response.json())
+            .then(data => {
+                drawMetricsChart(data.metrics[metric], metricsScale[metric] || 1);
+                // a new value is added every minute
+                metricsTimer = setTimeout(loadMetricsChart, 60000);
+            });
+    }
+
+    document.getElementById("metrics_select").addEventListener("change", loadMetricsChart);
+
     // #################### HANDLE SETTINGS BACKUP LOAD RESET #################
             // #### RESET
     document.getElementById('confirm-reset-button').onclick = function (){
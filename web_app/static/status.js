@@ -32,7 +32,8 @@ $(document).ready(function () {
     namespace = "/test";
 
     // initiate SocketIO connection
-    socket = io.connect(namespace);
+    socket = io.connect(namespace, socketio_options);
+    listenBusFrames(socket);
 	
     // say hello on connect
     socket.on("connect", function () {
@@ -43,6 +44,14 @@ $(document).ready(function () {
 
     //Ask server for starting rtkrcv or we won't have any data
     socket.emit("start base");
+
+    //Tell the server we are still here, or rtkrcv will stop after its standby delay.
+    //A timer, not the data frames: unchanged data (ie no satellite) isn't sent again.
+    setInterval(function() {
+        if (socket.connected) {
+            socket.emit("on graph");
+        }
+    }, 10000);
     socket.on("base starting", function(msg){
         response = JSON.parse(msg);
         console.log("base starting return ", response);
@@ -155,9 +164,6 @@ $(document).ready(function () {
     // ####################### HANDLE SATELLITE LEVEL BROADCAST #######################
 
     socket.on("satellite broadcast rover", function(msg) {
-            //Tell the server we are still here
-            socket.emit("on graph");
-            
             console.groupCollapsed('Rover satellite msg received:');
                 for (var k in msg)
                     console.log(k + ':' + msg[k]);
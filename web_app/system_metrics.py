@@ -0,0 +1,236 @@
+""" System metrics sampler for the RTKBase web GUI.
+
+    - the sysfs/procfs files are opened once and read again with pread
+      (no directory walk like psutil.sensors_temperatures())
+    - the static facts (sbc model) are read only once, the uptime comes from CLOCK_BOOTTIME
+      (not from the wall clock, which can jump when chrony or the gnss receiver sets it)
+    - the samples are aggregated by minute inside fixed size ring buffers:
+      24h of min/max/avg values for each metric, with a constant memory use
+"""
+
+import glob
+import os
+import threading
+import time
+from array import array
+
+THERMAL_ZONES = "/sys/class/thermal/thermal_zone*"
+HWMON_DEVICES = "/sys/class/hwmon/hwmon*"
+METRICS = ("cpu_temp", "load", "memory_percent", "volume_percent", "net_rx", "net_tx")
+
+def _read_text(file_path):
+    try:
+        with open(file_path) as f:
+            return f.read().strip("\x00\n ")
+    except OSError:
+        return None
+
+def find_cpu_temp_file():
+    """
+        Find the sysfs file with the cpu temperature
+        :return the file path or None
+    """
+    # same sensor as psutil.sensors_temperatures()['cpu_thermal']
+    for hwmon in sorted(glob.glob(HWMON_DEVICES)):
+        if _read_text(os.path.join(hwmon, "name")) == "cpu_thermal" and os.path.exists(os.path.join(hwmon, "temp1_input")):
+            return os.path.join(hwmon, "temp1_input")
+    zones = sorted(glob.glob(THERMAL_ZONES))
+    for zone in zones:
+        zone_type = _read_text(os.path.join(zone, "type")) or ""
+        if "cpu" in zone_type or "soc" in zone_type:
+            return os.path.join(zone, "temp")
+    return os.path.join(zones[0], "temp") if zones else None
+
+def read_sbc_model():
+    """
+        Try to detect the single board computer used
+        :return the model name or unknown if not detected
+    """
+    return _read_text("/proc/device-tree/model") or "unknown"
+
+def read_uptime():
+    """ :return the seconds since the boot, suspend included """
+    if hasattr(time, "CLOCK_BOOTTIME"):
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    with open("/proc/uptime") as f:
+        return float(f.read().split()[0])
+
+class OpenFile:
+    """ A file kept open and read again from the beginning """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        try:
+            self.fd = os.open(file_path, os.O_RDONLY) if file_path else None
+        except OSError:
+            self.fd = None
+
+    def read(self, size=4096):
+        """ :return the file content (str), or None if the file isn't available """
+        if self.fd is None:
+            return None
+        try:
+            return os.pread(self.fd, size, 0).decode()
+        except OSError:
+            return None
+
+class MetricHistory:
+    """ Ring buffer of min/max/sum/count values by time bucket """
+
+    def __init__(self, bucket_seconds=60, size=1440):
+        """
+            :param bucket_seconds: the time covered by each bucket
+            :param size: the bucket count (1440 minutes = 24h)
+        """
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self.start = array("d", [0.0]) * size
+        self.min = array("d", [0.0]) * size
+        self.max = array("d", [0.0]) * size
+        self.sum = array("d", [0.0]) * size
+        self.count = array("L", [0]) * size
+        self.index = 0
+
+    def add(self, timestamp, value):
+        bucket_start = timestamp - timestamp % self.bucket_seconds
+        i = self.index
+        if self.start[i] != bucket_start:
+            if self.count[i]:
+                i = self.index = (i + 1) % self.size
+            self.start[i] = bucket_start
+            self.min[i] = self.max[i] = value
+            self.sum[i] = 0.0
+            self.count[i] = 0
+        self.min[i] = min(self.min[i], value)
+        self.max[i] = max(self.max[i], value)
+        self.sum[i] += value
+        self.count[i] += 1
+
+    def get(self, since=0):
+        """
+            :param since: skip the buckets older than this timestamp
+            :return a dict of lists in chronological order: time, min, max, avg
+        """
+        result = {"time" : [], "min" : [], "max" : [], "avg" : []}
+        for offset in range(1, self.size + 1):
+            i = (self.index + offset) % self.size
+            if self.count[i] == 0 or self.start[i] < since:
+                continue
+            result["time"].append(int(self.start[i]))
+            result["min"].append(round(self.min[i], 2))
+            result["max"].append(round(self.max[i], 2))
+            result["avg"].append(round(self.sum[i] / self.count[i], 2))
+        return result
+
+class MetricsSampler:
+    """ Reads the system metrics and keeps their history """
+
+    def __init__(self, volume="/", cpu_temp_offset=0, bucket_seconds=60, size=1440):
+        """
+            :param volume: the path used for the storage usage
+            :param cpu_temp_offset: added to the cpu temperature
+            :param bucket_seconds: the history resolution
+            :param size: the history length (in buckets)
+        """
+        self.volume = volume
+        self.cpu_temp_offset = cpu_temp_offset
+        self.sbc_model = read_sbc_model()
+        self._cpu_temp_file = OpenFile(find_cpu_temp_file())
+        self._meminfo_file = OpenFile("/proc/meminfo")
+        self._netdev_file = OpenFile("/proc/net/dev")
+        self._last_net = None
+        self._lock = threading.Lock()
+        self.history = {metric : MetricHistory(bucket_seconds, size) for metric in METRICS}
+        self.last_sample = {}
+
+    def cpu_temp(self):
+        """ :return the cpu temperature in C° with the offset (0 + offset if not available) """
+        content = self._cpu_temp_file.read(32)
+        try:
+            cpu_temp = round(int(content) / 1000, 1)
+        except (TypeError, ValueError):
+            cpu_temp = 0
+        return cpu_temp + self.cpu_temp_offset
+
+    def uptime(self):
+        return round(read_uptime())
+
+    def boot_time(self):
+        """ :return the boot time (epoch), from the current wall clock """
+        return round(time.time() - read_uptime())
+
+    def volume_usage(self):
+        """ :return a tuple (total, used, free) in bytes """
+        try:
+            stat = os.statvfs(self.volume)
+        except FileNotFoundError:
+            stat = os.statvfs("/")
+        total = stat.f_blocks * stat.f_frsize
+        free = stat.f_bavail * stat.f_frsize
+        return total, total - stat.f_bfree * stat.f_frsize, free
+
+    def memory_percent(self):
+        content = self._meminfo_file.read()
+        if content is None:
+            return 0
+        meminfo = {}
+        for line in content.splitlines():
+            key, _, value = line.partition(":")
+            if key in ("MemTotal", "MemAvailable"):
+                meminfo[key] = int(value.split()[0])
+        try:
+            return round(100 * (1 - meminfo["MemAvailable"] / meminfo["MemTotal"]), 1)
+        except (KeyError, ZeroDivisionError):
+            return 0
+
+    def net_counters(self):
+        """ :return a tuple (received bytes, sent bytes) for all interfaces except lo """
+        content = self._netdev_file.read(16384)
+        rx = tx = 0
+        if content is None:
+            return rx, tx
+        for line in content.splitlines()[2:]:
+            name, _, counters = line.partition(":")
+            if name.strip() == "lo":
+                continue
+            counters = counters.split()
+            rx += int(counters[0])
+            tx += int(counters[8])
+        return rx, tx
+
+    def sample(self):
+        """
+            Read all the metrics and add them to the history
+            :return a dict with the current values
+        """
+        now = time.time()
+        total, used, free = self.volume_usage()
+        rx, tx = self.net_counters()
+        sample = {"cpu_temp" : self.cpu_temp(),
+                  "load" : os.getloadavg()[0],
+                  "memory_percent" : self.memory_percent(),
+                  "volume_percent" : round(100 * used / (used + free), 1) if used + free else 0,
+                  "volume_total" : total,
+                  "volume_used" : used,
+                  "volume_free" : free}
+        with self._lock:
+            if self._last_net is not None and now > self._last_net[0]:
+                # bytes/s since the last sample (a counter reset gives a negative value, skipped)
+                elapsed = now - self._last_net[0]
+                sample["net_rx"] = max(0, (rx - self._last_net[1]) / elapsed)
+                sample["net_tx"] = max(0, (tx - self._last_net[2]) / elapsed)
+            self._last_net = (now, rx, tx)
+            for metric in METRICS:
+                if metric in sample:
+                    self.history[metric].add(now, sample[metric])
+            self.last_sample = sample
+        return sample
+
+    def get_history(self, metrics=None, since=0):
+        """
+            :param metrics: a list of metric names (None for all)
+            :param since: skip the values older than this timestamp
+            :return a dict {metric : {"time", "min", "max", "avg"}}
+        """
+        with self._lock:
+            return {metric : self.history[metric].get(since) for metric in (metrics or METRICS) if metric in self.history}
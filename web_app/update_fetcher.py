@@ -0,0 +1,165 @@
+""" Download and extract the RTKBase update archive.
+
+    - the archive is streamed to disk by chunks, the memory use stays flat
+    - a broken download is resumed with a Range request (from the .part file)
+    - the checksum is computed while downloading and checked at the end
+    - the extraction runs in a tar subprocess, so the web server stays responsive
+"""
+
+import hashlib
+import os
+import subprocess
+import tarfile
+import time
+
+import startup
+
+requests = startup.lazy_import("requests")
+
+CHUNK_SIZE = 64 * 1024
+
+class ChecksumError(ValueError):
+    pass
+
+def _hash_file(file_path, hash_obj):
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hash_obj.update(chunk)
+
+def parse_digest(digest):
+    """
+        :param digest: a digest string like "sha256:5f2b..." (github asset digest format)
+            or a sha256 hex string
+        :return a tuple (algorithm, hex digest), or (None, None)
+    """
+    if not digest:
+        return None, None
+    algorithm, _, value = digest.rpartition(":")
+    return (algorithm or "sha256").lower(), value.lower()
+
+def download(url, destination, digest=None, size=None, progress=None, retries=5, timeout=30):
+    """
+        Download a file with resume support and checksum verification
+        :param url: the file url (or a local path for an offline mirror)
+        :param destination: the file path
+        :param digest: the expected digest ("sha256:<hex>"), or None to skip the verification
+        :param size: the expected size in bytes (from the release metadata), or None
+        :param progress: a function called with (downloaded bytes, total bytes or None)
+        :param retries: how many times a broken download is resumed
+        :param timeout: connection/read timeout in seconds
+        :return the destination path
+    """
+    algorithm, expected = parse_digest(digest)
+    part_path = destination + ".part"
+    if url.startswith("/") or url.startswith("file://"):
+        # local mirror
+        hash_obj = hashlib.new(algorithm or "sha256")
+        with open(url[7:] if url.startswith("file://") else url, "rb") as source, open(part_path, "wb") as f:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                f.write(chunk)
+                hash_obj.update(chunk)
+        return _check_and_rename(part_path, destination, algorithm, expected, hash_obj, progress, size)
+    hash_obj = None
+    _check_part_origin(part_path, url)
+    for attempt in range(retries + 1):
+        downloaded = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range" : "bytes={}-".format(downloaded)} if downloaded else {}
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 416:
+                    if expected is not None or (size is not None and downloaded == size):
+                        # the .part file is already complete (or invalid), it is checked below
+                        hash_obj = None
+                        break
+                    # a stale or oversized .part file can't be checked: download again from the start
+                    _remove(part_path)
+                    raise requests.HTTPError("Range not satisfiable with a {} bytes .part file".format(downloaded))
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # the server doesn't support the Range requests: start from the beginning
+                    downloaded = 0
+                hash_obj = hashlib.new(algorithm or "sha256")
+                if downloaded:
+                    _hash_file(part_path, hash_obj)
+                total = response.headers.get("Content-Length")
+                total = int(total) + downloaded if total is not None else None
+                last_progress = 0
+                with open(part_path, "ab" if downloaded else "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        hash_obj.update(chunk)
+                        downloaded += len(chunk)
+                        if progress is not None and time.monotonic() - last_progress > 0.5:
+                            last_progress = time.monotonic()
+                            progress(downloaded, total)
+                if total is not None and downloaded < total:
+                    raise requests.ConnectionError("Incomplete download: {}/{} bytes".format(downloaded, total))
+            break
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            print("Update download interrupted ({}), resuming in {}s".format(e, 2 ** attempt))
+            time.sleep(2 ** attempt)
+
+    return _check_and_rename(part_path, destination, algorithm, expected, hash_obj, progress, size)
+
+def _check_and_rename(part_path, destination, algorithm, expected, hash_obj, progress, size=None):
+    """
+        Check the size and the digest computed during the download, then rename the .part file
+        :param hash_obj: the hash of the .part file, or None to compute it from the file
+        :param size: the expected size, or None to skip the verification
+    """
+    part_size = os.path.getsize(part_path)
+    if size is not None and part_size != size:
+        os.remove(part_path)
+        raise ChecksumError("Size mismatch for {}: {} bytes instead of {}".format(destination, part_size, size))
+    if expected is not None:
+        if hash_obj is None:
+            hash_obj = hashlib.new(algorithm)
+            _hash_file(part_path, hash_obj)
+        if hash_obj.hexdigest() != expected:
+            os.remove(part_path)
+            raise ChecksumError("Checksum mismatch for {}".format(destination))
+    if progress is not None:
+        progress(part_size, part_size)
+    os.replace(part_path, destination)
+    _remove(part_path + ".url")
+    return destination
+
+def _remove(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def _check_part_origin(part_path, url):
+    """ A .part file from another url (an older release) can't be resumed """
+    try:
+        with open(part_path + ".url") as f:
+            same_origin = f.read() == url
+    except FileNotFoundError:
+        same_origin = False
+    if not same_origin:
+        _remove(part_path)
+        with open(part_path + ".url", "w") as f:
+            f.write(url)
+
+def get_primary_folder(archive):
+    """ Get the "root" folder in the archive """
+    with tarfile.open(archive) as tar:
+        for tarinfo in tar:
+            if tarinfo.isdir():
+                return tarinfo.name.strip("/").split("/")[0]
+    return None
+
+def extract(archive, destination):
+    """
+        Extract the archive with tar (in its own process, so the server isn't blocked)
+        :return the path of the extracted primary folder
+    """
+    primary_folder = get_primary_folder(archive)
+    if primary_folder is None:
+        raise ValueError("No folder inside {}".format(archive))
+    subprocess.run(["tar", "--no-same-owner", "-xzf", archive, "-C", destination], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return os.path.join(destination, primary_folder)